@@ -33,6 +33,25 @@ class StackSettings(BaseSettings):
     SNS_TOPIC: str | None = None
     MAX_CONCURRENCY: int = 50
     SQS_BATCH_SIZE: int = 10
+    # Threads each forward consumer uses to parse its batch. 1 parses and appends
+    # each file in turn; >1 parses concurrently and only serializes the writes.
+    FORWARD_PARSE_CONCURRENCY: int = 1
+    # Commits each forward consumer tries (rebasing or re-applying its batch onto
+    # the new `main` tip in between) before failing the batch back to SQS.
+    FORWARD_COMMIT_MAX_ATTEMPTS: int = 5
+    # Append each forward batch with one concatenated to_icechunk write instead of
+    # one per file (falls back to per-file appends for non-concatenable batches).
+    FORWARD_BATCH_APPEND: bool = False
+    # Keep a ledger of ingested source objects (key + ETag) next to the store so a
+    # redelivered or duplicate notification is skipped instead of appended twice.
+    FORWARD_INGESTION_LEDGER_ENABLED: bool = False
+    # "direct": each forward consumer appends and commits its own batch.
+    # "deferred": consumers only parse and stage their batches in the Icechunk
+    # bucket; a single scheduled commit_forward Lambda appends everything pending
+    # in one commit, so consumers never race for the `main` tip.
+    FORWARD_COMMIT_MODE: Literal["direct", "deferred"] = "direct"
+    # Minutes between deferred commits.
+    FORWARD_DEFERRED_COMMIT_MINUTES: int = 1
 
     # ARN of the Secrets Manager secret holding Earthdata {username, password}.
     # Optional: required only for reading protected GES DISC granules. When unset,
@@ -58,6 +77,67 @@ class StackSettings(BaseSettings):
     BACKFILL_PARTITION_SIZE: int = 500
     BACKFILL_MAX_ITEMS_PER_BATCH: int = 10
     BACKFILL_MAX_CONCURRENCY: int = 50
+    # Region-write each worker batch with one concatenated to_icechunk write.
+    BACKFILL_BATCH_WRITES: bool = False
+    # Drive the outer (per-partition) Map from the partitions.json object written
+    # by the partition step, instead of the inline partition list, for inventories
+    # with more partitions than fit in the 256 KB Step Functions state payload.
+    BACKFILL_DISTRIBUTED_PARTITION_MAP: bool = False
+    # "inventory": partitions follow the inventory's own order.
+    # "coordinate": sort keys by the processor's backfill_coordinate first, so each
+    # partition and worker batch covers a contiguous block of the append dimension.
+    BACKFILL_PARTITION_ORDER: Literal["inventory", "coordinate"] = "inventory"
+    # Tree reduce: when > 0, a Distributed Map of combiners merges each partition's
+    # child forks in groups of this many (without committing) before the final
+    # reduce commits the combined forks. 0 keeps the single reducer.
+    BACKFILL_REDUCE_FAN_IN: int = 0
+    # Partitions in flight at once. Above 1, workers of later partitions run while
+    # earlier partitions fork and reduce; each reduce rebases onto the moving tip.
+    BACKFILL_PARTITION_CONCURRENCY: int = 1
+    # Fraction of a partition's files that may fail (after per-file retries) and be
+    # quarantined while the partition still commits. 0 fails the partition on the
+    # first file that cannot be processed.
+    BACKFILL_FAILURE_BUDGET: float = 0.0
+    # Threads per worker Lambda, each writing its slice of the batch into its own
+    # child fork. Pair with more worker memory: Lambda gives one vCPU per 1,769 MB.
+    BACKFILL_WORKER_LANES: int = 1
+    BACKFILL_WORKER_MEMORY_MB: int = 2048
+    # Pass the shared partition fork to workers in their batch input when its
+    # encoded size is at most this many bytes (0 = always fetch it from S3).
+    BACKFILL_INLINE_FORK_MAX_BYTES: int = 0
+    # Cut each partition into worker batches of about this many estimated seconds
+    # instead of BACKFILL_MAX_ITEMS_PER_BATCH files (which becomes the cap). Costs
+    # come from inventory file sizes and timed parses of a few sample files.
+    BACKFILL_TARGET_BATCH_SECONDS: int = 0
+    BACKFILL_COST_SAMPLE_FILES: int = 5
+    # Seconds of Lambda time a worker keeps back to save its fork: with less left
+    # it stops taking files and the state machine re-dispatches the rest. 0 runs
+    # each batch to completion (or to the Lambda timeout).
+    BACKFILL_WORKER_TIME_RESERVE_SECONDS: int = 0
+    # Resolve each file's position along the append dimension once, in the
+    # partition step, so workers write explicit regions instead of looking up
+    # coordinates per file (region="auto").
+    BACKFILL_EXPLICIT_REGIONS: bool = False
+    # "lambda": each worker batch is a Lambda invocation in an inner Distributed Map.
+    # "batch": each partition's batches run as one AWS Batch array job on the
+    # shared Batch compute environment (needs VPC_ID), free of Lambda's memory and
+    # 15 minute limits. BACKFILL_WORKER_MEMORY_MB applies to either.
+    BACKFILL_WORKER_BACKEND: Literal["lambda", "batch"] = "lambda"
+    BACKFILL_WORKER_VCPU: int = 2
+    BACKFILL_BATCH_WORKER_TIMEOUT_MINUTES: int = 60
+    # Every backfill step writes a stats record under the run prefix, and a final
+    # step compacts them into report.parquet (summarize with
+    # `python -m backfill_handlers.report`).
+    BACKFILL_RUN_REPORT: bool = False
+
+    # Cache each parsed file (keyed by source key + ETag) in the Icechunk bucket and
+    # in the Lambda's /tmp, so re-run partitions and redelivered batches skip
+    # re-parsing unchanged files. Applies to forward consumers and backfill workers.
+    MANIFEST_CACHE_ENABLED: bool = False
+
+    # Emit per-stage timings (parse, append, commit, fork load/save, merge) and
+    # record counts from every handler as CloudWatch Embedded Metric Format logs.
+    METRICS_ENABLED: bool = False
 
     # Forward SQS consumer. `None` resolves in the validator below:
     #   backfill enabled  -> default disabled (bootstrap via backfill, enable later)
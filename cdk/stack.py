@@ -46,7 +46,12 @@ from aws_cdk import (
 from aws_cdk import custom_resources as cr
 from constructs import Construct
 from settings import StackSettings  # type: ignore[import-not-found]
-from stack_constructs import BackfillPipeline, BatchInfra, BatchJob
+from stack_constructs import (
+    MANIFEST_CACHE_ENV,
+    BackfillPipeline,
+    BatchInfra,
+    BatchJob,
+)
 
 
 class VirtualizarrSqsStack(Stack):
@@ -110,6 +115,12 @@ class VirtualizarrSqsStack(Stack):
             self.processor_env["ICECHUNK_PREFIX"] = settings.ICECHUNK_PREFIX
         if settings.EARTHDATA_SECRET_ARN:
             self.processor_env["EARTHDATA_SECRET_ARN"] = settings.EARTHDATA_SECRET_ARN
+        # Read by the forward consumers (skip + record) and by garbage collection
+        # (compaction), which both get processor_env.
+        if settings.FORWARD_INGESTION_LEDGER_ENABLED:
+            self.processor_env["INGESTION_LEDGER"] = "true"
+        if settings.METRICS_ENABLED:
+            self.processor_env["METRICS_ENABLED"] = "true"
 
         self.earthdata_secret = (
             secretsmanager.Secret.from_secret_complete_arn(
@@ -144,7 +155,14 @@ class VirtualizarrSqsStack(Stack):
             architecture=_lambda.Architecture.X86_64,
             timeout=Duration.minutes(5),
             memory_size=2048,
-            environment=dict(self.processor_env),
+            environment={
+                **self.processor_env,
+                "PARSE_CONCURRENCY": str(settings.FORWARD_PARSE_CONCURRENCY),
+                "COMMIT_MAX_ATTEMPTS": str(settings.FORWARD_COMMIT_MAX_ATTEMPTS),
+                "BATCH_APPEND": str(settings.FORWARD_BATCH_APPEND).lower(),
+                "COMMIT_MODE": settings.FORWARD_COMMIT_MODE,
+                **(MANIFEST_CACHE_ENV if settings.MANIFEST_CACHE_ENABLED else {}),
+            },
         )
 
         self.queue.grant_consume_messages(self.process_messages_lambda)
@@ -177,6 +195,41 @@ class VirtualizarrSqsStack(Stack):
             )
         )
 
+        if settings.FORWARD_COMMIT_MODE == "deferred":
+            # The single writer on `main`: reserved concurrency 1 keeps a slow run
+            # from overlapping the next scheduled one.
+            self.commit_forward_lambda = _lambda.DockerImageFunction(
+                self,
+                f"{settings.STACK_NAME}-commit_forward_lambda",
+                code=_lambda.DockerImageCode.from_image_asset(
+                    directory="lambda",
+                    file="commit_forward/Dockerfile",
+                    platform=ecr_assets.Platform.LINUX_AMD64,
+                ),
+                architecture=_lambda.Architecture.X86_64,
+                timeout=Duration.minutes(10),
+                memory_size=2048,
+                reserved_concurrent_executions=1,
+                environment={
+                    **self.processor_env,
+                    "COMMIT_MAX_ATTEMPTS": str(settings.FORWARD_COMMIT_MAX_ATTEMPTS),
+                },
+            )
+            self.icechunk_bucket.grant_read_write(self.commit_forward_lambda)
+            if self.earthdata_secret is not None:
+                self.earthdata_secret.grant_read(self.commit_forward_lambda)
+
+            self.commit_forward_rule = events.Rule(
+                self,
+                "DeferredCommitSchedule",
+                schedule=events.Schedule.rate(
+                    Duration.minutes(settings.FORWARD_DEFERRED_COMMIT_MINUTES)
+                ),
+            )
+            self.commit_forward_rule.add_target(
+                targets.LambdaFunction(self.commit_forward_lambda)
+            )
+
         # When backfill is enabled, initialize_backfill_store (the Step Functions
         # Init step) is the sole store bootstrap. Skipping the deploy-time seed
         # avoids a create_array("foo", ...) collision on `main`.
@@ -241,17 +294,11 @@ class VirtualizarrSqsStack(Stack):
 
                 self.bucket_custom_resource.node.add_dependency(self.icechunk_bucket)
 
-        if settings.GARBAGE_COLLECTION_FREQUENCY:
+        batch_workers = (
+            settings.BACKFILL_ENABLED and settings.BACKFILL_WORKER_BACKEND == "batch"
+        )
+        if settings.GARBAGE_COLLECTION_FREQUENCY or batch_workers:
             self.vpc = ec2.Vpc.from_lookup(self, "VPC", vpc_id=settings.VPC_ID)
-
-            self.gc_image_asset = ecr_assets.DockerImageAsset(
-                self,
-                "GCImage",
-                directory="lambda",
-                file="garbage_collect/Dockerfile",
-                platform=ecr_assets.Platform.LINUX_AMD64,
-            )
-
             self.batch_infra = BatchInfra(
                 self,
                 "Batch-Infra",
@@ -262,6 +309,15 @@ class VirtualizarrSqsStack(Stack):
                 stack_name=settings.STACK_NAME,
             )
 
+        if settings.GARBAGE_COLLECTION_FREQUENCY:
+            self.gc_image_asset = ecr_assets.DockerImageAsset(
+                self,
+                "GCImage",
+                directory="lambda",
+                file="garbage_collect/Dockerfile",
+                platform=ecr_assets.Platform.LINUX_AMD64,
+            )
+
             self.gc_job = BatchJob(
                 self,
                 "GC-Job",
@@ -303,6 +359,30 @@ class VirtualizarrSqsStack(Stack):
                 partition_size=settings.BACKFILL_PARTITION_SIZE,
                 max_items_per_batch=settings.BACKFILL_MAX_ITEMS_PER_BATCH,
                 max_concurrency=settings.BACKFILL_MAX_CONCURRENCY,
+                batch_writes=settings.BACKFILL_BATCH_WRITES,
+                manifest_cache=settings.MANIFEST_CACHE_ENABLED,
+                metrics=settings.METRICS_ENABLED,
+                distributed_outer_map=settings.BACKFILL_DISTRIBUTED_PARTITION_MAP,
+                partition_order=settings.BACKFILL_PARTITION_ORDER,
+                reduce_fan_in=settings.BACKFILL_REDUCE_FAN_IN,
+                partition_concurrency=settings.BACKFILL_PARTITION_CONCURRENCY,
+                failure_budget=settings.BACKFILL_FAILURE_BUDGET,
+                worker_lanes=settings.BACKFILL_WORKER_LANES,
+                worker_memory_mb=settings.BACKFILL_WORKER_MEMORY_MB,
+                inline_fork_max_bytes=settings.BACKFILL_INLINE_FORK_MAX_BYTES,
+                target_batch_seconds=settings.BACKFILL_TARGET_BATCH_SECONDS,
+                cost_sample_files=settings.BACKFILL_COST_SAMPLE_FILES,
+                worker_time_reserve_seconds=(
+                    settings.BACKFILL_WORKER_TIME_RESERVE_SECONDS
+                ),
+                explicit_regions=settings.BACKFILL_EXPLICIT_REGIONS,
+                worker_backend=settings.BACKFILL_WORKER_BACKEND,
+                batch_job_queue=self.batch_infra.queue if batch_workers else None,
+                worker_vcpu=settings.BACKFILL_WORKER_VCPU,
+                batch_worker_timeout_minutes=(
+                    settings.BACKFILL_BATCH_WORKER_TIMEOUT_MINUTES
+                ),
+                run_report=settings.BACKFILL_RUN_REPORT,
                 earthdata_secret_arn=settings.EARTHDATA_SECRET_ARN,
             )
 
@@ -1,9 +1,10 @@
 from .aws_batch_infra import BatchInfra
 from .aws_batch_job import BatchJob
-from .backfill_pipeline import BackfillPipeline
+from .backfill_pipeline import MANIFEST_CACHE_ENV, BackfillPipeline
 
 __all__ = [
     "BackfillPipeline",
     "BatchInfra",
     "BatchJob",
+    "MANIFEST_CACHE_ENV",
 ]
@@ -37,6 +37,7 @@ class BatchJob(Construct):
         retry_attempts: int,
         environment: None | dict[str, str] = None,
         secrets: None | dict[str, batch.Secret] = None,
+        timeout: Duration = Duration.hours(1),
         **kwargs: Any,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -92,7 +93,7 @@ class BatchJob(Construct):
                 secrets=secrets,
                 environment=environment or {},
             ),
-            timeout=Duration.hours(1),
+            timeout=timeout,
             retry_attempts=retry_attempts,
             retry_strategies=[
                 batch.RetryStrategy.of(
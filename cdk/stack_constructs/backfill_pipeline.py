@@ -1,6 +1,7 @@
 from typing import Any
 
 from aws_cdk import Aws, Duration
+from aws_cdk import aws_batch as batch
 from aws_cdk import aws_ecr_assets as ecr_assets
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_lambda as lmb
@@ -10,18 +11,32 @@ from aws_cdk import aws_stepfunctions as sfn
 from aws_cdk import aws_stepfunctions_tasks as tasks
 from constructs import Construct
 
+from .aws_batch_job import BatchJob
+
 _ACTIONS = ["partition", "init", "fork", "worker", "reduce", "promote"]
 
 # Actions whose handler opens the icechunk repo and therefore needs Earthdata
 # credentials to authorize reading protected GES DISC virtual chunks. ``partition``
-# only reads the inventory object, so it is excluded.
-_REPO_ACTIONS = ["init", "fork", "worker", "reduce", "promote"]
+# opens it only when resuming, to find the partitions already committed.
+_REPO_ACTIONS = ["partition", "init", "fork", "worker", "reduce", "promote"]
+
+
+# Parsed-dataset cache for the Lambdas that parse source files: the shared tier
+# in the Icechunk bucket, fronted by a local tier in the Lambda's /tmp.
+MANIFEST_CACHE_ENV = {
+    "MANIFEST_CACHE": "true",
+    "MANIFEST_CACHE_LOCAL_DIR": "/tmp/manifest-cache",
+}
 
 
 class BackfillPipeline(Construct):
     """Backfill Step Functions pipeline: six Lambda handlers built from one image,
     wired into an outer serial Map over partitions with an inner Distributed Map of
-    workers."""
+    workers. With ``reduce_fan_in`` set, a seventh (combine) handler adds an
+    intermediate reduce level. With ``worker_backend="batch"`` the workers run as
+    an AWS Batch array job per partition on ``batch_job_queue`` instead. With
+    ``run_report``, every step writes a stats record and a final report handler
+    compacts them into ``report.parquet`` under the run prefix."""
 
     def __init__(
         self,
@@ -35,9 +50,33 @@ class BackfillPipeline(Construct):
         partition_size: int,
         max_items_per_batch: int,
         max_concurrency: int,
+        batch_writes: bool = False,
+        manifest_cache: bool = False,
+        metrics: bool = False,
+        distributed_outer_map: bool = False,
+        partition_order: str = "inventory",
+        reduce_fan_in: int = 0,
+        partition_concurrency: int = 1,
+        failure_budget: float = 0.0,
+        worker_lanes: int = 1,
+        worker_memory_mb: int = 2048,
+        inline_fork_max_bytes: int = 0,
+        target_batch_seconds: int = 0,
+        cost_sample_files: int = 5,
+        worker_time_reserve_seconds: int = 0,
+        explicit_regions: bool = False,
+        worker_backend: str = "lambda",
+        batch_job_queue: batch.IJobQueue | None = None,
+        worker_vcpu: int = 2,
+        batch_worker_timeout_minutes: int = 60,
+        run_report: bool = False,
         **kwargs: Any,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
+        if worker_backend not in ("lambda", "batch"):
+            raise ValueError(f"unknown worker backend: {worker_backend}")
+        if worker_backend == "batch" and batch_job_queue is None:
+            raise ValueError("the batch worker backend needs a batch_job_queue")
 
         # Icechunk >=2.1.0 refuses to create a repo at an empty prefix, so the
         # init handler needs ICECHUNK_PREFIX to reach the Lambda. Only include env
@@ -50,6 +89,8 @@ class BackfillPipeline(Construct):
             env["ICECHUNK_PREFIX"] = icechunk_prefix
         if earthdata_secret_arn:
             env["EARTHDATA_SECRET_ARN"] = earthdata_secret_arn
+        if metrics:
+            env["METRICS_ENABLED"] = "true"
 
         earthdata_secret = (
             secretsmanager.Secret.from_secret_complete_arn(
@@ -60,7 +101,12 @@ class BackfillPipeline(Construct):
         )
 
         self.functions: dict[str, lmb.DockerImageFunction] = {}
-        for action in _ACTIONS:
+        actions = _ACTIONS + (["combine"] if reduce_fan_in else [])
+        if run_report:
+            actions.append("report")
+        if worker_backend == "batch":
+            actions.remove("worker")
+        for action in actions:
             fn = lmb.DockerImageFunction(
                 self,
                 f"{action}-fn",
@@ -72,7 +118,9 @@ class BackfillPipeline(Construct):
                 ),
                 architecture=lmb.Architecture.X86_64,
                 timeout=Duration.minutes(15),
-                memory_size=2048,
+                # Lambda allocates vCPUs in proportion to memory (one per
+                # 1,769 MB), so multi-lane workers need more than the default.
+                memory_size=worker_memory_mb if action == "worker" else 2048,
                 environment=dict(env),
             )
             icechunk_bucket.grant_read_write(fn)
@@ -90,11 +138,67 @@ class BackfillPipeline(Construct):
                 f"arn:aws:s3:::{data_bucket_name}",
             ],
         )
-        self.functions["worker"].add_to_role_policy(data_policy)
+        worker_env: dict[str, str] = {}
+        if batch_writes:
+            worker_env["BATCH_WRITES"] = "true"
+        if inline_fork_max_bytes:
+            self.functions["fork"].add_environment(
+                "FORK_INLINE_MAX_BYTES", str(inline_fork_max_bytes)
+            )
+        if worker_lanes > 1:
+            worker_env["WORKER_LANES"] = str(worker_lanes)
+        if worker_time_reserve_seconds and worker_backend == "lambda":
+            worker_env["WORKER_TIME_RESERVE_SECONDS"] = str(worker_time_reserve_seconds)
+        if manifest_cache:
+            worker_env.update(MANIFEST_CACHE_ENV)
         self.functions["partition"].add_to_role_policy(data_policy)
 
+        self.worker_job: BatchJob | None = None
+        if worker_backend == "batch":
+            # The Lambda image's dependencies, with a plain Python entry point.
+            self.worker_job = BatchJob(
+                self,
+                "WorkerJob",
+                vcpu=worker_vcpu,
+                image_asset=ecr_assets.DockerImageAsset(
+                    self,
+                    "WorkerImage",
+                    directory="lambda",
+                    file="backfill/Dockerfile",
+                    target="batch",
+                    platform=ecr_assets.Platform.LINUX_AMD64,
+                ),
+                memory_mb=worker_memory_mb,
+                retry_attempts=2,
+                environment={**env, **worker_env},
+                timeout=Duration.minutes(batch_worker_timeout_minutes),
+            )
+            icechunk_bucket.grant_read_write(self.worker_job.role)
+            self.worker_job.role.add_to_policy(data_policy)
+            if earthdata_secret is not None:
+                earthdata_secret.grant_read(self.worker_job.role)
+        else:
+            self.functions["worker"].add_to_role_policy(data_policy)
+            for key, value in worker_env.items():
+                self.functions["worker"].add_environment(key, value)
+
         self.state_machine = self._build_state_machine(
-            icechunk_bucket, partition_size, max_items_per_batch, max_concurrency
+            icechunk_bucket,
+            partition_size,
+            max_items_per_batch,
+            max_concurrency,
+            distributed_outer_map,
+            partition_order,
+            reduce_fan_in,
+            partition_concurrency,
+            failure_budget,
+            inline_fork_max_bytes,
+            target_batch_seconds,
+            cost_sample_files,
+            worker_time_reserve_seconds,
+            explicit_regions,
+            batch_job_queue,
+            run_report,
         )
 
     def _build_state_machine(
@@ -103,22 +207,59 @@ class BackfillPipeline(Construct):
         partition_size: int,
         max_items_per_batch: int,
         max_concurrency: int,
+        distributed_outer_map: bool,
+        partition_order: str,
+        reduce_fan_in: int,
+        partition_concurrency: int,
+        failure_budget: float,
+        inline_fork_max_bytes: int,
+        target_batch_seconds: int,
+        cost_sample_files: int,
+        worker_time_reserve_seconds: int,
+        explicit_regions: bool,
+        batch_job_queue: batch.IJobQueue | None,
+        run_report: bool,
     ) -> sfn.StateMachine:
+        partition_payload: dict[str, Any] = {
+            "inventory_uri": sfn.JsonPath.string_at("$.inventory_uri"),
+            "run_prefix": sfn.JsonPath.format(
+                "s3://{}/backfill/{}/",
+                icechunk_bucket.bucket_name,
+                sfn.JsonPath.string_at("$$.Execution.Name"),
+            ),
+            "partition_size": partition_size,
+            # The Distributed outer Map reads partitions.json instead.
+            "inline_partitions": not distributed_outer_map,
+            "order": partition_order,
+            # Resolve each file's region at plan time instead of per write.
+            "explicit_regions": explicit_regions,
+            # {"resume": true} in the execution input resumes a failed run.
+            "run_options": sfn.JsonPath.object_at("$$.Execution.Input"),
+        }
+        if target_batch_seconds > 0:
+            # The partitioner writes cost-balanced batches per partition, which
+            # the inner Map reads in place of fixed-size ItemBatcher batches.
+            partition_payload["batching"] = {
+                "target_seconds": target_batch_seconds,
+                "max_items": max_items_per_batch,
+                "sample": cost_sample_files,
+            }
+        if self.worker_job is not None:
+            # Sizes each partition's worker array job.
+            partition_payload["array_batch_size"] = max_items_per_batch
+        # The partition step puts the run's stats prefix on every partition item
+        # and in its result, for the later steps' records.
+        stats_payload: dict[str, Any] = {}
+        if run_report:
+            partition_payload["stats"] = True
+            stats_payload = {
+                "stats_prefix": sfn.JsonPath.string_at("$.partitionResult.stats_prefix")
+            }
         partition = tasks.LambdaInvoke(
             self,
             "PartitionTask",
             lambda_function=self.functions["partition"],
-            payload=sfn.TaskInput.from_object(
-                {
-                    "inventory_uri": sfn.JsonPath.string_at("$.inventory_uri"),
-                    "run_prefix": sfn.JsonPath.format(
-                        "s3://{}/backfill/{}/",
-                        icechunk_bucket.bucket_name,
-                        sfn.JsonPath.string_at("$$.Execution.Name"),
-                    ),
-                    "partition_size": partition_size,
-                }
-            ),
+            payload=sfn.TaskInput.from_object(partition_payload),
             payload_response_only=True,
             result_path="$.partitionResult",
         )
@@ -127,7 +268,13 @@ class BackfillPipeline(Construct):
             self,
             "InitTask",
             lambda_function=self.functions["init"],
-            payload=sfn.TaskInput.from_object({}),
+            payload=sfn.TaskInput.from_object(
+                {
+                    "run_options": sfn.JsonPath.object_at("$$.Execution.Input"),
+                    "plan_id": sfn.JsonPath.string_at("$.partitionResult.plan_id"),
+                    **stats_payload,
+                }
+            ),
             payload_response_only=True,
             result_path="$.initResult",
         )
@@ -140,88 +287,336 @@ class BackfillPipeline(Construct):
             result_path="$.forkResult",
         )
 
-        worker = tasks.LambdaInvoke(
-            self,
-            "WorkerTask",
-            lambda_function=self.functions["worker"],
-            payload=sfn.TaskInput.from_object(
-                {
-                    "file_keys": sfn.JsonPath.string_at("$.Items"),
-                    "fork_in_uri": sfn.JsonPath.string_at("$.BatchInput.fork_in_uri"),
-                    "forks_out_prefix": sfn.JsonPath.string_at(
-                        "$.BatchInput.forks_out_prefix"
-                    ),
-                }
+        # ItemBatcher batches arrive as {"Items": [...], "BatchInput": {...}};
+        # precomputed batches are single items shaped by the ItemSelector below.
+        batched = target_batch_seconds > 0
+        constants = "$" if batched else "$.BatchInput"
+        worker_payload = {
+            "file_keys": sfn.JsonPath.string_at(
+                "$.file_keys" if batched else "$.Items"
             ),
-            payload_response_only=True,
-        )
+            "fork_in_uri": sfn.JsonPath.string_at(f"{constants}.fork_in_uri"),
+            "forks_out_prefix": sfn.JsonPath.string_at(f"{constants}.forks_out_prefix"),
+        }
+        batch_input = {
+            "fork_in_uri.$": "$.forkResult.fork_in_uri",
+            "forks_out_prefix.$": "$.forkResult.forks_out_prefix",
+        }
+        if inline_fork_max_bytes:
+            # Empty unless the fork handler inlined the shared fork.
+            worker_payload["fork_inline"] = sfn.JsonPath.string_at(
+                f"{constants}.fork_inline"
+            )
+            batch_input["fork_inline.$"] = "$.forkResult.fork_inline"
+        reduce_payload: dict[str, Any] = {}
+        if run_report:
+            for key in ["stats_prefix", "partition_id"]:
+                worker_payload[key] = sfn.JsonPath.string_at(f"{constants}.{key}")
+                batch_input[f"{key}.$"] = f"$.{key}"
+            reduce_payload["stats_prefix"] = sfn.JsonPath.string_at("$.stats_prefix")
+        if failure_budget > 0:
+            # Workers quarantine files that keep failing instead of failing the
+            # batch; the reducer checks the count against the budget.
+            worker_payload["quarantine_prefix"] = sfn.JsonPath.string_at(
+                f"{constants}.quarantine_prefix"
+            )
+            batch_input["quarantine_prefix.$"] = "$.forkResult.quarantine_prefix"
+            reduce_payload |= {
+                "quarantine_prefix": sfn.JsonPath.string_at(
+                    "$.forkResult.quarantine_prefix"
+                ),
+                "manifest_uri": sfn.JsonPath.string_at("$.manifest_uri"),
+                "failure_budget": failure_budget,
+            }
 
-        inner_map = sfn.DistributedMap(
-            self,
-            "InnerMap",
-            item_reader=sfn.S3JsonItemReader(
-                bucket=icechunk_bucket,
-                # manifest_key comes from the partition item ($ here is the outer
-                # Map iteration state); the fork result does not carry it.
-                key=sfn.JsonPath.string_at("$.manifest_key"),
-            ),
-            item_batcher=sfn.ItemBatcher(
-                max_items_per_batch=max_items_per_batch,
-                # ItemBatcher.BatchInput does NOT convert JsonPath values into
-                # ".$"-suffixed keys (unlike TaskInput.from_object) — a JsonPath
-                # value here renders as a literal constant, so the worker would
-                # receive the string "$.forkResult.fork_in_uri". Write the ".$"
-                # path keys explicitly so Step Functions resolves them.
-                batch_input={
-                    "fork_in_uri.$": "$.forkResult.fork_in_uri",
-                    "forks_out_prefix.$": "$.forkResult.forks_out_prefix",
-                },
-            ),
-            max_concurrency=max_concurrency,
-            # No tolerated_failure_*: the Distributed Map default fails on any worker
-            # failure, so a partition never reduces on an incomplete fork set.
-            result_path=sfn.JsonPath.DISCARD,
-        )
-        inner_map.item_processor(worker)
+        workers: sfn.IChainable
+        if self.worker_job is not None and batch_job_queue is not None:
+            workers = self._batch_workers(
+                icechunk_bucket,
+                batch_job_queue,
+                max_items_per_batch,
+                batched,
+                failure_budget,
+                run_report,
+            )
+        else:
+            workers = self._lambda_workers(
+                icechunk_bucket,
+                worker_payload,
+                batch_input,
+                max_items_per_batch,
+                max_concurrency,
+                batched,
+                worker_time_reserve_seconds,
+            )
+
+        partition_steps = fork.next(workers)
+        # The final reduce commits the children, or with the tree reduce the
+        # combined forks the combiners left under combined_prefix.
+        reduce_input = "$.forkResult.forks_out_prefix"
+        if reduce_fan_in:
+            combine_input = {
+                "forks_out_prefix.$": "$.forkResult.forks_out_prefix",
+                "combined_prefix.$": "$.forkResult.combined_prefix",
+            }
+            combine_stats: dict[str, Any] = {}
+            if run_report:
+                for key in ["stats_prefix", "partition_id"]:
+                    combine_input[f"{key}.$"] = f"$.{key}"
+                    combine_stats[key] = sfn.JsonPath.string_at(f"$.BatchInput.{key}")
+            combine = tasks.LambdaInvoke(
+                self,
+                "CombineTask",
+                lambda_function=self.functions["combine"],
+                payload=sfn.TaskInput.from_object(
+                    {
+                        "fork_objects": sfn.JsonPath.list_at("$.Items"),
+                        "forks_out_prefix": sfn.JsonPath.string_at(
+                            "$.BatchInput.forks_out_prefix"
+                        ),
+                        "combined_prefix": sfn.JsonPath.string_at(
+                            "$.BatchInput.combined_prefix"
+                        ),
+                        **combine_stats,
+                    }
+                ),
+                payload_response_only=True,
+            )
+            combine_map = sfn.DistributedMap(
+                self,
+                "CombineMap",
+                item_reader=sfn.S3ObjectsItemReader(
+                    bucket=icechunk_bucket,
+                    prefix=sfn.JsonPath.string_at("$.forkResult.forks_out_key_prefix"),
+                ),
+                item_batcher=sfn.ItemBatcher(
+                    max_items_per_batch=reduce_fan_in,
+                    # ".$" keys written explicitly; see InnerMap.
+                    batch_input=combine_input,
+                ),
+                max_concurrency=max_concurrency,
+                result_path=sfn.JsonPath.DISCARD,
+            )
+            combine_map.item_processor(combine)
+            partition_steps = partition_steps.next(combine_map)
+            reduce_input = "$.forkResult.combined_prefix"
 
         reduce = tasks.LambdaInvoke(
             self,
             "ReduceTask",
             lambda_function=self.functions["reduce"],
-            # forks_out_prefix lives under the fork result; reshape to the flat
+            # The fork prefixes live under the fork result; reshape to the flat
             # event the reduce handler expects.
             payload=sfn.TaskInput.from_object(
                 {
                     "partition_id": sfn.JsonPath.string_at("$.partition_id"),
-                    "forks_out_prefix": sfn.JsonPath.string_at(
-                        "$.forkResult.forks_out_prefix"
-                    ),
+                    "plan_id": sfn.JsonPath.string_at("$.plan_id"),
+                    "forks_out_prefix": sfn.JsonPath.string_at(reduce_input),
+                    **reduce_payload,
                 }
             ),
             payload_response_only=True,
             result_path="$.reduceResult",
         )
 
-        outer_map = sfn.Map(
-            self,
-            "OuterMap",
-            items_path="$.partitionResult.partitions",
-            max_concurrency=1,
-            result_path=sfn.JsonPath.DISCARD,
-        )
-        outer_map.item_processor(fork.next(inner_map).next(reduce))
+        # With partition_concurrency 1 each partition forks from the previous
+        # partition's commit. Above that, partitions fork from whatever tip is
+        # current and their reduces rebase onto each other's commits; partitions
+        # cover disjoint regions, so those rebases do not conflict.
+        outer_map: sfn.Map | sfn.DistributedMap
+        if distributed_outer_map:
+            # Partitions are read from the partitions.json object the partition
+            # handler writes, so their number is not bounded by the 256 KB state
+            # payload limit.
+            outer_map = sfn.DistributedMap(
+                self,
+                "OuterMap",
+                item_reader=sfn.S3JsonItemReader(
+                    bucket=icechunk_bucket,
+                    key=sfn.JsonPath.string_at("$.partitionResult.partitions_key"),
+                ),
+                max_concurrency=partition_concurrency,
+                result_path=sfn.JsonPath.DISCARD,
+            )
+        else:
+            outer_map = sfn.Map(
+                self,
+                "OuterMap",
+                items_path="$.partitionResult.partitions",
+                max_concurrency=partition_concurrency,
+                result_path=sfn.JsonPath.DISCARD,
+            )
+        outer_map.item_processor(partition_steps.next(reduce))
 
         promote = tasks.LambdaInvoke(
             self,
             "PromoteTask",
             lambda_function=self.functions["promote"],
-            payload=sfn.TaskInput.from_object({}),
+            payload=sfn.TaskInput.from_object(stats_payload),
             payload_response_only=True,
+            # The report step still needs the partition result.
+            result_path="$.promoteResult" if run_report else "$",
         )
 
         definition = partition.next(init).next(outer_map).next(promote)
+        if run_report:
+            definition = definition.next(
+                tasks.LambdaInvoke(
+                    self,
+                    "ReportTask",
+                    lambda_function=self.functions["report"],
+                    payload=sfn.TaskInput.from_object(
+                        {
+                            **stats_payload,
+                            "report_uri": sfn.JsonPath.format(
+                                "s3://{}/backfill/{}/report.parquet",
+                                icechunk_bucket.bucket_name,
+                                sfn.JsonPath.string_at("$$.Execution.Name"),
+                            ),
+                        }
+                    ),
+                    payload_response_only=True,
+                )
+            )
         return sfn.StateMachine(
             self,
             "StateMachine",
             definition_body=sfn.DefinitionBody.from_chainable(definition),
         )
+
+    def _lambda_workers(
+        self,
+        icechunk_bucket: s3.IBucket,
+        worker_payload: dict[str, Any],
+        batch_input: dict[str, str],
+        max_items_per_batch: int,
+        max_concurrency: int,
+        batched: bool,
+        worker_time_reserve_seconds: int,
+    ) -> sfn.IChainable:
+        """The inner Distributed Map of worker Lambdas for one partition."""
+        worker_options: dict[str, Any] = {}
+        if worker_time_reserve_seconds:
+            # Keep the iteration state (the worker reads it again on a re-run)
+            # and add only the keys a worker left before its deadline.
+            worker_options = {
+                "result_selector": {"unprocessed_keys.$": "$.unprocessed_keys"},
+                "result_path": "$.workerResult",
+            }
+        worker = tasks.LambdaInvoke(
+            self,
+            "WorkerTask",
+            lambda_function=self.functions["worker"],
+            payload=sfn.TaskInput.from_object(worker_payload),
+            payload_response_only=True,
+            **worker_options,
+        )
+        batch_steps: sfn.IChainable = worker
+        if worker_time_reserve_seconds:
+            # Hand unprocessed keys back to a fresh worker invocation, in place
+            # of the batch's keys, until none are left.
+            requeue = sfn.Pass(
+                self,
+                "RequeueUnprocessed",
+                input_path="$.workerResult.unprocessed_keys",
+                result_path="$.file_keys" if batched else "$.Items",
+            )
+            requeue.next(worker)
+            batch_steps = worker.next(
+                sfn.Choice(self, "UnprocessedKeys")
+                .when(
+                    sfn.Condition.is_present("$.workerResult.unprocessed_keys[0]"),
+                    requeue,
+                )
+                .otherwise(sfn.Succeed(self, "BatchDone"))
+            )
+
+        if batched:
+            # One item per precomputed batch; the selector adds the fork
+            # locations the ItemBatcher's BatchInput would otherwise carry.
+            batching: dict[str, Any] = {
+                "item_reader": sfn.S3JsonItemReader(
+                    bucket=icechunk_bucket,
+                    key=sfn.JsonPath.string_at("$.batches_key"),
+                ),
+                "item_selector": {
+                    **batch_input,
+                    "file_keys.$": "$$.Map.Item.Value.file_keys",
+                },
+            }
+        else:
+            batching = {
+                "item_reader": sfn.S3JsonItemReader(
+                    bucket=icechunk_bucket,
+                    # manifest_key comes from the partition item ($ here is the
+                    # outer Map iteration state); the fork result does not carry it.
+                    key=sfn.JsonPath.string_at("$.manifest_key"),
+                ),
+                "item_batcher": sfn.ItemBatcher(
+                    max_items_per_batch=max_items_per_batch,
+                    # ItemBatcher.BatchInput does NOT convert JsonPath values into
+                    # ".$"-suffixed keys (unlike TaskInput.from_object) — a JsonPath
+                    # value here renders as a literal constant, so the worker would
+                    # receive the string "$.forkResult.fork_in_uri". Write the ".$"
+                    # path keys explicitly so Step Functions resolves them.
+                    batch_input=batch_input,
+                ),
+            }
+        inner_map = sfn.DistributedMap(
+            self,
+            "InnerMap",
+            **batching,
+            max_concurrency=max_concurrency,
+            # No tolerated_failure_*: the Distributed Map default fails on any worker
+            # failure, so a partition never reduces on an incomplete fork set.
+            result_path=sfn.JsonPath.DISCARD,
+        )
+        inner_map.item_processor(batch_steps)
+        return inner_map
+
+    def _batch_workers(
+        self,
+        icechunk_bucket: s3.IBucket,
+        job_queue: batch.IJobQueue,
+        max_items_per_batch: int,
+        batched: bool,
+        failure_budget: float,
+        run_report: bool,
+    ) -> sfn.IChainable:
+        """One AWS Batch array job for the partition's workers, waited on with
+        .sync; each child picks its batch by array index (see batch_worker.py)."""
+        assert self.worker_job is not None
+        environment = {
+            "FORK_IN_URI": sfn.JsonPath.string_at("$.forkResult.fork_in_uri"),
+            "FORKS_OUT_PREFIX": sfn.JsonPath.string_at("$.forkResult.forks_out_prefix"),
+        }
+        if batched:
+            environment["BATCHES_URI"] = sfn.JsonPath.format(
+                "s3://{}/{}",
+                icechunk_bucket.bucket_name,
+                sfn.JsonPath.string_at("$.batches_key"),
+            )
+        else:
+            environment["MANIFEST_URI"] = sfn.JsonPath.string_at("$.manifest_uri")
+            environment["BATCH_SIZE"] = str(max_items_per_batch)
+        if failure_budget > 0:
+            environment["QUARANTINE_PREFIX"] = sfn.JsonPath.string_at(
+                "$.forkResult.quarantine_prefix"
+            )
+        if run_report:
+            environment["STATS_PREFIX"] = sfn.JsonPath.string_at("$.stats_prefix")
+            environment["PARTITION_ID"] = sfn.JsonPath.string_at("$.partition_id")
+        return tasks.BatchSubmitJob(
+            self,
+            "WorkerJobTask",
+            job_name="backfill-worker",
+            job_queue_arn=job_queue.job_queue_arn,
+            job_definition_arn=self.worker_job.job_def.job_definition_arn,
+            # Computed by the partition handler from the batch count.
+            array_size=sfn.JsonPath.number_at("$.array_size"),
+            container_overrides=tasks.BatchContainerOverrides(environment=environment),
+            # .sync fails the task if any child fails, so a partition never
+            # reduces on an incomplete fork set.
+            integration_pattern=sfn.IntegrationPattern.RUN_JOB,
+            result_path=sfn.JsonPath.DISCARD,
+        )
@@ -0,0 +1,72 @@
+"""AWS Batch entry point: one array child writes one worker batch.
+
+With the Batch worker backend, the state machine submits one array job per
+partition in place of the inner Map of worker Lambdas. Each child finds its
+batch by AWS_BATCH_JOB_ARRAY_INDEX and runs the worker's process_batch on it,
+without Lambda's memory and 15 minute limits. The job's environment carries:
+
+- FORK_IN_URI / FORKS_OUT_PREFIX — as in the worker event.
+- MANIFEST_URI and BATCH_SIZE — the partition manifest, cut into batches of
+  BATCH_SIZE items in order; or BATCHES_URI, the partition's precomputed
+  cost-balanced batches.
+- QUARANTINE_PREFIX (optional) — as in the worker event.
+- STATS_PREFIX and PARTITION_ID (optional) — as in the worker event, for the
+  run report.
+
+Array jobs have at least two children, so a child whose index is past the last
+batch has nothing to do and exits without writing a fork.
+"""
+
+import os
+from typing import Any
+
+from aws_lambda_powertools import Logger
+
+from backfill_handlers import inventory, worker
+
+logger = Logger()
+
+
+def batch_items(
+    index: int,
+    *,
+    manifest_uri: str | None = None,
+    batch_size: int = 1,
+    batches_uri: str | None = None,
+) -> list[Any]:
+    """The file items of array child `index`."""
+    if batches_uri:
+        batches: list[Any] = inventory.read_manifest(batches_uri)
+        return list(batches[index]["file_keys"]) if index < len(batches) else []
+    if manifest_uri is None:
+        raise ValueError("MANIFEST_URI or BATCHES_URI is required")
+    items: list[Any] = inventory.read_manifest(manifest_uri)
+    return items[index * batch_size : (index + 1) * batch_size]
+
+
+def main() -> None:
+    index = int(os.environ.get("AWS_BATCH_JOB_ARRAY_INDEX", "0"))
+    items = batch_items(
+        index,
+        manifest_uri=os.environ.get("MANIFEST_URI"),
+        batch_size=int(os.environ.get("BATCH_SIZE", "1")),
+        batches_uri=os.environ.get("BATCHES_URI"),
+    )
+    if not items:
+        logger.info("No batch for this array index", extra={"index": index})
+        return
+    result = worker.process_batch(
+        {
+            "file_keys": items,
+            "fork_in_uri": os.environ["FORK_IN_URI"],
+            "forks_out_prefix": os.environ["FORKS_OUT_PREFIX"],
+            "quarantine_prefix": os.environ.get("QUARANTINE_PREFIX") or None,
+            "stats_prefix": os.environ.get("STATS_PREFIX") or None,
+            "partition_id": os.environ.get("PARTITION_ID"),
+        }
+    )
+    logger.info("Wrote batch", extra={"index": index, **result})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Cost-balanced worker batches.
+
+A fixed number of files per batch suits an archive of similar files. When file
+sizes (and so parse times) vary widely, some batches take seconds and others
+approach the Lambda timeout, and the slowest batch sets the partition's
+duration. Instead, the partitioner estimates each file's cost from its size
+with a linear model fitted to a few timed sample parses, then cuts each
+partition into contiguous batches of about a target duration.
+"""
+
+import json
+import logging
+import statistics
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from backfill_handlers.config import parse_s3_uri
+from backfill_handlers.inventory import Entry
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CostModel:
+    """Estimated seconds to process a file: ``intercept + per_byte * size``.
+
+    Files without a known size are estimated at the sample mean.
+    """
+
+    intercept: float
+    per_byte: float
+    mean_seconds: float
+    samples: int
+
+    def estimate(self, size: int | None) -> float:
+        if size is None:
+            return self.mean_seconds
+        return self.intercept + self.per_byte * size
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def fit(samples: Sequence[tuple[int | None, float]]) -> CostModel:
+    """Fit a CostModel to ``(size, seconds)`` samples.
+
+    Needs at least two distinct known sizes for a slope; otherwise (or if the
+    fitted slope is negative) every file costs the sample mean.
+    """
+    if not samples:
+        raise ValueError("no timing samples to fit")
+    mean = statistics.fmean(seconds for _, seconds in samples)
+    sized = [(size, seconds) for size, seconds in samples if size is not None]
+    if len({size for size, _ in sized}) >= 2:
+        sizes, seconds = zip(*sized, strict=True)
+        per_byte, intercept = statistics.linear_regression(sizes, seconds)
+        if per_byte >= 0:
+            return CostModel(
+                max(float(intercept), 0.0), float(per_byte), mean, len(samples)
+            )
+    return CostModel(mean, 0.0, mean, len(samples))
+
+
+def sample_timings(
+    parse: Callable[[str], Any], entries: Sequence[Entry], count: int
+) -> list[tuple[int | None, float]]:
+    """Time `parse` on `count` entries spread across the size range.
+
+    A sample that fails to parse is skipped; the worker will deal with it.
+    """
+    by_size = sorted(entries, key=lambda e: (e[1] is None, e[1] or 0))
+    last = len(by_size) - 1
+    picks = sorted({round(i * last / max(count - 1, 1)) for i in range(count)})
+    samples: list[tuple[int | None, float]] = []
+    for index in picks:
+        key, size = by_size[index]
+        start = time.perf_counter()
+        try:
+            parse(key)
+        except Exception:
+            logger.warning("Sample parse failed for %s", key, exc_info=True)
+            continue
+        samples.append((size, time.perf_counter() - start))
+    return samples
+
+
+def pack(
+    entries: Sequence[Entry],
+    model: CostModel,
+    *,
+    target_seconds: float,
+    max_items: int,
+) -> list[dict[str, Any]]:
+    """Cut `entries` into contiguous batches of about `target_seconds`.
+
+    Batches keep inventory order (so batched region writes stay contiguous)
+    and hold at most `max_items` files; a single file over the target gets a
+    batch of its own.
+    """
+    batches: list[dict[str, Any]] = []
+    keys: list[str] = []
+    sizes: list[int | None] = []
+    total = 0.0
+    for key, size in entries:
+        cost = model.estimate(size)
+        if keys and (total + cost > target_seconds or len(keys) >= max_items):
+            batches.append(_batch(keys, sizes, total))
+            keys, sizes, total = [], [], 0.0
+        keys.append(key)
+        sizes.append(size)
+        total += cost
+    if keys:
+        batches.append(_batch(keys, sizes, total))
+    return batches
+
+
+def _batch(keys: list[str], sizes: list[int | None], total: float) -> dict[str, Any]:
+    return {"file_keys": keys, "sizes": sizes, "estimated_seconds": round(total, 3)}
+
+
+def write_batches(uri: str, batches: list[dict[str, Any]], client: Any) -> None:
+    """Write a partition's batch manifest (JSON array of batch objects) to S3."""
+    bucket, key = parse_s3_uri(uri)
+    client.put_object(Bucket=bucket, Key=key, Body=json.dumps(batches).encode())
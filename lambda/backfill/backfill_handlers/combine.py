@@ -0,0 +1,60 @@
+"""Handler: merge a group of child forks into one combined fork, without committing.
+
+The intermediate level of the tree reduce. A Distributed Map lists a partition's
+child forks and hands each combiner a batch of them; the combined forks are
+written under ``combined_prefix``, where the final reduce picks them up.
+"""
+
+import hashlib
+import time
+from typing import Any
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from virtualizarr_processor import backfill, instrumentation
+
+from backfill_handlers import fork_store, stats
+from backfill_handlers.config import parse_s3_uri
+
+logger = Logger()
+tracer = Tracer()
+
+
+@logger.inject_lambda_context()
+@tracer.capture_lambda_handler
+def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
+    started = time.time()
+    # fork_objects are S3 listing entries ({"Key": ..., ...}) from the Map's
+    # item reader, all in the bucket of forks_out_prefix.
+    bucket, _ = parse_s3_uri(event["forks_out_prefix"])
+    keys = sorted(obj["Key"] for obj in event["fork_objects"])
+    uris = [f"s3://{bucket}/{key}" for key in keys]
+
+    # Named after its inputs, so a retried combiner overwrites its own output
+    # instead of leaving a second copy for the final reduce.
+    name = hashlib.sha256("\n".join(keys).encode()).hexdigest()[:32]
+    combined_fork_uri = f"{event['combined_prefix']}{name}.pkl"
+    with instrumentation.span("backfill.combine", forks=len(uris)):
+        combined = backfill.merge_forks(
+            fork_store.iter_forks(uris, fork_store.fetch_concurrency()),
+            group_size=fork_store.merge_group_size(),
+        )
+        stored = fork_store.save_fork(combined_fork_uri, combined)
+
+    stats.write_record(
+        event.get("stats_prefix"),
+        "combine",
+        started,
+        partition_id=event.get("partition_id"),
+        forks=len(uris),
+        fork_bytes=stored,
+    )
+    logger.info(
+        "Combined child forks",
+        extra={
+            "forks": len(uris),
+            "combined_fork_uri": combined_fork_uri,
+            "fork_bytes": stored,
+        },
+    )
+    return {"combined_fork_uri": combined_fork_uri, "fork_bytes": stored}
@@ -1,34 +1,75 @@
-"""Handler: create one shared fork for a partition and write it to S3."""
+"""Handler: create one shared fork for a partition and write it to S3.
 
+When FORK_INLINE_MAX_BYTES is set and the encoded fork fits within it, the fork
+is also returned inline (``fork_inline``), so workers can take it from their
+batch input instead of fetching it from S3.
+"""
+
+import os
+import time
 from typing import Any
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from virtualizarr_processor import backfill
+from virtualizarr_processor import backfill, cache, instrumentation
 from virtualizarr_processor.processor import Processor
 
-from backfill_handlers import fork_store
+from backfill_handlers import fork_store, stats
+from backfill_handlers.config import parse_s3_uri
 
 logger = Logger()
 tracer = Tracer()
 
 
+def inline_max_bytes() -> int:
+    """Largest encoded fork returned inline (FORK_INLINE_MAX_BYTES; 0 = never).
+    Must leave room for the file keys under the 256 KB state payload limit."""
+    return int(os.environ.get("FORK_INLINE_MAX_BYTES", "0"))
+
+
 @logger.inject_lambda_context()
 @tracer.capture_lambda_handler
 def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
+    started = time.time()
     partition_id = event["partition_id"]
     run_prefix = event["run_prefix"]
     fork_in_uri = f"{run_prefix}forks/{partition_id}/in/fork.pkl"
     forks_out_prefix = f"{run_prefix}forks/{partition_id}/out/"
+    combined_prefix = f"{run_prefix}forks/{partition_id}/combined/"
+    quarantine_prefix = f"{run_prefix}quarantine/{partition_id}/"
 
-    processor = Processor()
-    repo = processor.open_backfill_repo()
-    fork_store.save_fork(fork_in_uri, backfill.create_fork(repo))
+    _, repo = cache.get_repository(Processor, "open_backfill_repo")
+    with instrumentation.span("backfill.create_fork", partition_id=partition_id):
+        data = backfill.create_fork(repo)
+        stored = fork_store.save_fork(fork_in_uri, data)
+    # Always written to S3 as well: the reducer and retried workers may need it.
+    fork_inline = ""
+    if limit := inline_max_bytes():
+        encoded = fork_store.encode_inline(data)
+        if len(encoded) <= limit:
+            fork_inline = encoded
 
-    logger.info("Created shared fork", extra={"partition_id": partition_id})
+    stats.write_record(
+        event.get("stats_prefix"),
+        "fork",
+        started,
+        partition_id=partition_id,
+        fork_bytes=stored,
+        fork_raw_bytes=len(data),
+    )
+    logger.info(
+        "Created shared fork",
+        extra={"partition_id": partition_id, "inline": bool(fork_inline)},
+    )
     return {
         "partition_id": partition_id,
         "manifest_uri": event["manifest_uri"],
         "fork_in_uri": fork_in_uri,
+        # Empty when not inlined; always present so the state machine can pass it.
+        "fork_inline": fork_inline,
         "forks_out_prefix": forks_out_prefix,
+        # The tree reduce's Map lists child forks by bucket key prefix.
+        "forks_out_key_prefix": parse_s3_uri(forks_out_prefix)[1],
+        "combined_prefix": combined_prefix,
+        "quarantine_prefix": quarantine_prefix,
     }
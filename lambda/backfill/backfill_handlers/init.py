@@ -1,11 +1,21 @@
-"""Handler: create the full-shape backfill store and commit (clean base)."""
+"""Handler: create the full-shape backfill store and commit (clean base).
 
+With a ``plan_id`` (from the partition step) the base is marked with it. When
+the execution input has ``"resume": true`` and the ``backfill`` branch was
+initialized for the same plan by an earlier run, that branch is reused as is; a
+branch initialized for another plan fails the run.
+"""
+
+import time
 from typing import Any
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from virtualizarr_processor import backfill, cache
 from virtualizarr_processor.processor import Processor
 
+from backfill_handlers import stats
+
 logger = Logger()
 tracer = Tracer()
 
@@ -13,8 +23,18 @@ tracer = Tracer()
 @logger.inject_lambda_context()
 @tracer.capture_lambda_handler
 def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
-    processor = Processor()
-    repo = processor.open_backfill_repo()
+    started = time.time()
+    processor, repo = cache.get_repository(Processor, "open_backfill_repo")
+    plan = event.get("plan_id")
+    if event.get("run_options", {}).get("resume"):
+        tip = backfill.resumable_base(repo, event["plan_id"])
+        if tip is not None:
+            logger.info("Resuming backfill branch", extra={"tip": tip})
+            stats.write_record(event.get("stats_prefix"), "init", started)
+            return {"base_snapshot": tip, "resumed": True}
     base_snapshot = processor.initialize_backfill_store(repo)
+    if plan:
+        base_snapshot = backfill.record_plan(repo, plan)
+    stats.write_record(event.get("stats_prefix"), "init", started)
     logger.info("Initialized backfill store", extra={"base_snapshot": base_snapshot})
     return {"base_snapshot": base_snapshot}
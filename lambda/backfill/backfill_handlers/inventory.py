@@ -1,27 +1,189 @@
-"""Read the S3 inventory file and read/write partition manifests (JSON key lists)."""
+"""Read the S3 inventory file and read/write partition manifests (JSON key lists).
 
+Inventories are streamed, so the partitioner never holds the whole key list in
+memory. The format is picked from the object name (a trailing ``.gz`` is
+decompressed on the fly):
+
+- ``manifest.json`` — an `S3 Inventory
+  <https://docs.aws.amazon.com/AmazonS3/latest/userguide/storage-inventory.html>`_
+  manifest; every CSV or Parquet data file it lists is read in turn.
+- ``.jsonl`` / ``.ndjson`` — one key per line, as a JSON string or an object with
+  a ``key`` (and optionally ``size``) field.
+- ``.csv`` — a header row, then the ``key`` column (the first column if there is
+  no column named ``key``) and an optional ``size`` column.
+- ``.parquet`` — the ``key`` column (or the first column) and an optional
+  ``size`` column, read in row batches.
+- anything else — a JSON array of keys. This is the original format; it is
+  parsed in one piece, so prefer one of the above for large inventories.
+
+Inventories are usually ``s3://`` URIs; a local path also works (for the local
+runner), except for S3 Inventory manifests.
+"""
+
+import csv
+import gzip
+import io
 import json
-from typing import cast
+import tempfile
+from collections.abc import Iterable, Iterator
+from typing import IO, Any, cast
+from urllib.parse import unquote_plus
 
 from backfill_handlers.config import parse_s3_uri, s3_client
 
+# Rows fetched per Parquet read; bounds memory for very large data files.
+PARQUET_BATCH_ROWS = 65_536
+
+# An inventory entry: the file key and, if the inventory records it, its size.
+Entry = tuple[str, int | None]
+
+
+def _open(client: Any, bucket: str, key: str) -> IO[bytes]:
+    body = client.get_object(Bucket=bucket, Key=key)["Body"]
+    if key.endswith(".gz"):
+        return cast(IO[bytes], gzip.GzipFile(fileobj=body))
+    return cast(IO[bytes], body)
+
+
+def _open_local(path: str) -> IO[bytes]:
+    stream = open(path, "rb")
+    if path.endswith(".gz"):
+        return cast(IO[bytes], gzip.GzipFile(fileobj=stream))
+    return stream
+
+
+def _format(key: str) -> str:
+    name = key.removesuffix(".gz").rsplit("/", 1)[-1]
+    if name == "manifest.json":
+        return "s3-inventory"
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+
+def _size(value: Any) -> int | None:
+    return int(value) if value not in (None, "") else None
+
+
+def _iter_jsonl(stream: IO[bytes]) -> Iterator[Entry]:
+    for line in io.TextIOWrapper(stream, encoding="utf-8"):
+        line = line.strip()
+        if line:
+            item = json.loads(line)
+            if isinstance(item, dict):
+                yield item["key"], _size(item.get("size"))
+            else:
+                yield str(item), None
+
+
+def _iter_csv(
+    stream: IO[bytes],
+    *,
+    columns: list[str] | None = None,
+    url_encoded: bool = False,
+) -> Iterator[Entry]:
+    rows = csv.reader(io.TextIOWrapper(stream, encoding="utf-8", newline=""))
+    if columns is None:
+        columns = [name.strip().lower() for name in next(rows, [])]
+    key_column = columns.index("key") if "key" in columns else 0
+    size_column = columns.index("size") if "size" in columns else None
+    for row in rows:
+        if row:
+            key = unquote_plus(row[key_column]) if url_encoded else row[key_column]
+            yield key, None if size_column is None else _size(row[size_column])
+
+
+def _iter_parquet(stream: IO[bytes]) -> Iterator[Entry]:
+    import pyarrow.parquet as pq
+
+    # Parquet needs random access; spool the object to local disk rather than
+    # into memory.
+    with tempfile.TemporaryFile() as spool:
+        while chunk := stream.read(8 * 1024 * 1024):
+            spool.write(chunk)
+        spool.seek(0)
+        parquet = pq.ParquetFile(spool)
+        by_name = {n.lower(): n for n in parquet.schema_arrow.names}
+        key_column = by_name.get("key", parquet.schema_arrow.names[0])
+        columns = [key_column] + ([by_name["size"]] if "size" in by_name else [])
+        for batch in parquet.iter_batches(
+            batch_size=PARQUET_BATCH_ROWS, columns=columns
+        ):
+            keys = batch.column(0).to_pylist()
+            sizes = (
+                batch.column(1).to_pylist() if len(columns) > 1 else [None] * len(keys)
+            )
+            yield from ((str(k), _size(n)) for k, n in zip(keys, sizes, strict=True))
+
+
+def _iter_s3_inventory(client: Any, bucket: str, key: str) -> Iterator[Entry]:
+    manifest = json.loads(client.get_object(Bucket=bucket, Key=key)["Body"].read())
+    data_bucket = manifest["destinationBucket"].rsplit(":", 1)[-1]
+    file_format = manifest["fileFormat"].lower()
+    if file_format not in ("csv", "parquet"):
+        raise ValueError(f"unsupported S3 Inventory format: {manifest['fileFormat']}")
+    columns = [name.strip().lower() for name in manifest["fileSchema"].split(",")]
+    for data_file in manifest["files"]:
+        stream = _open(client, data_bucket, data_file["key"])
+        if file_format == "csv":
+            # Inventory CSVs have no header row, and keys are URL-encoded.
+            yield from _iter_csv(stream, columns=columns, url_encoded=True)
+        else:
+            yield from _iter_parquet(stream)
+
+
+def iter_inventory_entries(uri: str) -> Iterator[Entry]:
+    """Stream ``(key, size)`` pairs of an inventory object, in inventory order.
+
+    The size is the object size in bytes where the inventory records one (a
+    ``size`` field or column, or Size in an S3 Inventory), otherwise None.
+    """
+    fmt = _format(uri)
+    if fmt == "s3-inventory":
+        bucket, key = parse_s3_uri(uri)
+        yield from _iter_s3_inventory(s3_client(), bucket, key)
+        return
+    if uri.startswith("s3://"):
+        bucket, key = parse_s3_uri(uri)
+        stream = _open(s3_client(), bucket, key)
+    else:
+        stream = _open_local(uri)
+    with stream:
+        if fmt in ("jsonl", "ndjson"):
+            yield from _iter_jsonl(stream)
+        elif fmt == "csv":
+            yield from _iter_csv(stream)
+        elif fmt == "parquet":
+            yield from _iter_parquet(stream)
+        else:
+            keys = cast(list[str], json.loads(stream.read()))
+            yield from ((k, None) for k in keys)
+
+
+def iter_inventory(uri: str) -> Iterator[str]:
+    """Stream the file keys of an inventory object, in inventory order."""
+    return (key for key, _ in iter_inventory_entries(uri))
+
 
 def read_inventory(uri: str) -> list[str]:
-    """Read a JSON array of file keys from the inventory object."""
-    bucket, key = parse_s3_uri(uri)
-    body = s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
-    # cast: json.loads returns Any; the isolated mypy env would flag the return.
-    return cast(list[str], json.loads(body))
+    """Read every file key of the inventory object into a list."""
+    return list(iter_inventory(uri))
 
 
-def write_manifest(uri: str, keys: list[str]) -> None:
-    """Write a partition manifest (JSON array of keys) to S3."""
+def write_manifest(uri: str, keys: Iterable[Any], client: Any = None) -> None:
+    """Write a partition manifest (JSON array of keys, or of key and region
+    items) to S3.
+
+    Pass `client` to share one boto3 client between threads; creating clients
+    concurrently from the default session is not thread-safe.
+    """
     bucket, key = parse_s3_uri(uri)
-    s3_client().put_object(Bucket=bucket, Key=key, Body=json.dumps(keys).encode())
+    (client or s3_client()).put_object(
+        Bucket=bucket, Key=key, Body=json.dumps(list(keys)).encode()
+    )
 
 
 def read_manifest(uri: str) -> list[str]:
     """Read a partition manifest (JSON array of keys) from S3."""
     bucket, key = parse_s3_uri(uri)
     body = s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+    # cast: json.loads returns Any; the isolated mypy env would flag the return.
     return cast(list[str], json.loads(body))
@@ -0,0 +1,242 @@
+"""Run a whole backfill on one machine, with a process pool for the workers.
+
+The same steps as the Step Functions pipeline (partition, init, fork, workers,
+reduce, promote), built from the same functions, without Lambda, Step Functions
+or S3 fork artifacts: shared forks go to a local work directory and child forks
+come back from the worker processes directly. For mid-size archives one large
+instance is cheaper and quicker than many thousands of Lambda invocations.
+
+The Icechunk repository is opened by the processor as in the handlers, so it is
+chosen by the same environment: ICECHUNK_BUCKET (with ICECHUNK_PREFIX and
+ICECHUNK_REGION) for S3, or ICECHUNK_LOCAL_PATH for the local filesystem. The
+inventory may be an ``s3://`` URI or a local path. BATCH_WRITES and
+BACKFILL_FILE_MAX_ATTEMPTS apply to the workers as they do in Lambda::
+
+    ICECHUNK_LOCAL_PATH=/data/repo python -m backfill_handlers.local \\
+        inventory.jsonl --workers 64 --batch-size 10 --partition-size 5000
+
+Partitions run one after another, each fanned out over the pool and reduced
+into one commit with the same plan metadata as the pipeline, so ``--resume``
+and a later pipeline run with ``"resume": true`` both skip them. The plan covers
+the inventory, ``--partition-size``, ``--order`` and ``--explicit-regions``, so
+a resume must repeat them; ``--batch-size`` and ``--workers`` may change.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import pickle
+import tempfile
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any
+
+from icechunk import ForkSession, Repository
+from virtualizarr_processor import backfill, cache
+from virtualizarr_processor.processor import Processor
+
+from backfill_handlers import fork_store, inventory, partition, worker
+
+logger = logging.getLogger(__name__)
+
+# (path, unpickled shared fork) of the partition a worker process last loaded.
+_shared_fork: tuple[str, ForkSession] | None = None
+
+
+def write_batch(
+    shared_fork_path: str, items: list[Any], quarantine_path: str | None
+) -> tuple[bytes, dict[str, str]]:
+    """Worker process task: write `items` into a child of the shared fork and
+    return the pickled child with the keys that failed."""
+    global _shared_fork
+    if _shared_fork is None or _shared_fork[0] != shared_fork_path:
+        with open(shared_fork_path, "rb") as f:
+            _shared_fork = (shared_fork_path, pickle.loads(f.read()))
+    child = _shared_fork[1].fork()
+    failed, _ = worker.write_files(
+        cache.get_processor(Processor),
+        items,
+        child,
+        quarantine_prefix=quarantine_path,
+        attempts=worker.file_max_attempts(),
+    )
+    return pickle.dumps(child), failed
+
+
+def run_partition(
+    repo: Repository,
+    pool: ProcessPoolExecutor,
+    items: list[Any],
+    *,
+    partition_id: str,
+    plan: str,
+    batch_size: int,
+    work_dir: str,
+    failure_budget: float,
+) -> dict[str, Any]:
+    """Fork, write `items` in batches on the pool, and commit the partition."""
+    shared_fork_path = os.path.join(work_dir, f"{partition_id}.fork")
+    with open(shared_fork_path, "wb") as f:
+        f.write(backfill.create_fork(repo))
+    quarantine_path = (
+        os.path.join(work_dir, f"{partition_id}.quarantine.json")
+        if failure_budget > 0
+        else None
+    )
+    futures = [
+        pool.submit(write_batch, shared_fork_path, batch, quarantine_path)
+        for batch in partition.chunked(iter(items), batch_size)
+    ]
+    metadata = backfill.partition_metadata(plan, partition_id)
+    failed: dict[str, str] = {}
+
+    def children() -> Iterator[bytes]:
+        # Merged as they finish; the failure check runs after the last one, so
+        # merge_and_commit raises before committing an over-budget partition,
+        # and the metadata it commits already records what was skipped.
+        for future in as_completed(futures):
+            child, batch_failed = future.result()
+            failed.update(batch_failed)
+            yield child
+        if failed:
+            if len(failed) > failure_budget * len(items):
+                raise RuntimeError(
+                    f"partition {partition_id}: {len(failed)} of {len(items)} "
+                    f"files failed, over the failure budget of {failure_budget:.2%}"
+                )
+            with open(str(quarantine_path), "w") as f:
+                json.dump(failed, f)
+            metadata["backfill_skipped_files"] = len(failed)
+            metadata["backfill_quarantine"] = quarantine_path
+
+    tip = backfill.merge_and_commit(
+        repo,
+        children(),
+        message=f"Backfill partition {partition_id}",
+        metadata=metadata,
+        group_size=fork_store.merge_group_size(),
+    )
+    os.remove(shared_fork_path)
+    logger.info(
+        "Committed partition %s (%d files) at %s", partition_id, len(items), tip
+    )
+    return {"tip": tip, "files": len(items) - len(failed), "failed": len(failed)}
+
+
+def run_backfill(
+    inventory_uri: str,
+    *,
+    partition_size: int,
+    batch_size: int,
+    workers: int | None = None,
+    order: str = "inventory",
+    explicit_regions: bool = False,
+    failure_budget: float = 0.0,
+    resume: bool = False,
+    promote: bool = True,
+    work_dir: str | None = None,
+) -> dict[str, Any]:
+    """Backfill every file of the inventory and, with `promote`, fast-forward
+    ``main``. Returns a summary of the run."""
+    processor, repo = cache.get_repository(Processor, "open_backfill_repo")
+    plan = backfill.plan_id(
+        inventory_uri, partition_size, order, explicit_regions=explicit_regions
+    )
+    committed: set[str] = set()
+    base = backfill.resumable_base(repo, plan) if resume else None
+    if base is None:
+        processor.initialize_backfill_store(repo)
+        base = backfill.record_plan(repo, plan)
+    else:
+        committed = backfill.committed_partitions(repo, plan)
+        logger.info("Resuming backfill at %s (%d committed)", base, len(committed))
+
+    entries = inventory.iter_inventory_entries(inventory_uri)
+    if order == "coordinate":
+        entries = partition.coordinate_order(entries)
+    elif order != "inventory":
+        raise ValueError(f"unknown partition order: {order}")
+    work_dir = work_dir or tempfile.mkdtemp(prefix="backfill-")
+    os.makedirs(work_dir, exist_ok=True)
+
+    summary: dict[str, Any] = {
+        "base_snapshot": base,
+        "partitions": 0,
+        "skipped_partitions": len(committed),
+        "files": 0,
+        "failed_files": 0,
+        "work_dir": work_dir,
+    }
+    # spawn, not fork: the parent holds an open repository and its runtime.
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=mp.get_context("spawn")
+    ) as pool:
+        for index, chunk in enumerate(partition.chunked(entries, partition_size)):
+            partition_id = str(index)
+            if partition_id in committed:
+                continue
+            keys = [key for key, _ in chunk]
+            items = partition.region_items(keys) if explicit_regions else keys
+            result = run_partition(
+                repo,
+                pool,
+                items,
+                partition_id=partition_id,
+                plan=plan,
+                batch_size=batch_size,
+                work_dir=work_dir,
+                failure_budget=failure_budget,
+            )
+            summary["partitions"] += 1
+            summary["files"] += result["files"]
+            summary["failed_files"] += result["failed"]
+            summary["tip"] = result["tip"]
+
+    if promote:
+        backfill.promote(repo)
+        summary["promoted"] = repo.lookup_branch("main")
+    return summary
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m backfill_handlers.local",
+        description="Run a whole backfill on one machine.",
+    )
+    parser.add_argument("inventory", help="inventory s3:// URI or local path")
+    parser.add_argument("--partition-size", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes (default: CPUs)"
+    )
+    parser.add_argument(
+        "--order", choices=["inventory", "coordinate"], default="inventory"
+    )
+    parser.add_argument("--explicit-regions", action="store_true")
+    parser.add_argument("--failure-budget", type=float, default=0.0)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument(
+        "--no-promote", dest="promote", action="store_false", help="leave main as is"
+    )
+    parser.add_argument("--work-dir", help="shared forks and quarantine lists")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    summary = run_backfill(
+        args.inventory,
+        partition_size=args.partition_size,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        order=args.order,
+        explicit_regions=args.explicit_regions,
+        failure_budget=args.failure_budget,
+        resume=args.resume,
+        promote=args.promote,
+        work_dir=args.work_dir,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
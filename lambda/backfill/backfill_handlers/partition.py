@@ -1,42 +1,258 @@
-"""Handler: split the S3 inventory into partition manifests."""
+"""Handler: split the S3 inventory into partition manifests.
 
-from typing import Any
+With ``"resume": true`` in the execution input, partitions the ``backfill``
+branch already holds a commit for (by the plan and partition id the reducer
+writes as commit metadata) are left out, so a restarted run only does the rest.
+
+With ``batching`` in the event, each partition also gets a batch manifest of
+cost-balanced worker batches (see batching.py), read by the inner Map in place
+of fixed-size ItemBatcher batches.
+
+With ``"explicit_regions": true``, each file's index along the append dimension
+is resolved here, once per partition, against the processor's
+backfill_coordinate_values, and manifest items become
+``{"key": ..., "region": ...}``. A file that matches no coordinate fails the
+partition step, before any fork is written.
+
+With ``array_batch_size`` (the AWS Batch worker backend), each item also gets
+the ``array_size`` of the partition's worker array job: one child per batch of
+that many files, or per precomputed batch.
+
+With ``"stats": true``, the step writes a run stats record and adds the run's
+``stats_prefix`` to each partition item, for the later steps' records (see
+stats.py).
+"""
+
+import copy
+import json
+import os
+import time
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, TypeVar
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from virtualizarr_processor import backfill, cache, instrumentation
+from virtualizarr_processor.processor import Processor
 
-from backfill_handlers import inventory
-from backfill_handlers.config import parse_s3_uri
+from backfill_handlers import batching, inventory, stats
+from backfill_handlers.config import parse_s3_uri, s3_client
 
 logger = Logger()
 tracer = Tracer()
 
+T = TypeVar("T")
+
+# AWS Batch array jobs have between 2 and 10,000 children.
+MIN_ARRAY_SIZE, MAX_ARRAY_SIZE = 2, 10_000
+
+
+def manifest_write_concurrency() -> int:
+    """Number of partition manifests written to S3 at once
+    (MANIFEST_WRITE_CONCURRENCY)."""
+    return max(1, int(os.environ.get("MANIFEST_WRITE_CONCURRENCY", "16")))
+
+
+def coordinate_order(entries: Iterator[inventory.Entry]) -> Iterator[inventory.Entry]:
+    """Sort entries by the processor's backfill_coordinate of their key, so every
+    partition (and every worker batch within it) covers a contiguous run of the
+    append dimension. Unlike inventory order this has to hold all keys in memory."""
+    processor = cache.get_processor(Processor)
+    with instrumentation.span("backfill.sort_inventory"):
+        ordered = sorted(
+            (processor.backfill_coordinate(entry[0]), entry) for entry in entries
+        )
+    return (entry for _, entry in ordered)
+
+
+def chunked(items: Iterator[T], size: int) -> Iterator[list[T]]:
+    """Yield successive lists of `size` items (the last may be shorter)."""
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def region_items(keys: list[str]) -> list[dict[str, Any]]:
+    """Manifest items carrying each key's planned region."""
+    processor = cache.get_processor(Processor)
+    with instrumentation.span("backfill.resolve_regions", files=len(keys)):
+        regions = backfill.resolve_regions(
+            processor.backfill_coordinate_values(),
+            [processor.backfill_coordinate(key) for key in keys],
+        )
+    return [
+        {"key": key, "region": region}
+        for key, region in zip(keys, regions, strict=True)
+    ]
+
+
+def array_size(batches: int) -> int:
+    """Children of a worker array job for `batches` batches; surplus children
+    find no batch and exit."""
+    if batches > MAX_ARRAY_SIZE:
+        raise ValueError(
+            f"{batches} worker batches exceed the {MAX_ARRAY_SIZE} array job "
+            f"limit; use a smaller partition size or larger batches"
+        )
+    return max(MIN_ARRAY_SIZE, batches)
+
+
+def uncached(processor: Processor) -> Processor:
+    """`processor` with its manifest cache, if any, bypassed."""
+    if getattr(processor, "manifest_cache", None) is None:
+        return processor
+    bypass = copy.copy(processor)
+    bypass.manifest_cache = None
+    return bypass
+
+
+def fit_cost_model(entries: list[inventory.Entry], sample: int) -> batching.CostModel:
+    """Fit the batching cost model to timed parses of a sample of `entries`.
+
+    The sample is parsed with the manifest cache bypassed: on a repeated run its
+    files would be cache hits, and a model fitted to those would pack batches
+    far too large for the workers' time limit.
+    """
+    processor = uncached(cache.get_processor(Processor))
+    with instrumentation.span("backfill.sample_parse", files=sample):
+        samples = batching.sample_timings(
+            processor.parse_backfill_file, entries, sample
+        )
+    model = batching.fit(samples)
+    logger.info("Fitted batch cost model", extra=model.to_dict())
+    return model
+
 
 @logger.inject_lambda_context()
 @tracer.capture_lambda_handler
 def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
-    keys = inventory.read_inventory(event["inventory_uri"])
+    started = time.time()
     size = int(event["partition_size"])
     run_prefix = event["run_prefix"]
+    # With a Distributed outer Map the partitions are read from partitions.json,
+    # and returning them inline as well could exceed the 256 KB state payload.
+    inline = bool(event.get("inline_partitions", True))
+    concurrency = manifest_write_concurrency()
 
     # run_prefix is s3://<bucket>/<prefix>/; parse_s3_uri returns (bucket, "<prefix>/").
-    _, run_key_prefix = parse_s3_uri(run_prefix)
+    run_bucket, run_key_prefix = parse_s3_uri(run_prefix)
+    client = s3_client()
     partitions: list[dict[str, str]] = []
-    for i in range(0, len(keys), size):
-        partition_id = str(i // size)
-        manifest_key = f"{run_key_prefix}partitions/{partition_id}.json"
-        manifest_uri = f"{run_prefix}partitions/{partition_id}.json"
-        inventory.write_manifest(manifest_uri, keys[i : i + size])
-        partitions.append(
-            {
+    order = event.get("order", "inventory")
+    explicit_regions = bool(event.get("explicit_regions", False))
+    plan = backfill.plan_id(
+        event["inventory_uri"], size, order, explicit_regions=explicit_regions
+    )
+    committed: set[str] = set()
+    if event.get("run_options", {}).get("resume"):
+        _, repo = cache.get_repository(Processor, "open_backfill_repo")
+        committed = backfill.committed_partitions(repo, plan)
+        logger.info("Resuming backfill", extra={"committed": len(committed)})
+
+    batching_options = event.get("batching")
+    array_batch_size = int(event.get("array_batch_size", 0))
+    stats_prefix = stats.stats_prefix(run_prefix) if event.get("stats") else None
+    files = 0
+    model: batching.CostModel | None = None
+
+    entries = inventory.iter_inventory_entries(event["inventory_uri"])
+    if order == "coordinate":
+        entries = coordinate_order(entries)
+    elif order != "inventory":
+        raise ValueError(f"unknown partition order: {order}")
+    with (
+        instrumentation.span("backfill.partition"),
+        ThreadPoolExecutor(max_workers=concurrency) as pool,
+    ):
+        # Bounded so a fast reader cannot queue up the whole inventory in memory.
+        in_flight: set[Future[None]] = set()
+        for index, chunk in enumerate(chunked(entries, size)):
+            # Ids follow inventory position, so they are stable across runs;
+            # committed ones are still counted but not emitted.
+            partition_id = str(index)
+            if partition_id in committed:
+                continue
+            if len(in_flight) >= 2 * concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            manifest_key = f"{run_key_prefix}partitions/{partition_id}.json"
+            manifest_uri = f"{run_prefix}partitions/{partition_id}.json"
+            keys = [key for key, _ in chunk]
+            files += len(keys)
+            items: list[Any] = region_items(keys) if explicit_regions else keys
+            in_flight.add(
+                pool.submit(inventory.write_manifest, manifest_uri, items, client)
+            )
+            item = {
                 "partition_id": partition_id,
                 "manifest_uri": manifest_uri,
                 "manifest_key": manifest_key,
-                # carried through so the fork handler (which gets the raw partition
-                # item as its event) can build the per-partition fork S3 locations.
+                # carried through so the fork handler (which gets the raw
+                # partition item as its event) can build the per-partition
+                # fork S3 locations.
                 "run_prefix": run_prefix,
+                "plan_id": plan,
             }
-        )
+            if stats_prefix:
+                item["stats_prefix"] = stats_prefix
+            if batching_options:
+                if model is None:
+                    # Fitted once, on the first partition this run emits.
+                    model = fit_cost_model(chunk, int(batching_options["sample"]))
+                batches = batching.pack(
+                    chunk,
+                    model,
+                    target_seconds=float(batching_options["target_seconds"]),
+                    max_items=int(batching_options["max_items"]),
+                )
+                if explicit_regions:
+                    # Batches are contiguous runs of the chunk, in order.
+                    position = iter(items)
+                    for batch in batches:
+                        batch["file_keys"] = [
+                            next(position) for _ in batch["file_keys"]
+                        ]
+                batches_key = f"{run_key_prefix}partitions/{partition_id}.batches.json"
+                in_flight.add(
+                    pool.submit(
+                        batching.write_batches,
+                        f"s3://{run_bucket}/{batches_key}",
+                        batches,
+                        client,
+                    )
+                )
+                item["batches_key"] = batches_key
+                if array_batch_size:
+                    item["array_size"] = array_size(len(batches))
+            elif array_batch_size:
+                item["array_size"] = array_size(-(-len(keys) // array_batch_size))
+            partitions.append(item)
+        for future in in_flight:
+            future.result()
+
+    # Written last, so it only ever lists manifests that exist.
+    partitions_key = f"{run_key_prefix}partitions.json"
+    client.put_object(
+        Bucket=run_bucket, Key=partitions_key, Body=json.dumps(partitions).encode()
+    )
 
     logger.info("Partitioned inventory", extra={"count": len(partitions)})
-    return {"partitions": partitions}
+    result: dict[str, Any] = {
+        "partition_count": len(partitions),
+        "partitions_uri": f"s3://{run_bucket}/{partitions_key}",
+        "partitions_key": partitions_key,
+        "skipped_partitions": len(committed),
+        "plan_id": plan,
+    }
+    if model is not None:
+        result["cost_model"] = model.to_dict()
+    if stats_prefix:
+        stats.write_record(
+            stats_prefix, "partition", started, partitions=len(partitions), files=files
+        )
+        result["stats_prefix"] = stats_prefix
+    if inline:
+        result["partitions"] = partitions
+    return result
@@ -1,12 +1,15 @@
 """Handler: fast-forward main to the backfill tip."""
 
+import time
 from typing import Any
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from virtualizarr_processor import backfill
+from virtualizarr_processor import backfill, cache, instrumentation
 from virtualizarr_processor.processor import Processor
 
+from backfill_handlers import stats
+
 logger = Logger()
 tracer = Tracer()
 
@@ -14,8 +17,10 @@ tracer = Tracer()
 @logger.inject_lambda_context()
 @tracer.capture_lambda_handler
 def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
-    processor = Processor()
-    repo = processor.open_backfill_repo()
-    backfill.promote(repo)
+    started = time.time()
+    _, repo = cache.get_repository(Processor, "open_backfill_repo")
+    with instrumentation.span("backfill.promote"):
+        backfill.promote(repo)
+    stats.write_record(event.get("stats_prefix"), "promote", started)
     logger.info("Promoted main to backfill tip")
     return {"promoted": True}
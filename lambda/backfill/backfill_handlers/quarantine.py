@@ -0,0 +1,36 @@
+"""Write and read quarantine manifests: the keys a worker gave up on.
+
+Each worker with failures writes one JSON array of ``{"key", "error"}`` objects
+under its partition's quarantine prefix, named like its child fork so a retried
+worker overwrites its own manifest; the reducer reads them all back.
+"""
+
+import json
+import uuid
+from typing import Any, cast
+
+from backfill_handlers import fork_store
+from backfill_handlers.config import parse_s3_uri, s3_client
+
+
+def write_quarantine(
+    prefix: str, failed: dict[str, str], name: str | None = None
+) -> str:
+    """Write the failed keys and their errors as one manifest under `prefix`,
+    as ``<name>.json`` (a random name by default)."""
+    uri = f"{prefix}{name or uuid.uuid4().hex}.json"
+    bucket, key = parse_s3_uri(uri)
+    body = [{"key": k, "error": error} for k, error in failed.items()]
+    s3_client().put_object(Bucket=bucket, Key=key, Body=json.dumps(body).encode())
+    return uri
+
+
+def read_quarantine(prefix: str) -> list[dict[str, Any]]:
+    """Every quarantined entry under `prefix`, across all workers' manifests."""
+    client = s3_client()
+    entries: list[dict[str, Any]] = []
+    for uri in fork_store.list_forks(prefix):
+        bucket, key = parse_s3_uri(uri)
+        body = client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        entries.extend(cast(list[dict[str, Any]], json.loads(body)))
+    return entries
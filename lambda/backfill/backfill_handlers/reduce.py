@@ -1,13 +1,21 @@
-"""Handler: merge all child forks for a partition into one commit."""
+"""Handler: merge all child forks for a partition into one commit.
 
+When the event carries a ``quarantine_prefix``, the keys workers quarantined
+are counted against ``failure_budget`` (a fraction of the partition's files).
+Within budget the partition commits without them, and the commit metadata
+records how many were skipped and where they are listed; over budget the
+reduce fails and nothing is committed.
+"""
+
+import time
 from typing import Any
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from virtualizarr_processor import backfill
+from virtualizarr_processor import backfill, cache, instrumentation
 from virtualizarr_processor.processor import Processor
 
-from backfill_handlers import fork_store
+from backfill_handlers import fork_store, inventory, quarantine, stats
 
 logger = Logger()
 tracer = Tracer()
@@ -16,15 +24,67 @@ tracer = Tracer()
 @logger.inject_lambda_context()
 @tracer.capture_lambda_handler
 def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
+    started = time.time()
     partition_id = event["partition_id"]
-    processor = Processor()
-    repo = processor.open_backfill_repo()
+    _, repo = cache.get_repository(Processor, "open_backfill_repo")
+    metadata = backfill.partition_metadata(event["plan_id"], partition_id)
+
+    quarantine_prefix = event.get("quarantine_prefix")
+    if quarantine_prefix:
+        # Keys, not entries: a requeued or redelivered batch may list a key in
+        # more than one manifest.
+        skipped = {
+            entry["key"] for entry in quarantine.read_quarantine(quarantine_prefix)
+        }
+        if skipped:
+            total = len(inventory.read_manifest(event["manifest_uri"]))
+            budget = float(event.get("failure_budget", 0))
+            logger.warning(
+                "Partition has quarantined files",
+                extra={"skipped": len(skipped), "total": total, "budget": budget},
+            )
+            if len(skipped) > budget * total:
+                raise RuntimeError(
+                    f"partition {partition_id}: {len(skipped)} of {total} files "
+                    f"failed, over the failure budget of {budget:.2%}"
+                )
+            metadata["backfill_skipped_files"] = len(skipped)
+            metadata["backfill_quarantine"] = quarantine_prefix
 
-    child_uris = fork_store.list_forks(event["forks_out_prefix"])
-    children = [fork_store.load_fork(uri) for uri in child_uris]
-    tip = backfill.merge_and_commit(
-        repo, children, message=f"Backfill partition {partition_id}"
+    sizes = fork_store.list_fork_sizes(event["forks_out_prefix"])
+    child_uris = list(sizes)
+    fork_bytes = sum(sizes.values())
+    instrumentation.count(
+        "backfill.reduce_input_bytes", fork_bytes, unit="Bytes", forks=len(sizes)
     )
+    # Downloads overlap with merging: each group is unpickled and merged while
+    # the next forks are still arriving, so reduce never holds every fork.
+    children = fork_store.iter_forks(child_uris, fork_store.fetch_concurrency())
+    with instrumentation.span("backfill.merge_commit", forks=len(child_uris)):
+        tip = backfill.merge_and_commit(
+            repo,
+            children,
+            message=f"Backfill partition {partition_id}",
+            metadata=metadata,
+            group_size=fork_store.merge_group_size(),
+        )
 
-    logger.info("Committed partition", extra={"partition_id": partition_id, "tip": tip})
-    return {"partition_id": partition_id, "tip": tip}
+    stats.write_record(
+        event.get("stats_prefix"),
+        "reduce",
+        started,
+        partition_id=partition_id,
+        forks=len(child_uris),
+        fork_bytes=fork_bytes,
+        failed_files=metadata.get("backfill_skipped_files", 0),
+    )
+    logger.info(
+        "Committed partition",
+        extra={"partition_id": partition_id, "tip": tip, "fork_bytes": fork_bytes},
+    )
+    return {
+        "partition_id": partition_id,
+        "tip": tip,
+        "forks": len(child_uris),
+        "fork_bytes": fork_bytes,
+    }
@@ -0,0 +1,223 @@
+"""Handler: compact a run's stats records into a Parquet run report.
+
+Runs last, after promote. It reads every record under ``stats_prefix`` (see
+stats.py) and writes them as one table, one row per handler call, to
+``report_uri``. It also returns a summary of the run.
+
+The same summary is available from the command line, for the report of a
+finished run or, for a run that failed before its report step, from the run's
+stats records directly::
+
+    python -m backfill_handlers.report s3://<bucket>/backfill/<run>/report.parquet
+    python -m backfill_handlers.report s3://<bucket>/backfill/<run>/
+
+It covers throughput (files per second over the run, and per worker second),
+tail latencies per stage and per partition, fork sizes, and the straggler
+batches: workers that took more than ``--straggler-factor`` times the median
+worker, with their keys.
+"""
+
+import argparse
+import io
+import json
+import math
+import statistics
+from collections import defaultdict
+from typing import Any
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+from backfill_handlers import stats
+from backfill_handlers.config import parse_s3_uri, s3_client
+
+logger = Logger()
+tracer = Tracer()
+
+
+def _schema() -> Any:
+    """Report columns; a record leaves the ones that do not apply to its stage
+    null."""
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("stage", pa.string()),
+            ("partition_id", pa.string()),
+            ("started", pa.float64()),
+            ("seconds", pa.float64()),
+            ("partitions", pa.int64()),
+            ("files", pa.int64()),
+            ("failed_files", pa.int64()),
+            ("unprocessed_files", pa.int64()),
+            ("forks", pa.int64()),
+            ("fork_bytes", pa.int64()),
+            ("fork_raw_bytes", pa.int64()),
+            ("load_seconds", pa.float64()),
+            ("write_seconds", pa.float64()),
+            ("save_seconds", pa.float64()),
+            ("keys", pa.list_(pa.string())),
+        ]
+    )
+
+
+def write_report(records: list[dict[str, Any]], uri: str) -> int:
+    """Write `records` as a Parquet table to `uri`; returns its size in bytes."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pylist(records, schema=_schema())
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd")
+    bucket, key = parse_s3_uri(uri)
+    s3_client().put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+    return buffer.tell()
+
+
+def read_report(uri: str) -> list[dict[str, Any]]:
+    """The records of a run report: a Parquet ``s3://`` URI or local path, or an
+    ``s3://`` run prefix (ending in ``/``) whose stats records are read as is."""
+    import pyarrow.parquet as pq
+
+    records: list[dict[str, Any]]
+    if uri.endswith("/"):
+        records = stats.read_records(stats.stats_prefix(uri))
+    elif uri.startswith("s3://"):
+        bucket, key = parse_s3_uri(uri)
+        body = s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+        records = pq.read_table(io.BytesIO(body)).to_pylist()
+    else:
+        records = pq.read_table(uri).to_pylist()
+    return records
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    """Nearest-rank p50/p90/p99 and max of `values` (not empty)."""
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+    return {"p50": rank(0.5), "p90": rank(0.9), "p99": rank(0.99), "max": ordered[-1]}
+
+
+def summarize(
+    records: list[dict[str, Any]],
+    *,
+    stragglers: int = 10,
+    straggler_factor: float = 3.0,
+) -> dict[str, Any]:
+    """Throughput, tail latencies, fork sizes and stragglers of a run."""
+    if not records:
+        return {"records": 0}
+    start = min(r["started"] for r in records)
+    end = max(r["started"] + r["seconds"] for r in records)
+    workers = [r for r in records if r["stage"] == "worker"]
+    files = sum(r.get("files") or 0 for r in workers)
+    worker_seconds = sum(r["seconds"] for r in workers)
+
+    summary: dict[str, Any] = {
+        "records": len(records),
+        "wall_seconds": end - start,
+        "files": files,
+        "failed_files": sum(r.get("failed_files") or 0 for r in workers),
+        "files_per_second": files / (end - start) if end > start else None,
+        "files_per_worker_second": files / worker_seconds if worker_seconds else None,
+    }
+
+    by_stage: dict[str, list[float]] = defaultdict(list)
+    for r in records:
+        by_stage[r["stage"]].append(r["seconds"])
+    summary["stages"] = {
+        stage: {"count": len(seconds), "total_seconds": sum(seconds)}
+        | _percentiles(seconds)
+        for stage, seconds in sorted(by_stage.items())
+    }
+
+    # A partition runs from its fork starting to its reduce finishing.
+    spans: dict[str, list[float]] = {}
+    for r in records:
+        if r.get("partition_id") is None:
+            continue
+        first, last = spans.setdefault(r["partition_id"], [math.inf, -math.inf])
+        spans[r["partition_id"]] = [
+            min(first, r["started"]),
+            max(last, r["started"] + r["seconds"]),
+        ]
+    if spans:
+        seconds = {pid: last - first for pid, (first, last) in spans.items()}
+        summary["partitions"] = {
+            "count": len(seconds),
+            "slowest": max(seconds, key=seconds.__getitem__),
+        } | _percentiles(list(seconds.values()))
+
+    if workers:
+        fork_bytes = [r["fork_bytes"] for r in workers if r.get("fork_bytes")]
+        if fork_bytes:
+            summary["worker_fork_bytes"] = _percentiles(fork_bytes)
+        median = statistics.median(r["seconds"] for r in workers)
+        slow = sorted(
+            (r for r in workers if r["seconds"] > straggler_factor * median),
+            key=lambda r: r["seconds"],
+            reverse=True,
+        )
+        summary["median_worker_seconds"] = median
+        summary["stragglers"] = [
+            {
+                "partition_id": r.get("partition_id"),
+                "seconds": r["seconds"],
+                "files": r.get("files"),
+                "keys": r.get("keys") or [],
+            }
+            for r in slow[:stragglers]
+        ]
+    return summary
+
+
+@logger.inject_lambda_context()
+@tracer.capture_lambda_handler
+def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
+    records = stats.read_records(event["stats_prefix"])
+    size = write_report(records, event["report_uri"])
+    summary = summarize(records, stragglers=3)
+    logger.info(
+        "Wrote run report",
+        extra={"report_uri": event["report_uri"], "bytes": size, **summary},
+    )
+    return {
+        "report_uri": event["report_uri"],
+        "records": len(records),
+        "files": summary.get("files"),
+        "files_per_second": summary.get("files_per_second"),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m backfill_handlers.report",
+        description="Summarize a backfill run report.",
+    )
+    parser.add_argument(
+        "report",
+        help="report.parquet (s3:// URI or local path), or an s3:// run prefix",
+    )
+    parser.add_argument(
+        "--stragglers", type=int, default=10, help="slowest batches to list"
+    )
+    parser.add_argument(
+        "--straggler-factor",
+        type=float,
+        default=3.0,
+        help="list batches slower than this many times the median worker",
+    )
+    args = parser.parse_args(argv)
+    summary = summarize(
+        read_report(args.report),
+        stragglers=args.stragglers,
+        straggler_factor=args.straggler_factor,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Write and read run stats records: one small JSON object per handler call.
+
+With the run report enabled, every backfill step writes a record under the run's
+stats prefix (``<run_prefix>stats/<stage>/``): when it started, how long it
+took, and what it did (files, failures, forks, fork sizes; a worker also records
+its batch's keys and its load, write and save times). Handlers without a
+``stats_prefix`` in their event write nothing. The report step compacts the
+records into one Parquet file (see report.py).
+"""
+
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from backfill_handlers import fork_store
+from backfill_handlers.config import parse_s3_uri, s3_client
+
+
+def stats_prefix(run_prefix: str) -> str:
+    """Where the records of the run under `run_prefix` go."""
+    return f"{run_prefix}stats/"
+
+
+def write_record(
+    prefix: str | None, stage: str, started: float, **fields: Any
+) -> str | None:
+    """Write one record for `stage` under `prefix`, timed from `started` (a
+    ``time.time()`` value) to now. Returns its URI, or None without a prefix."""
+    if not prefix:
+        return None
+    record = {
+        "stage": stage,
+        "started": started,
+        "seconds": time.time() - started,
+        **fields,
+    }
+    uri = f"{prefix}{stage}/{uuid.uuid4().hex}.json"
+    bucket, key = parse_s3_uri(uri)
+    s3_client().put_object(Bucket=bucket, Key=key, Body=json.dumps(record).encode())
+    return uri
+
+
+def read_records(prefix: str) -> list[dict[str, Any]]:
+    """Every record under `prefix`, in no particular order."""
+    client = s3_client()
+
+    def read(uri: str) -> dict[str, Any]:
+        bucket, key = parse_s3_uri(uri)
+        body = client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        record: dict[str, Any] = json.loads(body)
+        return record
+
+    uris = fork_store.list_forks(prefix)
+    with ThreadPoolExecutor(max_workers=fork_store.fetch_concurrency()) as pool:
+        return list(pool.map(read, uris))
@@ -1,31 +1,377 @@
-"""Handler: write one file-batch's virtual refs into a child fork on S3."""
+"""Handler: write one file-batch's virtual refs into a child fork on S3.
 
+Each file is tried up to BACKFILL_FILE_MAX_ATTEMPTS times with jittered
+backoff, each try into a fork of the child that is merged back only on success,
+so a failed file leaves no chunks behind. A file that still fails is fatal
+unless the event carries a ``quarantine_prefix``: the worker then records the
+failed keys in a quarantine manifest under that prefix and still emits a child
+fork for the files that succeeded, leaving the reducer to apply the partition's
+failure budget.
+
+With WORKER_LANES above 1 the batch is split into contiguous slices written by
+that many threads, each into its own child of the shared fork. The lanes'
+children are merged before upload, so the reducer still sees one fork per
+batch.
+
+The shared fork is kept between invocations of a warm container, keyed by its
+URI and ETag (or by the inline blob when the event carries ``fork_inline``), so
+only the first batch a container runs for a partition downloads and unpickles
+it.
+
+With WORKER_TIME_RESERVE_SECONDS set, the worker stops taking new files once
+less than that much of its Lambda time is left, saves the child fork for the
+files it finished and returns the rest as ``unprocessed_keys`` for the state
+machine to hand to a follow-up invocation. Each lane always finishes at least
+one file, so every invocation makes progress.
+
+With explicit regions planned by the partitioner, file items are
+``{"key": ..., "region": ...}`` objects rather than plain keys, and each file is
+written to its planned region without a coordinate lookup.
+
+With a ``stats_prefix`` in the event, the worker writes a run stats record with
+its batch's keys and its load, write and save times (see stats.py).
+"""
+
+import hashlib
+import json
+import os
 import pickle
-import uuid
-from typing import Any
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, TypeVar
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from icechunk import ForkSession
+from virtualizarr_processor import backfill, cache, instrumentation
+from virtualizarr_processor.forward import backoff_delay
 from virtualizarr_processor.processor import Processor
 
-from backfill_handlers import fork_store
+from backfill_handlers import fork_store, quarantine, stats
 
 logger = Logger()
 tracer = Tracer()
 
+T = TypeVar("T")
+
+# (fork_in_uri, version, unpickled shared fork) of the last partition seen. One
+# entry: a container only works on one partition at a time.
+_shared_fork: tuple[str, str, ForkSession] | None = None
+
+
+def batch_writes_enabled() -> bool:
+    """Whether the batch is parsed first and region-written with one write
+    (BATCH_WRITES), instead of one process_backfill_file call per key."""
+    return os.environ.get("BATCH_WRITES", "false").lower() == "true"
+
+
+def file_max_attempts() -> int:
+    """Tries per file before it counts as failed (BACKFILL_FILE_MAX_ATTEMPTS)."""
+    return max(1, int(os.environ.get("BACKFILL_FILE_MAX_ATTEMPTS", "3")))
+
+
+def with_retries(
+    file_key: str,
+    attempt_once: Callable[[], T],
+    *,
+    max_attempts: int,
+    sleep: Callable[[float], None] = time.sleep,
+) -> T:
+    """Call `attempt_once` until it returns a truthy value or raises on the last
+    of `max_attempts` tries; a falsy final result is returned as is."""
+    attempt = 1
+    while True:
+        try:
+            result = attempt_once()
+            if result or attempt >= max_attempts:
+                return result
+        except Exception:
+            if attempt >= max_attempts:
+                raise
+        logger.warning(
+            "File attempt failed, retrying",
+            extra={"file_key": file_key, "attempt": attempt},
+        )
+        sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+def time_reserve_ms() -> int:
+    """Lambda time, in ms, kept back for saving the child fork
+    (WORKER_TIME_RESERVE_SECONDS; 0 runs the whole batch regardless)."""
+    return max(0, int(os.environ.get("WORKER_TIME_RESERVE_SECONDS", "0"))) * 1000
+
+
+def worker_lanes() -> int:
+    """Threads writing the batch, each into its own child fork (WORKER_LANES)."""
+    return max(1, int(os.environ.get("WORKER_LANES", "1")))
+
+
+def file_item(item: str | dict[str, Any]) -> tuple[str, int | None]:
+    """The key of a manifest item and its planned region, if any."""
+    if isinstance(item, str):
+        return item, None
+    return item["key"], int(item["region"])
+
+
+def split_lanes(file_keys: list[T], lanes: int) -> list[list[T]]:
+    """Split `file_keys` into at most `lanes` contiguous, near-equal slices, so
+    each lane's batched region write stays contiguous."""
+    lanes = max(1, min(lanes, len(file_keys)))
+    size, extra = divmod(len(file_keys), lanes)
+    slices, start = [], 0
+    for lane in range(lanes):
+        end = start + size + (lane < extra)
+        slices.append(file_keys[start:end])
+        start = end
+    return slices
+
+
+def isolated(child: ForkSession, write: Callable[[ForkSession], T]) -> Callable[[], T]:
+    """An attempt that runs `write` on a fresh fork of `child` and merges it back
+    only when it returns a truthy value, so a failed or partial write of a file
+    leaves nothing of it in `child`."""
+
+    def attempt() -> T:
+        scratch = child.fork()
+        result = write(scratch)
+        if result:
+            child.merge(scratch)
+        return result
+
+    return attempt
+
+
+def write_files(
+    processor: Processor,
+    file_keys: list[Any],
+    child: ForkSession,
+    *,
+    quarantine_prefix: str | None,
+    attempts: int,
+    out_of_time: Callable[[], bool] | None = None,
+) -> tuple[dict[str, str], list[Any]]:
+    """Write `file_keys` (keys or region items) into `child`, returning the keys
+    that failed with their errors and the items left unprocessed. Without a
+    `quarantine_prefix` the first failure raises instead. Single-file writes go
+    through `isolated`, so a failed file leaves no chunks in `child`.
+
+    Once `out_of_time` returns True no further file is started (the first always
+    is), and the remaining keys are returned as unprocessed.
+    """
+    failed: dict[str, str] = {}
+
+    def stop(index: int) -> bool:
+        return index > 0 and out_of_time is not None and out_of_time()
+
+    unprocessed: list[Any] = []
+    if batch_writes_enabled():
+        vdss = []
+        parsed_keys: list[str] = []
+        regions: list[int] = []
+        for index, item in enumerate(file_keys):
+            if stop(index):
+                unprocessed = file_keys[index:]
+                break
+            file_key, region = file_item(item)
+            try:
+                with instrumentation.span("backfill.parse", key=file_key):
+                    vdss.append(
+                        with_retries(
+                            file_key,
+                            partial(processor.parse_backfill_file, file_key),
+                            max_attempts=attempts,
+                        )
+                    )
+            except Exception as e:
+                logger.exception("Failed to parse file", extra={"file_key": file_key})
+                if quarantine_prefix is None:
+                    raise RuntimeError(
+                        f"parse_backfill_file failed for {file_key}"
+                    ) from e
+                failed[file_key] = repr(e)
+                continue
+            parsed_keys.append(file_key)
+            if region is not None:
+                regions.append(region)
+
+        def write_each(index: int, write: Callable[[ForkSession], None]) -> None:
+            # The batched write failed; each file's own write is retried and,
+            # with a quarantine prefix, skipped if it keeps failing.
+            file_key = parsed_keys[index]
+
+            def write_file(fork: ForkSession) -> bool:
+                write(fork)
+                return True
+
+            try:
+                with_retries(
+                    file_key, isolated(child, write_file), max_attempts=attempts
+                )
+            except Exception as e:
+                logger.exception("Failed to write file", extra={"file_key": file_key})
+                if quarantine_prefix is None:
+                    raise RuntimeError(f"write failed for {file_key}") from e
+                failed[file_key] = repr(e)
+
+        if vdss:
+            with instrumentation.span("backfill.write_batch", files=len(vdss)):
+                backfill.write_batch(
+                    processor, vdss, child, regions or None, write_each=write_each
+                )
+    else:
+        for index, item in enumerate(file_keys):
+            if stop(index):
+                unprocessed = file_keys[index:]
+                break
+            file_key, region = file_item(item)
+            process = partial(processor.process_backfill_file, file_key)
+            if region is not None:
+                process = partial(process, region=region)
+            try:
+                with instrumentation.span("backfill.process_file", key=file_key):
+                    ok = with_retries(
+                        file_key, isolated(child, process), max_attempts=attempts
+                    )
+            except Exception as e:
+                logger.exception("Failed to process file", extra={"file_key": file_key})
+                if quarantine_prefix is None:
+                    raise RuntimeError(
+                        f"process_backfill_file failed for {file_key}"
+                    ) from e
+                failed[file_key] = repr(e)
+                continue
+            if not ok:
+                logger.error("Failed to process file", extra={"file_key": file_key})
+                if quarantine_prefix is None:
+                    raise RuntimeError(f"process_backfill_file failed for {file_key}")
+                failed[file_key] = "process_backfill_file returned False"
+    return failed, unprocessed
+
+
+def load_shared_fork(event: dict[str, Any]) -> ForkSession:
+    """The partition's shared fork, from the warm-container cache when its
+    version matches, otherwise from the inline blob or S3."""
+    global _shared_fork
+    uri = event["fork_in_uri"]
+    inline = event.get("fork_inline")
+    if inline:
+        version = "inline:" + hashlib.sha256(inline.encode()).hexdigest()
+    else:
+        version = fork_store.fork_etag(uri)
+    if _shared_fork is not None and _shared_fork[:2] == (uri, version):
+        instrumentation.count("backfill.shared_fork_cache_hits")
+        return _shared_fork[2]
+
+    with instrumentation.span("backfill.load_fork", inline=bool(inline)):
+        data = fork_store.decode_inline(inline) if inline else fork_store.load_fork(uri)
+        shared: ForkSession = pickle.loads(data)
+    _shared_fork = (uri, version, shared)
+    return shared
+
 
 @logger.inject_lambda_context()
 @tracer.capture_lambda_handler
 def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
-    processor = Processor()
-    shared = pickle.loads(fork_store.load_fork(event["fork_in_uri"]))
-    child = shared.fork()
-    for file_key in event["file_keys"]:
-        if not processor.process_backfill_file(file_key, child):
-            logger.error("Failed to process file", extra={"file_key": file_key})
-            raise RuntimeError(f"process_backfill_file failed for {file_key}")
-
-    child_fork_uri = f"{event['forks_out_prefix']}{uuid.uuid4().hex}.pkl"
-    fork_store.save_fork(child_fork_uri, pickle.dumps(child))
+    reserve_ms = time_reserve_ms()
+    return process_batch(
+        event,
+        out_of_time=(
+            (lambda: context.get_remaining_time_in_millis() < reserve_ms)
+            if reserve_ms
+            else None
+        ),
+    )
+
+
+def process_batch(
+    event: dict[str, Any], *, out_of_time: Callable[[], bool] | None = None
+) -> dict[str, Any]:
+    """Write the event's batch into a child fork and upload it; the worker
+    body shared by the Lambda handler and the AWS Batch entry point."""
+    started = time.time()
+    processor = cache.get_processor(Processor)
+    file_keys = event["file_keys"]
+    quarantine_prefix = event.get("quarantine_prefix")
+    write = partial(
+        write_files,
+        processor,
+        quarantine_prefix=quarantine_prefix,
+        attempts=file_max_attempts(),
+        out_of_time=out_of_time,
+    )
+    shared = load_shared_fork(event)
+    loaded = time.time()
+
+    lanes = split_lanes(file_keys, worker_lanes())
+    children = [shared.fork() for _ in lanes]
+    if len(lanes) == 1:
+        failed, unprocessed = write(lanes[0], children[0])
+    else:
+        # Threads, not processes: Lambda has no /dev/shm for multiprocessing, and
+        # parsing and icechunk writes spend most of their time outside the GIL.
+        with ThreadPoolExecutor(max_workers=len(lanes)) as pool:
+            results = list(pool.map(write, lanes, children))
+        failed = {key: error for lane, _ in results for key, error in lane.items()}
+        unprocessed = [key for _, rest in results for key in rest]
+        # Lane children share the shared fork's base, so they merge like
+        # workers' children do in reduce; one fork leaves the Lambda.
+        with instrumentation.span("backfill.merge_lanes", lanes=len(lanes)):
+            children[0].merge(*children[1:])
+    child = children[0]
+    written = time.time()
+
+    # Named by the batch's items, so a retried invocation overwrites its own
+    # fork and quarantine manifest instead of adding duplicates the reducer
+    # would reject as overlapping or count twice.
+    name = hashlib.sha256(json.dumps(file_keys).encode()).hexdigest()[:32]
+
+    # Always present (possibly empty) so the state machine's Choice can test it.
+    result: dict[str, Any] = {"unprocessed_keys": unprocessed}
+    if unprocessed:
+        instrumentation.count("backfill.unprocessed_files", len(unprocessed))
+        logger.warning(
+            "Stopping before the Lambda deadline",
+            extra={"unprocessed": len(unprocessed)},
+        )
+    if failed and quarantine_prefix is not None:
+        result["quarantine_uri"] = quarantine.write_quarantine(
+            quarantine_prefix, failed, name
+        )
+        instrumentation.count("backfill.quarantined_files", len(failed))
+        logger.warning(
+            "Quarantined files",
+            extra={"files": sorted(failed), "quarantine_uri": result["quarantine_uri"]},
+        )
+
+    child_fork_uri = f"{event['forks_out_prefix']}{name}.pkl"
+    with instrumentation.span("backfill.save_fork"):
+        data = pickle.dumps(child)
+        stored = fork_store.save_fork(child_fork_uri, data)
+    instrumentation.count(
+        "backfill.fork_bytes", stored, unit="Bytes", raw_bytes=len(data)
+    )
+    result["fork_bytes"] = stored
+    result["fork_raw_bytes"] = len(data)
+    files = len(file_keys) - len(failed) - len(unprocessed)
+    instrumentation.count("backfill.files", files)
+    stats.write_record(
+        event.get("stats_prefix"),
+        "worker",
+        started,
+        partition_id=event.get("partition_id"),
+        files=files,
+        failed_files=len(failed),
+        unprocessed_files=len(unprocessed),
+        fork_bytes=stored,
+        fork_raw_bytes=len(data),
+        load_seconds=loaded - started,
+        write_seconds=written - loaded,
+        save_seconds=time.time() - written,
+        keys=[file_item(item)[0] for item in file_keys],
+    )
     logger.info("Wrote child fork", extra={"child_fork_uri": child_fork_uri})
-    return {"child_fork_uri": child_fork_uri}
+    result["child_fork_uri"] = child_fork_uri
+    return result
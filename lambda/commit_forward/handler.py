@@ -0,0 +1,168 @@
+"""Handler: append every staged forward batch to `main` in one commit.
+
+Runs on a schedule with a reserved concurrency of 1, so it is the only writer on
+`main` in deferred commit mode and its commits never race one another.
+"""
+
+import os
+from typing import Any, List
+
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from icechunk import Session
+from virtualizarr_processor import cache, forward, instrumentation, ledger
+from virtualizarr_processor.processor import Processor
+
+logger = Logger()
+tracer = Tracer()
+
+
+def max_staged_batches() -> int:
+    """
+    Most staged batches appended in one commit.
+
+    Read from MAX_STAGED_BATCHES. Anything beyond it waits for the next run, which
+    bounds the run time after a long pause.
+    """
+    return max(1, int(os.environ.get("MAX_STAGED_BATCHES", "200")))
+
+
+def commit_max_attempts() -> int:
+    """
+    Number of commits tried before giving up until the next run.
+
+    Read from COMMIT_MAX_ATTEMPTS.
+    """
+    return max(1, int(os.environ.get("COMMIT_MAX_ATTEMPTS", "5")))
+
+
+@tracer.capture_method
+def drop_ingested(
+    records: List[forward.StagedRecord],
+    ingestion_ledger: ledger.IngestionLedger | None,
+) -> List[forward.StagedRecord]:
+    """
+    Drop records the ledger already holds, or that repeat an earlier record.
+
+    A run that committed but died before deleting its staged batches leaves them
+    pending; with the ledger enabled the next run skips them instead of appending
+    them twice.
+    """
+    if ingestion_ledger is None:
+        return records
+    seen: set[tuple[str, str]] = set()
+    kept = []
+    for record in records:
+        if record.key is not None and record.etag is not None:
+            file = (record.key, record.etag)
+            if file in seen or ingestion_ledger.contains(*file):
+                logger.info(
+                    "Skipping already ingested file",
+                    extra={"key": record.key, "etag": record.etag},
+                )
+                continue
+            seen.add(file)
+        kept.append(record)
+    return kept
+
+
+@logger.inject_lambda_context()
+@tracer.capture_lambda_handler
+def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
+    store = forward.staging_store()
+    if store is None:
+        raise RuntimeError("Deferred commits need a staging store")
+    paths = forward.list_staged(store, limit=max_staged_batches())
+    if not paths:
+        return {
+            "staged_batches": 0,
+            "unreadable_batches": 0,
+            "appended": 0,
+            "failed": 0,
+            "snapshot_id": None,
+        }
+
+    virtualizarr_processor, repo = cache.get_repository(Processor, "initialize_repo")
+    ingestion_ledger = ledger.get_ledger()
+    if ingestion_ledger is not None:
+        ingestion_ledger.refresh()
+    staged: List[forward.StagedRecord] = []
+    unreadable: List[str] = []
+    with instrumentation.span("commit_forward.load", batches=len(paths)):
+        for path in paths:
+            try:
+                staged.extend(forward.load_staged(store, path))
+            except Exception:
+                # Listed oldest first, so a bad batch left in place would stop
+                # every later run; set it aside like unappendable records.
+                moved = forward.set_aside_staged(store, path)
+                logger.exception(
+                    "Failed to load staged batch", extra={"path": path, "moved": moved}
+                )
+                unreadable.append(path)
+    paths = [path for path in paths if path not in unreadable]
+    records = drop_ingested(staged, ingestion_ledger)
+
+    session = virtualizarr_processor.initialize_session(repo=repo)
+    with instrumentation.span("commit_forward.append_batch", files=len(records)):
+        errors = forward.append_batch(
+            virtualizarr_processor, [record.vds for record in records], session
+        )
+    appended = [r for r, error in zip(records, errors) if error is None]
+    failed = [r for r, error in zip(records, errors) if error is not None]
+    for record, error in zip(records, errors):
+        if error is not None:
+            logger.error(
+                f"Error appending staged record: {str(error)}",
+                extra={"message_id": record.message_id, "key": record.key},
+            )
+
+    def reapply() -> Session:
+        """Redo the appends on a fresh session at the new branch tip."""
+        fresh = virtualizarr_processor.initialize_session(repo=repo)
+        vdss = [record.vds for record in appended]
+        for error in forward.append_batch(virtualizarr_processor, vdss, fresh):
+            if error is not None:
+                raise error
+        return fresh
+
+    snapshot_id = None
+    if appended:
+        try:
+            with instrumentation.span("commit_forward.commit", files=len(appended)):
+                snapshot_id = forward.commit_with_rebase(
+                    session,
+                    lambda s: virtualizarr_processor.commit_processed_files(session=s),
+                    reapply=reapply,
+                    max_attempts=commit_max_attempts(),
+                )
+        except Exception:
+            # The staged batches stay pending for the next run.
+            cache.invalidate()
+            raise
+        logger.info(f"Committed {len(appended)} staged datasets to {snapshot_id}")
+        if ingestion_ledger is not None:
+            try:
+                ingestion_ledger.record(
+                    snapshot_id,
+                    {r.key: r.etag for r in appended if r.key and r.etag},
+                )
+            except Exception:
+                logger.exception("Failed to record ingested files in the ledger")
+
+    if failed:
+        # Their SQS messages are gone; keep the records for inspection and replay.
+        path = forward.stage_batch(store, failed, prefix=forward.FAILED_PREFIX)
+        logger.error(f"Moved {len(failed)} unappendable records to {path}")
+    forward.delete_staged(store, paths)
+    instrumentation.count("commit_forward.appended_records", len(appended))
+    instrumentation.count("commit_forward.failed_records", len(failed))
+    instrumentation.count("commit_forward.skipped_records", len(staged) - len(records))
+
+    return {
+        "staged_batches": len(paths),
+        "unreadable_batches": len(unreadable),
+        "appended": len(appended),
+        "failed": len(failed),
+        "snapshot_id": snapshot_id,
+    }
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta, timezone
 
 from aws_lambda_powertools import Logger
+from virtualizarr_processor import instrumentation, ledger
 from virtualizarr_processor.processor import Processor
 
 logger = Logger()
@@ -11,7 +12,13 @@ def handler() -> None:
         virtualizarr_processor = Processor()
         expiry_time = datetime.now(timezone.utc) - timedelta(days=2)
         print(expiry_time)
-        virtualizarr_processor.garbage_collect(expiry_time=expiry_time)
+        with instrumentation.span("gc.garbage_collect"):
+            virtualizarr_processor.garbage_collect(expiry_time=expiry_time)
         logger.info("Icechunk garbage collected")
+        ingestion_ledger = ledger.get_ledger()
+        if ingestion_ledger is not None:
+            with instrumentation.span("gc.compact_ledger"):
+                folded = ingestion_ledger.compact()
+            logger.info(f"Ingestion ledger compacted ({folded} commit objects)")
     except Exception as e:
         logger.error(f"Error in custom resource handler: {e}")
@@ -1,6 +1,9 @@
 import json
-from typing import Any, Dict
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
+import xarray as xr
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.batch import (
     BatchProcessor,
@@ -9,7 +12,8 @@ from aws_lambda_powertools.utilities.batch import (
 from aws_lambda_powertools.utilities.batch.types import PartialItemFailureResponse
 from aws_lambda_powertools.utilities.data_classes import SQSEvent, SQSRecord
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from icechunk import Session
+from icechunk import Repository, Session
+from virtualizarr_processor import cache, forward, instrumentation, ledger
 from virtualizarr_processor.processor import Processor
 
 logger = Logger()
@@ -17,29 +21,263 @@ tracer = Tracer()
 batch_processor = BatchProcessor(event_type=EventType.SQS)
 
 
+def parse_concurrency() -> int:
+    """
+    Number of threads used to parse a batch's files.
+
+    Read from PARSE_CONCURRENCY. The default of 1 keeps the serial
+    process_file path; anything larger parses every record up front on a
+    bounded thread pool and only serializes the writes into the Session.
+    """
+    return max(1, int(os.environ.get("PARSE_CONCURRENCY", "1")))
+
+
+def batch_append_enabled() -> bool:
+    """
+    Whether a batch's parsed files are appended with one batched write.
+
+    Read from BATCH_APPEND. Batched appends always use the parse_file path
+    (with PARSE_CONCURRENCY threads) and fall back to one append per file when
+    the batch cannot be concatenated.
+    """
+    return os.environ.get("BATCH_APPEND", "false").lower() == "true"
+
+
+def commit_max_attempts() -> int:
+    """
+    Number of commits tried before a lost branch-tip race fails the batch.
+
+    Read from COMMIT_MAX_ATTEMPTS.
+    """
+    return max(1, int(os.environ.get("COMMIT_MAX_ATTEMPTS", "5")))
+
+
+def commit_mode() -> str:
+    """
+    How parsed batches reach the store.
+
+    Read from COMMIT_MODE. "direct" (the default) appends and commits each batch
+    in this Lambda. "deferred" stages the parsed batch in the Icechunk bucket
+    instead, for the single scheduled commit_forward Lambda to append and commit
+    together with every other pending batch.
+    """
+    mode = os.environ.get("COMMIT_MODE", "direct").lower()
+    if mode not in ("direct", "deferred"):
+        raise ValueError(f"Unknown COMMIT_MODE {mode!r}")
+    return mode
+
+
+def extract_message(record: SQSRecord) -> Dict[str, Any]:
+    """
+    Decode an SQS record body, unwrapping the SNS envelope if present.
+
+    Args:
+        record: SQS record from the batch
+    """
+    message: Dict[str, Any] = json.loads(record.body)
+    if "Message" in message:
+        message = json.loads(message["Message"])
+    return message
+
+
+def extract_location(message: Dict[str, Any]) -> Optional[tuple[str, str]]:
+    """
+    Return the (bucket, key) of the S3 object a notification refers to.
+
+    Args:
+        message: The notification message
+    """
+    bucket = message.get("Records", [{}])[0].get("s3", {}).get("bucket", {}).get("name")
+    key = message.get("Records", [{}])[0].get("s3", {}).get("object", {}).get("key")
+    if key and bucket:
+        return bucket, key
+    return None
+
+
+def extract_etag(message: Dict[str, Any]) -> Optional[str]:
+    """
+    Return the ETag of the S3 object a notification refers to, if it has one.
+
+    Args:
+        message: The notification message
+    """
+    etag = message.get("Records", [{}])[0].get("s3", {}).get("object", {}).get("eTag")
+    return etag or None
+
+
+@tracer.capture_method
+def find_ingested(
+    records: List[Dict[str, Any]],
+    ingestion_ledger: Optional[ledger.IngestionLedger],
+) -> tuple[Dict[str, tuple[str, str]], set[str]]:
+    """
+    Work out which records to skip before anything is parsed.
+
+    A record is skipped when the ledger says an earlier commit already ingested
+    that exact object (key and ETag), or when it repeats an earlier record of
+    this batch. Records that cannot be decoded or carry no ETag are never
+    skipped; their errors surface in the record handlers as before.
+
+    Args:
+        records: Raw SQS records from the event
+        ingestion_ledger: The ledger, or None if it is disabled
+
+    Returns:
+        The (key, ETag) of every record that has both, by message id, and the
+        message ids to skip.
+    """
+    files: Dict[str, tuple[str, str]] = {}
+    skipped: set[str] = set()
+    if ingestion_ledger is None:
+        return files, skipped
+    seen: set[tuple[str, str]] = set()
+    for raw in records:
+        record = SQSRecord(raw)
+        try:
+            message = extract_message(record)
+        except Exception:
+            continue
+        location, etag = extract_location(message), extract_etag(message)
+        if location is None or etag is None:
+            continue
+        _, key = location
+        if (key, etag) in seen or ingestion_ledger.contains(key, etag):
+            logger.info(
+                "Skipping already ingested file",
+                extra={"key": key, "etag": etag, "message_id": record.message_id},
+            )
+            skipped.add(record.message_id)
+            continue
+        seen.add((key, etag))
+        files[record.message_id] = (key, etag)
+    return files, skipped
+
+
 @tracer.capture_method
 def process_notification(
     message: Dict[str, Any],
     session: Session,
     processor: Processor,
-) -> None:
+) -> Optional[str]:
     """
     Process a notification message.
 
     Args:
         message: The notification message to process
+
+    Returns:
+        The processed file key, or None if the message names no S3 object.
+
+    Raises:
+        RuntimeError: If process_file reports that the file was not appended, so
+            the record fails (and is retried) instead of being recorded as
+            ingested.
     """
-    # Extract key information from the message
-    bucket = message.get("Records", [{}])[0].get("s3", {}).get("bucket", {}).get("name")
-    key = message.get("Records", [{}])[0].get("s3", {}).get("object", {}).get("key")
-    if key and bucket:
+    location = extract_location(message)
+    if location:
+        bucket, key = location
         s3_uri = f"s3://{bucket}/{key}"
         logger.info(
             "Append file",
             extra={"bucket": bucket, "key": key, "s3_uri": s3_uri},
         )
-        processor.process_file(file_key=key, session=session)
+        with instrumentation.span("forward.process_file", key=key):
+            ok = processor.process_file(file_key=key, session=session)
+        if not ok:
+            raise RuntimeError(f"process_file failed for {s3_uri}")
         logger.info(f"{s3_uri} successfully processed")
+        return key
+    return None
+
+
+def timed_parse(processor: Processor, key: str) -> xr.Dataset:
+    """
+    Parse one file, timed as the forward.parse stage.
+
+    Args:
+        processor: The processor whose parse_file is called
+        key: The file key to parse
+    """
+    with instrumentation.span("forward.parse", key=key):
+        return processor.parse_file(key)
+
+
+@tracer.capture_method
+def parse_records(
+    records: List[Dict[str, Any]],
+    processor: Processor,
+    pool: ThreadPoolExecutor,
+    skipped: Optional[set[str]] = None,
+) -> Dict[str, Optional[Future[xr.Dataset]]]:
+    """
+    Submit every record's parse to the thread pool.
+
+    A record whose body cannot be decoded maps to a failed future, and one
+    without an S3 location (or that is skipped as already ingested) maps to
+    None, so the error (or the no-op) surfaces when that record's turn comes in
+    the serial write loop and is reported for that record alone.
+
+    Args:
+        records: Raw SQS records from the event
+        processor: The processor whose parse_file is called
+        pool: The bounded thread pool to parse on
+        skipped: Message ids not to parse
+    """
+    parsed: Dict[str, Optional[Future[xr.Dataset]]] = {}
+    for raw in records:
+        record = SQSRecord(raw)
+        if skipped and record.message_id in skipped:
+            parsed[record.message_id] = None
+            continue
+        try:
+            location = extract_location(extract_message(record))
+        except Exception as e:
+            failed: Future[xr.Dataset] = Future()
+            failed.set_exception(e)
+            parsed[record.message_id] = failed
+            continue
+        if location is None:
+            parsed[record.message_id] = None
+            continue
+        _, key = location
+        parsed[record.message_id] = pool.submit(timed_parse, processor, key)
+    return parsed
+
+
+def stage_parsed(
+    pending: List[tuple[str, xr.Dataset]],
+    files: Dict[str, tuple[str, str]],
+) -> PartialItemFailureResponse:
+    """
+    Stage a batch's parsed datasets for the deferred committer.
+
+    The staging write is all or nothing: if it fails, every parsed record is
+    reported as failed so SQS redelivers them.
+
+    Args:
+        pending: (message id, parsed dataset) for each record that parsed
+        files: (key, ETag) by message id, for the committer's ledger entries
+    """
+    response = batch_processor.response()
+    if not pending:
+        return response
+    staged = [
+        forward.StagedRecord(message_id, vds, *files.get(message_id, (None, None)))
+        for message_id, vds in pending
+    ]
+    try:
+        store = forward.staging_store()
+        if store is None:
+            raise RuntimeError("Deferred commits need a staging store")
+        with instrumentation.span("forward.stage", files=len(staged)):
+            path = forward.stage_batch(store, staged)
+        logger.info(f"Staged {len(staged)} datasets to {path}")
+    except Exception:
+        logger.exception("Staging failed, marking all parsed records as failed")
+        response["batchItemFailures"].extend(
+            {"itemIdentifier": message_id} for message_id, _ in pending
+        )
+    return response
 
 
 @logger.inject_lambda_context()
@@ -55,9 +293,38 @@ def handler(event: Any, context: LambdaContext) -> PartialItemFailureResponse:
     """
     sqs_event = SQSEvent(event)
     records = sqs_event.raw_event["Records"]
-    virtualizarr_processor = Processor()
-    repo = virtualizarr_processor.initialize_repo()
-    session = virtualizarr_processor.initialize_session(repo=repo)
+    deferred = commit_mode() == "deferred"
+    repo: Optional[Repository] = None
+    session: Optional[Session] = None
+    if deferred:
+        # Deferred consumers only parse and stage; the committer is the one
+        # writer that opens the repository.
+        virtualizarr_processor = cache.get_processor(Processor)
+    else:
+        virtualizarr_processor, repo = cache.get_repository(
+            Processor, "initialize_repo"
+        )
+        session = virtualizarr_processor.initialize_session(repo=repo)
+    ingestion_ledger = ledger.get_ledger()
+    if ingestion_ledger is not None:
+        try:
+            ingestion_ledger.refresh()
+        except Exception:
+            # Fall back to what this container already knows; at worst a
+            # redelivered file is appended again, as without the ledger.
+            logger.warning("Failed to refresh the ingestion ledger", exc_info=True)
+    files, skipped = find_ingested(records, ingestion_ledger)
+    instrumentation.count("forward.records", len(records))
+    instrumentation.count("forward.skipped_records", len(skipped))
+    concurrency = parse_concurrency()
+    batch_append = batch_append_enabled()
+    # What each successful record wrote, in batch order, so a commit that loses
+    # the branch-tip race can redo the batch on a fresh session.
+    processed_keys: List[str] = []
+    appended: List[xr.Dataset] = []
+    # Records that parsed but whose write failed in the batched-append fallback,
+    # after BatchProcessor had already counted them as successes.
+    write_failures: List[str] = []
 
     @tracer.capture_method
     def record_handler(record: SQSRecord) -> None:
@@ -67,28 +334,17 @@ def handler(event: Any, context: LambdaContext) -> PartialItemFailureResponse:
         Args:
             record: SQS record from the batch
         """
+        if record.message_id in skipped:
+            return
+        assert session is not None
         try:
-            # Extract message body
-            message_body = record.body
-
-            # Parse the SNS message if it's from SNS
-            message = json.loads(message_body)
-
-            # If message is from SNS, extract the actual message
-            if "Message" in message:
-                sns_message = json.loads(message["Message"])
-                process_notification(
-                    message=sns_message,
-                    session=session,
-                    processor=virtualizarr_processor,
-                )
-            else:
-                # Direct SQS message
-                process_notification(
-                    message=message,
-                    session=session,
-                    processor=virtualizarr_processor,
-                )
+            key = process_notification(
+                message=extract_message(record),
+                session=session,
+                processor=virtualizarr_processor,
+            )
+            if key is not None:
+                processed_keys.append(key)
 
         except Exception as e:
             logger.error(
@@ -97,15 +353,107 @@ def handler(event: Any, context: LambdaContext) -> PartialItemFailureResponse:
             )
             raise
 
-    # Process each record individually
-    with batch_processor(records=records, handler=record_handler) as batch:
-        batch.process()
-    # Now attempt the commit:
+    if concurrency == 1 and not batch_append and not deferred:
+        # Process each record individually
+        with batch_processor(records=records, handler=record_handler) as batch:
+            batch.process()
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            parsed = parse_records(records, virtualizarr_processor, pool, skipped)
+            pending: List[tuple[str, xr.Dataset]] = []
+
+            @tracer.capture_method
+            def append_handler(record: SQSRecord) -> None:
+                """
+                Write one pre-parsed record into the shared session.
+
+                Args:
+                    record: SQS record from the batch
+                """
+                future = parsed[record.message_id]
+                if future is None:
+                    return
+                try:
+                    vds = future.result()
+                    if batch_append or deferred:
+                        pending.append((record.message_id, vds))
+                        return
+                    assert session is not None
+                    with instrumentation.span(
+                        "forward.append", message_id=record.message_id
+                    ):
+                        virtualizarr_processor.append_virtual_dataset(
+                            vds=vds, session=session
+                        )
+                    appended.append(vds)
+                except Exception as e:
+                    logger.error(
+                        f"Error processing record: {str(e)}",
+                        extra={"message_id": record.message_id},
+                    )
+                    raise
+
+            # Writes stay serial and in batch order; parses run ahead on the pool.
+            with batch_processor(records=records, handler=append_handler) as batch:
+                batch.process()
+
+        if deferred:
+            response = stage_parsed(pending, files)
+            instrumentation.count(
+                "forward.failed_records", len(response["batchItemFailures"])
+            )
+            return response
+
+        assert session is not None
+        with instrumentation.span("forward.append_batch", files=len(pending)):
+            errors = forward.append_batch(
+                virtualizarr_processor, [vds for _, vds in pending], session
+            )
+        for (message_id, vds), error in zip(pending, errors):
+            if error is None:
+                appended.append(vds)
+            else:
+                logger.error(
+                    f"Error processing record: {str(error)}",
+                    extra={"message_id": message_id},
+                )
+                write_failures.append(message_id)
+
+    # Direct mode from here on, with the repository and session open.
+    assert repo is not None and session is not None
+
+    def reapply() -> Session:
+        """Redo this batch's writes on a fresh session at the new branch tip."""
+        fresh = virtualizarr_processor.initialize_session(repo=repo)
+        if batch_append:
+            for error in forward.append_batch(virtualizarr_processor, appended, fresh):
+                if error is not None:
+                    raise error
+        else:
+            for vds in appended:
+                virtualizarr_processor.append_virtual_dataset(vds=vds, session=fresh)
+        for key in processed_keys:
+            if not virtualizarr_processor.process_file(file_key=key, session=fresh):
+                raise RuntimeError(f"process_file failed for {key} on reapply")
+        return fresh
+
+    # Now attempt the commit, rebasing (or re-applying the batch) if another
+    # consumer moved the tip first:
     try:
-        snapshot_id = virtualizarr_processor.commit_processed_files(session=session)
+        with instrumentation.span("forward.commit", records=len(records)):
+            snapshot_id = forward.commit_with_rebase(
+                session,
+                lambda s: virtualizarr_processor.commit_processed_files(session=s),
+                reapply=reapply,
+                max_attempts=commit_max_attempts(),
+            )
         logger.info(f"Committed to {snapshot_id}")
     except Exception:
         logger.error("Commit failed, marking all records as failed")
+        # The failure may be an expired credential or a moved store; make the
+        # next invocation reopen the repository rather than reuse this one.
+        cache.invalidate()
+        instrumentation.count("forward.failed_records", len(records))
         return {
             "batchItemFailures": [
                 {"itemIdentifier": record["messageId"]} for record in records
@@ -114,4 +462,25 @@ def handler(event: Any, context: LambdaContext) -> PartialItemFailureResponse:
 
     # Commit succeeded — return normal partial failure response
     # (only individually-failed records retry)
-    return batch_processor.response()
+    response = batch_processor.response()
+    response["batchItemFailures"].extend(
+        {"itemIdentifier": message_id} for message_id in write_failures
+    )
+    instrumentation.count("forward.failed_records", len(response["batchItemFailures"]))
+    if ingestion_ledger is not None:
+        failed = {item["itemIdentifier"] for item in response["batchItemFailures"]}
+        ingested = {
+            key: etag
+            for message_id, (key, etag) in files.items()
+            if message_id not in failed
+        }
+        try:
+            ingestion_ledger.record(snapshot_id, ingested)
+        except Exception:
+            # The commit stands; only a redelivery of these files would now be
+            # appended again.
+            logger.exception(
+                "Failed to record ingested files in the ledger",
+                extra={"snapshot_id": snapshot_id, "keys": sorted(ingested)},
+            )
+    return response
@@ -7,10 +7,33 @@ icechunk 1.1.14: a fresh writable session can merge forks created by an earlier
 branch-tip snapshot.
 """
 
+import hashlib
+import json
+import logging
 import pickle
-from typing import cast
+from collections.abc import Callable, Iterable, Sequence
+from functools import partial
+from itertools import batched
+from typing import Any, cast
 
-from icechunk import Repository
+import numpy as np
+import xarray as xr
+from icechunk import ForkSession, Repository, Session
+
+from virtualizarr_processor.forward import commit_with_rebase
+from virtualizarr_processor.typing import VirtualizarrProcessor
+
+logger = logging.getLogger(__name__)
+
+# Child forks unpickled and merged at a time by merge_and_commit.
+MERGE_GROUP_SIZE = 8
+# Commits merge_and_commit attempts when other partitions keep moving the tip.
+COMMIT_MAX_ATTEMPTS = 10
+
+# Commit metadata written by init (plan only) and by the reducer for each
+# partition, read back to resume.
+PLAN_METADATA_KEY = "backfill_plan"
+PARTITION_METADATA_KEY = "backfill_partition"
 
 
 def create_fork(repo: Repository, *, branch: str = "backfill") -> bytes:
@@ -24,23 +47,217 @@ def create_fork(repo: Repository, *, branch: str = "backfill") -> bytes:
     return pickle.dumps(session.fork())
 
 
+class ChunkIndex:
+    """The chunks written by the forks seen so far, per array, as sorted arrays
+    of chunk indices, to catch forks that write the same chunk.
+
+    ``session.merge`` is last-writer-wins, so without this check an inventory
+    that places two files in one region would silently keep one of them.
+    """
+
+    def __init__(self) -> None:
+        self._written: dict[str, np.ndarray] = {}
+        self.forks = 0
+
+    def add(self, fork: ForkSession) -> None:
+        """Record the chunks `fork` wrote; raise ValueError if any of them was
+        already written by an earlier fork."""
+        for path, coords in fork.status().updated_chunks.items():
+            if not coords:
+                continue
+            codes = _chunk_codes(coords)
+            written = self._written.get(path)
+            if written is None:
+                self._written[path] = codes
+                continue
+            overlap = np.intersect1d(written, codes, assume_unique=True)
+            if len(overlap):
+                raise ValueError(
+                    f"fork {self.forks} writes {len(overlap)} chunks of {path} "
+                    f"already written by an earlier fork, e.g. "
+                    f"{_decode_chunk_codes(overlap[:5])}"
+                )
+            self._written[path] = np.union1d(written, codes)
+        self.forks += 1
+
+
+def _chunk_codes(coords: list[list[int]]) -> np.ndarray:
+    # Each chunk index as one fixed-width value (its int64 row viewed as bytes),
+    # so numpy's set operations compare whole indices.
+    rows = np.ascontiguousarray(coords, dtype=np.int64)
+    return np.unique(rows.view(np.dtype((np.void, rows.itemsize * rows.shape[1]))))
+
+
+def _decode_chunk_codes(codes: np.ndarray) -> list[list[int]]:
+    return cast(list[list[int]], codes.view(np.int64).reshape(len(codes), -1).tolist())
+
+
+def _load_checked(data: bytes, index: ChunkIndex | None) -> ForkSession:
+    fork: ForkSession = pickle.loads(data)
+    if index is not None:
+        index.add(fork)
+    return fork
+
+
 def merge_and_commit(
     repo: Repository,
-    child_fork_bytes: list[bytes],
+    child_fork_bytes: Iterable[bytes],
     *,
     branch: str = "backfill",
     message: str,
+    metadata: dict[str, Any] | None = None,
+    group_size: int = MERGE_GROUP_SIZE,
+    max_attempts: int = COMMIT_MAX_ATTEMPTS,
+    check_overlap: bool = True,
 ) -> str:
     """Open a fresh writable session, merge all child forks, and commit once.
 
+    Forks are unpickled and merged `group_size` at a time as `child_fork_bytes`
+    yields them, so passing a generator keeps only one group in memory.
+
+    When partitions run concurrently another reducer may commit to `branch`
+    while this one merges. The session is then rebased onto the new tip and the
+    commit retried; partitions cover disjoint regions, so the rebase only fails
+    if they do not, and that error propagates.
+
+    With `check_overlap`, each fork's written chunks are checked against the
+    forks before it (see ChunkIndex) and an overlap raises before anything is
+    committed.
+
     Returns the new tip snapshot id.
     """
+    index = ChunkIndex() if check_overlap else None
+    session = repo.writable_session(branch)
+    for group in batched(child_fork_bytes, max(1, group_size)):
+        session.merge(*(_load_checked(b, index) for b in group))
+
+    def commit(s: Session) -> str:
+        # cast: pre-commit mypy runs without icechunk, so commit() is Any there
+        # and warn_return_any flags a bare return. Do not remove.
+        return cast(str, s.commit(message, metadata=metadata))
+
+    return commit_with_rebase(session, commit, max_attempts=max_attempts)
+
+
+def merge_forks(
+    child_fork_bytes: Iterable[bytes],
+    *,
+    group_size: int = MERGE_GROUP_SIZE,
+    check_overlap: bool = True,
+) -> bytes:
+    """Merge child forks into one combined fork without committing.
+
+    The first fork absorbs the rest, `group_size` at a time, and is returned
+    pickled. A combined fork merges into a writable session like any child, so
+    reduce can be split into levels: intermediate reducers combine groups of
+    children and a final merge_and_commit commits once. Overlapping forks
+    raise as in merge_and_commit.
+    """
+    index = ChunkIndex() if check_overlap else None
+    forks = iter(child_fork_bytes)
+    combined = _load_checked(next(forks), index)
+    for group in batched(forks, max(1, group_size)):
+        combined.merge(*(_load_checked(b, index) for b in group))
+    return pickle.dumps(combined)
+
+
+def plan_id(
+    inventory_uri: str,
+    partition_size: int,
+    order: str,
+    *,
+    explicit_regions: bool = False,
+) -> str:
+    """Identify a partitioning: the same inventory split the same way yields the
+    same partition ids, so a resumed run can match them to earlier commits.
+
+    Explicit regions change where each file is written, so they are part of the
+    plan. The batch size only groups a partition's files and is not.
+    """
+    fields: list[Any] = [inventory_uri, partition_size, order]
+    if explicit_regions:
+        # Only appended when set, so plans recorded without it keep their ids.
+        fields.append("explicit_regions")
+    plan = json.dumps(fields)
+    return hashlib.sha256(plan.encode()).hexdigest()[:16]
+
+
+def partition_metadata(plan: str, partition_id: str) -> dict[str, Any]:
+    """Commit metadata recording that `partition_id` of `plan` is committed."""
+    return {PLAN_METADATA_KEY: plan, PARTITION_METADATA_KEY: partition_id}
+
+
+def committed_partitions(
+    repo: Repository, plan: str, *, branch: str = "backfill"
+) -> set[str]:
+    """Partition ids of `plan` already committed on `branch`."""
+    if branch not in repo.list_branches():
+        return set()
+    return {
+        snapshot.metadata[PARTITION_METADATA_KEY]
+        for snapshot in repo.ancestry(branch=branch)
+        if (snapshot.metadata or {}).get(PLAN_METADATA_KEY) == plan
+        and PARTITION_METADATA_KEY in snapshot.metadata
+    }
+
+
+def record_plan(repo: Repository, plan: str, *, branch: str = "backfill") -> str:
+    """Mark the initialized `branch` as the base of `plan` with an empty commit
+    carrying the plan id; returns that commit, the run's base snapshot."""
     session = repo.writable_session(branch)
-    forks = [pickle.loads(b) for b in child_fork_bytes]
-    session.merge(*forks)
-    # cast: pre-commit mypy runs without icechunk, so commit() is Any there and
-    # warn_return_any flags a bare return. Do not remove.
-    return cast(str, session.commit(message))
+    return cast(
+        str,
+        session.commit(
+            f"Backfill plan {plan}",
+            metadata={PLAN_METADATA_KEY: plan},
+            allow_empty=True,
+        ),
+    )
+
+
+def resumable_base(
+    repo: Repository, plan: str, *, branch: str = "backfill", base: str = "main"
+) -> str | None:
+    """The tip of `branch` to resume `plan` from, or None to initialize afresh.
+
+    `branch` is resumed only when its base commit (see record_plan) carries
+    `plan`, i.e. the same inventory, partition size, order and explicit regions
+    (see plan_id); the batch size may differ. A branch without any partition
+    commit yet (init failed part way) is deleted so it can be initialized again.
+
+    Raises
+    ------
+    ValueError
+        If `branch` was initialized for another plan, or holds partition
+        commits on a base that records no plan.
+    """
+    if branch not in repo.list_branches():
+        return None
+    tip = repo.lookup_branch(branch)
+    base_tip = repo.lookup_branch(base)
+    partitions = False
+    for snapshot in repo.ancestry(branch=branch):
+        if snapshot.id == base_tip:
+            break
+        metadata = snapshot.metadata or {}
+        if PARTITION_METADATA_KEY in metadata:
+            partitions = True
+        elif PLAN_METADATA_KEY in metadata:
+            if metadata[PLAN_METADATA_KEY] != plan:
+                raise ValueError(
+                    f"branch {branch!r} was initialized for backfill plan "
+                    f"{metadata[PLAN_METADATA_KEY]}, not {plan}; run with the "
+                    f"same inventory, partition size and order, or delete the "
+                    f"branch and start without resume"
+                )
+            return cast(str, tip)
+    if partitions:
+        raise ValueError(
+            f"branch {branch!r} records no backfill plan; delete the branch and "
+            f"start without resume"
+        )
+    repo.delete_branch(branch)
+    return None
 
 
 def promote(
@@ -48,3 +265,75 @@ def promote(
 ) -> None:
     """Fast-forward `target` to the current tip of `source`."""
     repo.reset_branch(target, repo.lookup_branch(source))
+
+
+def resolve_regions(
+    coordinate_values: np.ndarray, coordinates: Sequence[Any]
+) -> list[int]:
+    """Index of each of `coordinates` in the ascending `coordinate_values`.
+
+    One vectorized search for a whole partition, instead of a coordinate read
+    and lookup per file at write time. Raises ValueError if any coordinate is
+    not exactly one of the values, so misaligned files fail the plan.
+    """
+    values = np.asarray(coordinate_values)
+    wanted = np.asarray(coordinates)
+    if not len(wanted):
+        return []
+    index = np.searchsorted(values, wanted)
+    found = np.minimum(index, len(values) - 1)
+    misaligned = values[found] != wanted
+    if misaligned.any():
+        raise ValueError(
+            f"{int(misaligned.sum())} files match no coordinate value, e.g. "
+            f"{wanted[misaligned][:5].tolist()}"
+        )
+    return cast(list[int], index.tolist())
+
+
+def _write_one(
+    processor: VirtualizarrProcessor,
+    vds: xr.Dataset,
+    region: int | None,
+    fork: ForkSession,
+) -> None:
+    processor.write_backfill_datasets([vds], fork, None if region is None else [region])
+
+
+def write_batch(
+    processor: VirtualizarrProcessor,
+    vdss: list[xr.Dataset],
+    fork: ForkSession,
+    regions: list[int] | None = None,
+    *,
+    write_each: Callable[[int, Callable[[ForkSession], None]], None] | None = None,
+) -> None:
+    """Region-write a batch of parsed datasets into `fork` with one write.
+
+    If the batched write fails (files that do not concatenate, or whose
+    coordinates are not one contiguous region), the fork's changes are discarded
+    and each dataset is written on its own; an error there propagates. With
+    `regions`, the datasets go to those planned indices.
+
+    `write_each(i, write)`, if given, is called for each dataset of the fallback
+    in place of `write(fork)`, so the caller can retry or skip single writes, or
+    write them into a fork of its own.
+    """
+    try:
+        processor.write_backfill_datasets(vdss, fork, regions)
+        return
+    except Exception:
+        logger.warning(
+            "Batched region write of %d datasets failed, writing one at a time",
+            len(vdss),
+            exc_info=True,
+        )
+        fork.discard_changes()
+    for i, vds in enumerate(vdss):
+        write = partial(
+            _write_one, processor, vds, None if regions is None else regions[i]
+        )
+        if write_each is None:
+            write(fork)
+        else:
+            write_each(i, write)
@@ -0,0 +1,114 @@
+"""Process-level cache of the Processor and the Repository it opens.
+
+Lambda keeps module globals alive between invocations of a warm container, so a
+handler that looks its processor and repository up here pays for building the
+RepositoryConfig, virtual chunk containers and storage client (and for reading the
+repo config) once per container instead of once per invocation.
+
+Entries are invalidated explicitly with `invalidate()`, when the repository
+environment they were built from changes, and after `REPO_CACHE_TTL_SECONDS`
+(default 900) so that credentials resolved at open time are refreshed well before
+they expire. A TTL of 0 disables caching.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, TypeVar
+
+from icechunk import Repository
+
+P = TypeVar("P")
+
+DEFAULT_TTL_SECONDS = 900.0
+
+# The environment the reference Processor reads to open its repository (and to
+# configure its manifest cache). A change to any of these (a different test repo
+# path, a redeployed prefix) means the cached entries point at the wrong store.
+CONFIG_ENV = (
+    "ICECHUNK_BUCKET",
+    "ICECHUNK_PREFIX",
+    "ICECHUNK_REGION",
+    "ICECHUNK_LOCAL_PATH",
+    "EARTHDATA_SECRET_ARN",
+    "MANIFEST_CACHE",
+    "MANIFEST_CACHE_LOCAL_DIR",
+)
+
+
+def _fingerprint() -> tuple[str | None, ...]:
+    return tuple(os.environ.get(name) for name in CONFIG_ENV)
+
+
+@dataclass
+class _Entry:
+    processor: Any
+    fingerprint: tuple[str | None, ...]
+    created: float
+    repos: dict[str, Repository] = field(default_factory=dict)
+
+
+class RepositoryCache:
+    """Cache one processor per factory, and the repositories it opens."""
+
+    def __init__(self, ttl_seconds: float | None = None) -> None:
+        if ttl_seconds is None:
+            ttl_seconds = float(
+                os.environ.get("REPO_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)
+            )
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[Callable[[], Any], _Entry] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, factory: Callable[[], Any]) -> _Entry:
+        now = time.monotonic()
+        fingerprint = _fingerprint()
+        entry = self._entries.get(factory)
+        if (
+            entry is None
+            or entry.fingerprint != fingerprint
+            or now - entry.created >= self.ttl_seconds
+        ):
+            entry = _Entry(processor=factory(), fingerprint=fingerprint, created=now)
+            self._entries[factory] = entry
+        return entry
+
+    def processor(self, factory: Callable[[], P]) -> P:
+        """Return the cached processor built by `factory`, building it if needed."""
+        with self._lock:
+            processor: P = self._entry(factory).processor
+            return processor
+
+    def repository(self, factory: Callable[[], P], opener: str) -> tuple[P, Repository]:
+        """Return the cached processor and the repository its `opener` method
+        (e.g. ``"initialize_repo"`` or ``"open_backfill_repo"``) returns."""
+        with self._lock:
+            entry = self._entry(factory)
+            if opener not in entry.repos:
+                entry.repos[opener] = getattr(entry.processor, opener)()
+            processor: P = entry.processor
+            return processor, entry.repos[opener]
+
+    def invalidate(self) -> None:
+        """Drop every cached processor and repository."""
+        with self._lock:
+            self._entries.clear()
+
+
+_default = RepositoryCache()
+
+
+def get_processor(factory: Callable[[], P]) -> P:
+    """Return the process-wide cached processor built by `factory`."""
+    return _default.processor(factory)
+
+
+def get_repository(factory: Callable[[], P], opener: str) -> tuple[P, Repository]:
+    """Return the process-wide cached processor and repository."""
+    return _default.repository(factory, opener)
+
+
+def invalidate() -> None:
+    """Drop the process-wide cache, e.g. after a credential or storage error."""
+    _default.invalidate()
@@ -0,0 +1,177 @@
+"""Generic Icechunk helpers for forward (append-to-main) processing.
+
+Like backfill.py these are identical for every VirtualizarrProcessor
+implementation, so they live here rather than on the Protocol.
+"""
+
+import logging
+import pickle
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable
+
+import obstore
+import xarray as xr
+from icechunk import (
+    ConflictDetector,
+    ConflictError,
+    ConflictSolver,
+    RebaseFailedError,
+    Session,
+)
+from obstore.store import ObjectStore
+
+from virtualizarr_processor.sidecar import sidecar_store
+from virtualizarr_processor.typing import VirtualizarrProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt: int, *, base: float = 0.1, cap: float = 5.0) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)].
+
+    Concurrent consumers that lost the same race spread out instead of retrying
+    in lockstep and colliding again.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def commit_with_rebase(
+    session: Session,
+    commit: Callable[[Session], str],
+    *,
+    reapply: Callable[[], Session] | None = None,
+    max_attempts: int = 5,
+    solver: Callable[[], ConflictSolver] = ConflictDetector,
+    sleep: Callable[[float], None] = time.sleep,
+) -> str:
+    """Commit `session` with `commit`, recovering from lost branch-tip races.
+
+    When another writer moved the branch tip first, the session is rebased onto
+    the new tip with `solver` (by default a ConflictDetector, which only succeeds
+    if the other commit touched different nodes and chunks) and the commit is
+    retried after a jittered backoff.
+
+    Two appends along the same dimension always conflict — both resize the array
+    and write the same chunk indices — so a failed rebase falls back to
+    `reapply`, which must return a fresh session on the new tip with the batch's
+    writes redone (cheap when the parsed virtual datasets are kept). Without
+    `reapply`, or once `max_attempts` commits have failed, the conflict is
+    re-raised. Any error from `reapply` itself (a genuinely incompatible change,
+    e.g. a schema change on the tip) propagates unchanged.
+
+    Returns the new snapshot id.
+    """
+    attempt = 0
+    while True:
+        try:
+            return commit(session)
+        except ConflictError:
+            attempt += 1
+            if attempt >= max_attempts:
+                raise
+            logger.info("Commit lost the branch-tip race (attempt %d)", attempt)
+        sleep(backoff_delay(attempt))
+        try:
+            session.rebase(solver())
+        except RebaseFailedError:
+            if reapply is None:
+                raise
+            logger.info("Rebase conflicted, re-applying batch on the new tip")
+            session = reapply()
+
+
+def append_batch(
+    processor: VirtualizarrProcessor, vdss: list[xr.Dataset], session: Session
+) -> list[Exception | None]:
+    """Append a batch of parsed datasets with one batched write.
+
+    If the batched append fails (typically because the files are not
+    concatenable), the session's changes are discarded and each dataset is
+    appended on its own, so one odd file only costs the batching. Returns one
+    entry per dataset: None if it was appended, else the error that stopped it.
+    """
+    if not vdss:
+        return []
+    try:
+        processor.append_virtual_datasets(vdss, session)
+        return [None] * len(vdss)
+    except Exception:
+        logger.warning(
+            "Batched append of %d datasets failed, appending one at a time",
+            len(vdss),
+            exc_info=True,
+        )
+        session.discard_changes()
+    errors: list[Exception | None] = []
+    for vds in vdss:
+        try:
+            processor.append_virtual_dataset(vds, session)
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    return errors
+
+
+# Deferred commits: consumers stage their parsed batches here and a single
+# committer appends everything pending in one commit.
+STAGED_PREFIX = "pending/"
+FAILED_PREFIX = "failed/"
+
+
+@dataclass
+class StagedRecord:
+    """One parsed file waiting for the deferred committer."""
+
+    message_id: str
+    vds: xr.Dataset
+    key: str | None = None
+    etag: str | None = None
+
+
+def staging_store() -> ObjectStore | None:
+    """The reference staging location (the ``_forward_staging`` sidecar store)."""
+    return sidecar_store("_forward_staging")
+
+
+def stage_batch(
+    store: ObjectStore, records: list[StagedRecord], *, prefix: str = STAGED_PREFIX
+) -> str:
+    """Write a batch of parsed records as one pickled object and return its path.
+
+    Paths start with a millisecond timestamp, so listing them returns batches in
+    (approximately) the order they were staged.
+    """
+    path = f"{prefix}{int(time.time() * 1000):013d}-{uuid.uuid4().hex}.pkl"
+    obstore.put(store, path, pickle.dumps(records))
+    return path
+
+
+def list_staged(store: ObjectStore, *, limit: int | None = None) -> list[str]:
+    """Paths of the oldest staged batches, at most `limit` of them."""
+    paths = sorted(
+        meta["path"] for chunk in obstore.list(store, STAGED_PREFIX) for meta in chunk
+    )
+    return paths[:limit]
+
+
+def load_staged(store: ObjectStore, path: str) -> list[StagedRecord]:
+    """Read back a batch written by `stage_batch`."""
+    records: list[StagedRecord] = pickle.loads(bytes(obstore.get(store, path).bytes()))
+    return records
+
+
+def set_aside_staged(store: ObjectStore, path: str) -> str:
+    """Move a staged batch that cannot be read under FAILED_PREFIX, so it stops
+    blocking the committer, and return its new path."""
+    target = FAILED_PREFIX + path.removeprefix(STAGED_PREFIX)
+    obstore.rename(store, path, target)
+    return target
+
+
+def delete_staged(store: ObjectStore, paths: list[str]) -> None:
+    """Remove batches once the committer has landed (or set aside) their records."""
+    if paths:
+        obstore.delete(store, paths)
@@ -0,0 +1,103 @@
+"""Stage timings and counters as CloudWatch Embedded Metric Format (EMF) records.
+
+    with instrumentation.span("forward.parse", key=key):
+        vds = processor.parse_file(key)
+    instrumentation.count("forward.skipped", len(skipped))
+
+Each span or count prints one EMF JSON line to stdout. Lambda ships stdout to
+CloudWatch Logs, and CloudWatch turns those lines into metrics: one metric per
+stage name, in the METRICS_NAMESPACE namespace (default
+``VirtualizarrDataPipelines``), with the service name as the only dimension so
+the metric count stays bounded. Keyword arguments (file keys, batch sizes,
+partition ids) are written as properties of the record. They are searchable in
+Logs Insights but do not create metrics.
+
+Metrics are off unless METRICS_ENABLED is "true". When off, `span` returns one
+shared no-op context manager and `count` returns at once, so instrumenting a hot
+path costs a function call.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import AbstractContextManager, nullcontext
+from types import TracebackType
+from typing import Any
+
+DEFAULT_NAMESPACE = "VirtualizarrDataPipelines"
+
+_enabled = os.environ.get("METRICS_ENABLED", "false").lower() == "true"
+_NULL_SPAN: AbstractContextManager[None] = nullcontext()
+
+
+def enabled() -> bool:
+    """Whether spans and counts are emitted."""
+    return _enabled
+
+
+def set_enabled(value: bool) -> None:
+    """Turn emission on or off for this process (METRICS_ENABLED sets the default)."""
+    global _enabled
+    _enabled = value
+
+
+def emit(name: str, value: float, unit: str, properties: dict[str, Any]) -> None:
+    """Write one EMF record for metric `name` to stdout."""
+    service = os.environ.get("POWERTOOLS_SERVICE_NAME", "virtualizarr-data-pipelines")
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": os.environ.get("METRICS_NAMESPACE", DEFAULT_NAMESPACE),
+                    "Dimensions": [["service"]],
+                    "Metrics": [{"Name": name, "Unit": unit}],
+                }
+            ],
+        },
+        **properties,
+        "service": service,
+        name: value,
+    }
+    sys.stdout.write(json.dumps(record, default=str) + "\n")
+
+
+class _Span:
+    def __init__(self, name: str, properties: dict[str, Any]) -> None:
+        self.name = name
+        self.properties = properties
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        if exc_type is not None:
+            self.properties["error"] = exc_type.__name__
+        emit(self.name, elapsed_ms, "Milliseconds", self.properties)
+
+
+def span(name: str, **properties: Any) -> AbstractContextManager[None]:
+    """Time the enclosed block as metric `name` (milliseconds).
+
+    A block that raises is still timed, with the exception's type recorded in
+    the ``error`` property; the exception propagates.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, properties)
+
+
+def count(
+    name: str, value: float = 1, *, unit: str = "Count", **properties: Any
+) -> None:
+    """Record `value` for counter metric `name` (`unit` e.g. ``"Bytes"``)."""
+    if _enabled:
+        emit(name, value, unit, properties)
@@ -0,0 +1,212 @@
+"""Ingestion ledger: which source objects (key + ETag) are already in the store.
+
+SQS delivers at least once and a failed commit redelivers its whole batch, so
+without a record of what was ingested a redelivered file is appended again as a
+duplicate time step. The forward consumer checks this ledger before parsing and
+skips files an earlier commit already ingested.
+
+The ledger is a sidecar in the Icechunk bucket, written through obstore:
+
+- ``commits/<ms timestamp>-<snapshot id>.json`` — one small object per successful
+  forward commit, ``{"snapshot": ..., "entries": {key: etag}}``. Names are unique,
+  so concurrent consumers never contend, and the timestamp keeps them in list
+  order so a warm container only lists and reads objects newer than the last
+  ones it loaded.
+- ``checkpoint.json`` — the entries of older commit objects, folded together by
+  `IngestionLedger.compact` (run by the scheduled garbage collection) so a cold
+  container reads one object instead of one per commit. Compaction deletes the
+  commit objects it folds, so every refresh checks the checkpoint's ETag and
+  reloads it when it has changed; a container idle through a compaction still
+  sees the folded entries.
+
+The entry for a commit is written after the commit succeeds. If that write fails
+the files are in the store but not the ledger, and a later redelivery of them
+would be appended again, so the failure is logged loudly by the caller.
+
+In memory the ledger is a Bloom filter in front of a sorted index: a miss — the
+common case for new files — is answered by the filter alone, and a possible hit
+is confirmed with a binary search.
+"""
+
+import bisect
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Iterable
+
+import obstore
+from obstore.store import ObjectStore
+
+from virtualizarr_processor.sidecar import sidecar_store
+
+COMMITS_PREFIX = "commits/"
+CHECKPOINT = "checkpoint.json"
+# Commit objects are named when they are written, not when the commit happened,
+# and clocks differ between Lambdas; listing re-reads this far back so an object
+# that lands slightly out of order is still picked up.
+LOOKBACK_MS = 5 * 60 * 1000
+
+
+def _entry_id(key: str, etag: str) -> str:
+    return f"{key}\x00{etag}"
+
+
+def _name_ms(path: str) -> int:
+    return int(path.rsplit("/", 1)[-1].split("-", 1)[0])
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter using double hashing over one blake2b digest."""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001) -> None:
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item)
+        )
+
+
+class IngestionLedger:
+    """The set of ingested (key, ETag) pairs, backed by an object store."""
+
+    def __init__(self, store: ObjectStore, *, capacity: int = 1_000_000) -> None:
+        self.store = store
+        self._bloom = BloomFilter(capacity)
+        self._index: list[str] = []
+        self._loaded: set[str] = set()
+        self._through_ms = 0
+        self._checkpoint_etag: str | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _add(self, entries: dict[str, str]) -> None:
+        new: list[str] = []
+        for key, etag in entries.items():
+            entry = _entry_id(key, etag)
+            if entry in self._bloom and self._contains_entry(entry):
+                continue
+            self._bloom.add(entry)
+            new.append(entry)
+        if new:
+            # One sort per load rather than an insort per entry: a cold start
+            # loads a whole checkpoint at once.
+            self._index.extend(new)
+            self._index.sort()
+
+    def _contains_entry(self, entry: str) -> bool:
+        i = bisect.bisect_left(self._index, entry)
+        return i < len(self._index) and self._index[i] == entry
+
+    def _read_json(self, path: str) -> Any:
+        return json.loads(bytes(obstore.get(self.store, path).bytes()))
+
+    def refresh(self) -> int:
+        """Load commit objects written since the last refresh; returns how many."""
+        with self._lock:
+            self._refresh_checkpoint()
+            offset = None
+            if self._through_ms:
+                start = max(0, self._through_ms - LOOKBACK_MS)
+                offset = f"{COMMITS_PREFIX}{start:013d}"
+            loaded = 0
+            for chunk in obstore.list(self.store, COMMITS_PREFIX, offset=offset):
+                for meta in chunk:
+                    path = meta["path"]
+                    if path in self._loaded:
+                        continue
+                    self._add(self._read_json(path)["entries"])
+                    self._loaded.add(path)
+                    self._through_ms = max(self._through_ms, _name_ms(path))
+                    loaded += 1
+            return loaded
+
+    def _refresh_checkpoint(self) -> None:
+        """Load the checkpoint if it changed since this container last read it."""
+        try:
+            if obstore.head(self.store, CHECKPOINT)["e_tag"] == self._checkpoint_etag:
+                return
+            result = obstore.get(self.store, CHECKPOINT)
+        except FileNotFoundError:
+            return
+        checkpoint = json.loads(bytes(result.bytes()))
+        self._add(checkpoint["entries"])
+        self._through_ms = max(self._through_ms, checkpoint["through_ms"])
+        self._checkpoint_etag = result.meta["e_tag"]
+
+    def contains(self, key: str, etag: str) -> bool:
+        """Whether this exact version of `key` has already been ingested."""
+        entry = _entry_id(key, etag)
+        with self._lock:
+            return entry in self._bloom and self._contains_entry(entry)
+
+    def record(self, snapshot_id: str, entries: dict[str, str]) -> None:
+        """Persist the files (key -> ETag) a commit ingested, and remember them."""
+        if not entries:
+            return
+        path = f"{COMMITS_PREFIX}{int(time.time() * 1000):013d}-{snapshot_id}.json"
+        body = json.dumps({"snapshot": snapshot_id, "entries": entries})
+        obstore.put(self.store, path, body.encode())
+        with self._lock:
+            self._add(entries)
+            self._loaded.add(path)
+
+    def compact(self) -> int:
+        """Fold commit objects older than the lookback window into the checkpoint
+        and delete them. Returns how many commit objects were folded."""
+        try:
+            checkpoint = self._read_json(CHECKPOINT)
+        except FileNotFoundError:
+            checkpoint = {"through_ms": 0, "entries": {}}
+        cutoff = int(time.time() * 1000) - LOOKBACK_MS
+        folded: list[str] = []
+        for chunk in obstore.list(self.store, COMMITS_PREFIX):
+            for meta in chunk:
+                path = meta["path"]
+                if _name_ms(path) >= cutoff:
+                    continue
+                checkpoint["entries"].update(self._read_json(path)["entries"])
+                checkpoint["through_ms"] = max(checkpoint["through_ms"], _name_ms(path))
+                folded.append(path)
+        if folded:
+            obstore.put(self.store, CHECKPOINT, json.dumps(checkpoint).encode())
+            obstore.delete(self.store, folded)
+        return len(folded)
+
+
+def ledger_store_from_env() -> ObjectStore | None:
+    """The reference ledger location (the ``_ingestion_ledger`` sidecar store), or
+    None (no ledger) when INGESTION_LEDGER is not enabled."""
+    if os.environ.get("INGESTION_LEDGER", "false").lower() != "true":
+        return None
+    return sidecar_store("_ingestion_ledger")
+
+
+_ledger: IngestionLedger | None = None
+
+
+def get_ledger() -> IngestionLedger | None:
+    """The process-wide ledger, created once per warm container (None if disabled)."""
+    global _ledger
+    if _ledger is None:
+        store = ledger_store_from_env()
+        if store is not None:
+            _ledger = IngestionLedger(store)
+    return _ledger
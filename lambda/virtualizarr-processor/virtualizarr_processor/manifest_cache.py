@@ -0,0 +1,170 @@
+"""Cache of parsed per-file virtual datasets, keyed by source key and ETag.
+
+Parsing a source file (the HDF5/NetCDF header scan over the network) is by far
+the most expensive step of ingesting it, and a re-run backfill partition or a
+redelivered SQS batch parses the same, unchanged files again. A parsed virtual
+dataset is small — the ManifestArrays hold chunk references, not data — so it is
+cached as a zlib-compressed pickle:
+
+- in the ``_manifest_cache`` sidecar store in the Icechunk bucket, shared by every
+  Lambda, and
+- optionally in a local directory (e.g. under ``/tmp``) in front of it, which a
+  warm container reads without a network round trip. The local tier is bounded by
+  size; the least recently used entries are evicted first.
+
+Entries are keyed by the source ETag as well as the key, so a file that is
+replaced in place is parsed again rather than served stale. The cache is an
+optimization only: any error reading or writing it is logged and the file is
+parsed as if it were not there.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import zlib
+from pathlib import Path
+from typing import Callable
+
+import obstore
+import xarray as xr
+from obstore.store import ObjectStore
+
+from virtualizarr_processor.sidecar import sidecar_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _entry_name(key: str, etag: str) -> str:
+    digest = hashlib.sha256(f"{key}\x00{etag}".encode()).hexdigest()
+    return f"{digest[:2]}/{digest}.pkl.z"
+
+
+def dumps(vds: xr.Dataset) -> bytes:
+    """Serialize a parsed virtual dataset to the cache's binary format."""
+    return zlib.compress(pickle.dumps(vds, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def loads(data: bytes) -> xr.Dataset:
+    """Inverse of `dumps`."""
+    vds: xr.Dataset = pickle.loads(zlib.decompress(data))
+    return vds
+
+
+class ManifestCache:
+    """A two-tier (local directory, object store) parsed-dataset cache."""
+
+    def __init__(
+        self,
+        store: ObjectStore | None = None,
+        *,
+        local_dir: str | None = None,
+        local_max_bytes: int = DEFAULT_LOCAL_MAX_BYTES,
+    ) -> None:
+        self.store = store
+        self.local_dir = Path(local_dir) if local_dir else None
+        self.local_max_bytes = local_max_bytes
+        self._lock = threading.Lock()
+        if self.local_dir is not None:
+            self.local_dir.mkdir(parents=True, exist_ok=True)
+
+    def _local_get(self, name: str) -> bytes | None:
+        if self.local_dir is None:
+            return None
+        path = self.local_dir / name
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # Mark as recently used for eviction.
+        os.utime(path)
+        return data
+
+    def _local_put(self, name: str, data: bytes) -> None:
+        if self.local_dir is None or len(data) > self.local_max_bytes:
+            return
+        path = self.local_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+        self._evict()
+
+    def _evict(self) -> None:
+        if self.local_dir is None:
+            return
+        with self._lock:
+            entries = [
+                (p.stat().st_mtime, p.stat().st_size, p)
+                for p in self.local_dir.glob("*/*.pkl.z")
+            ]
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries, key=lambda e: e[0]):
+                if total <= self.local_max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+    def get(self, key: str, etag: str) -> xr.Dataset | None:
+        """The cached dataset for this version of `key`, or None."""
+        name = _entry_name(key, etag)
+        try:
+            data = self._local_get(name)
+            if data is None and self.store is not None:
+                try:
+                    data = bytes(obstore.get(self.store, name).bytes())
+                except FileNotFoundError:
+                    return None
+                self._local_put(name, data)
+            return None if data is None else loads(data)
+        except Exception:
+            logger.warning("Manifest cache read failed for %s", key, exc_info=True)
+            return None
+
+    def put(self, key: str, etag: str, vds: xr.Dataset) -> None:
+        """Cache the parsed dataset for this version of `key`."""
+        name = _entry_name(key, etag)
+        try:
+            data = dumps(vds)
+            self._local_put(name, data)
+            if self.store is not None:
+                obstore.put(self.store, name, data)
+        except Exception:
+            logger.warning("Manifest cache write failed for %s", key, exc_info=True)
+
+    def get_or_parse(
+        self, key: str, etag: str | None, parse: Callable[[], xr.Dataset]
+    ) -> xr.Dataset:
+        """Return the cached dataset, or `parse()` it and cache the result.
+
+        Without an ETag there is no way to tell a replaced file from the cached
+        one, so the file is always parsed and nothing is cached.
+        """
+        if etag is None:
+            return parse()
+        vds = self.get(key, etag)
+        if vds is None:
+            vds = parse()
+            self.put(key, etag, vds)
+        return vds
+
+
+def from_env() -> ManifestCache | None:
+    """The reference cache configuration, or None when MANIFEST_CACHE is off.
+
+    MANIFEST_CACHE=true enables the shared tier (the ``_manifest_cache`` sidecar
+    store); MANIFEST_CACHE_LOCAL_DIR adds the local tier, bounded by
+    MANIFEST_CACHE_LOCAL_MAX_BYTES.
+    """
+    if os.environ.get("MANIFEST_CACHE", "false").lower() != "true":
+        return None
+    return ManifestCache(
+        sidecar_store("_manifest_cache"),
+        local_dir=os.environ.get("MANIFEST_CACHE_LOCAL_DIR"),
+        local_max_bytes=int(
+            os.environ.get("MANIFEST_CACHE_LOCAL_MAX_BYTES", DEFAULT_LOCAL_MAX_BYTES)
+        ),
+    )
@@ -4,7 +4,7 @@ import tempfile
 from copy import Error
 from datetime import datetime
 from itertools import islice
-from typing import cast
+from typing import Callable, cast
 
 import icechunk
 import numpy as np
@@ -17,6 +17,8 @@ from zarr.codecs import BytesCodec
 from zarr.core.dtype import parse_data_type
 from zarr.core.metadata import ArrayV3Metadata
 
+from virtualizarr_processor import manifest_cache
+
 logger = logging.getLogger(__name__)
 
 CHUNK_DIR = os.path.realpath(tempfile.gettempdir())
@@ -26,6 +28,27 @@ CHUNK_DIRECTORY_URL_PREFIX = f"file://{CHUNK_DIR}/"
 BACKFILL_N, BACKFILL_Y, BACKFILL_X = 6, 2, 3
 BACKFILL_DTYPE = np.dtype("int32")
 
+# Stand-in source version for the synthetic files, which never change.
+SYNTHETIC_ETAG = "synthetic-v1"
+
+
+def concat_along_time(vdss: list[xr.Dataset]) -> xr.Dataset:
+    """Concatenate per-file virtual datasets along `time` in memory.
+
+    Raises if the files are not concatenable (differing variables, chunk shapes
+    or codecs); callers fall back to writing them one at a time.
+    """
+    if len(vdss) == 1:
+        return vdss[0]
+    return xr.concat(
+        vdss,
+        dim="time",
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+        combine_attrs="override",
+    )
+
 
 def synthetic_vds(date: str) -> xr.Dataset:
     filepath = f"{CHUNK_DIR}/data_chunk"
@@ -72,6 +95,25 @@ def synthetic_vds(date: str) -> xr.Dataset:
 
 
 class Processor:
+    def __init__(self) -> None:
+        # Parsed-dataset cache shared by parse_file and parse_backfill_file;
+        # None unless MANIFEST_CACHE is enabled.
+        self.manifest_cache = manifest_cache.from_env()
+
+    def source_etag(self, file_key: str) -> str | None:
+        # A real processor returns the source object's ETag, e.g.
+        # obstore.head(store, file_key)["e_tag"]; None disables caching for it.
+        return SYNTHETIC_ETAG
+
+    def _cached_parse(
+        self, cache_key: str, file_key: str, parse: Callable[[], xr.Dataset]
+    ) -> xr.Dataset:
+        if self.manifest_cache is None:
+            return parse()
+        return self.manifest_cache.get_or_parse(
+            cache_key, self.source_etag(file_key), parse
+        )
+
     def initialize_repo(self) -> Repository:
         chunk_store = icechunk.local_filesystem_store(CHUNK_DIR)
         storage = icechunk.in_memory_storage()
@@ -102,15 +144,25 @@ class Processor:
     def process_file(self, file_key: str, session: Session) -> bool:
         result = False
         try:
-            vds = synthetic_vds(file_key)
-            vds.vz.to_icechunk(
-                session.store, append_dim="time", validate_containers=False
-            )
+            self.append_virtual_dataset(self.parse_file(file_key), session)
             result = True
         except Error:
             result = False
         return result
 
+    def parse_file(self, file_key: str) -> xr.Dataset:
+        return self._cached_parse(
+            f"forward/{file_key}", file_key, lambda: synthetic_vds(file_key)
+        )
+
+    def append_virtual_dataset(self, vds: xr.Dataset, session: Session) -> None:
+        vds.vz.to_icechunk(session.store, append_dim="time", validate_containers=False)
+
+    def append_virtual_datasets(self, vdss: list[xr.Dataset], session: Session) -> None:
+        # One append for the whole batch: the arrays are resized and the
+        # coordinates written once instead of once per file.
+        self.append_virtual_dataset(concat_along_time(vdss), session)
+
     def commit_processed_files(self, session: Session) -> str:
         snapshot = session.commit(message=f"Append to {session.snapshot_id}")
         return str(snapshot)
@@ -136,7 +188,7 @@ class Processor:
             dtype="int64",
             dimension_names=("time",),
         )
-        time_coord[:] = np.arange(BACKFILL_N)
+        time_coord[:] = self.backfill_coordinate_values()
         return cast(str, session.commit("Initialize backfill shape"))
 
     def open_backfill_repo(self) -> Repository:
@@ -203,14 +255,60 @@ class Processor:
             coords={"time": ("time", [t])},
         )
 
-    def process_backfill_file(self, file_key: str, fork: ForkSession) -> bool:
-        try:
-            # Synthetic keys are the integer time index as a string ("0".."5").
-            # A real processor parses the source file for its own coordinate.
-            t = int(file_key)
-            self._backfill_slice_vds(t).vz.to_icechunk(
+    def backfill_coordinate_values(self) -> np.ndarray:
+        return np.arange(BACKFILL_N)
+
+    def backfill_coordinate(self, file_key: str) -> int:
+        # Synthetic keys are the time index itself.
+        return int(file_key)
+
+    def parse_backfill_file(self, file_key: str) -> xr.Dataset:
+        # Synthetic keys are the integer time index as a string ("0".."5").
+        # A real processor parses the source file for its own coordinate. The
+        # reference builds different datasets for forward and backfill keys, so
+        # it caches them under separate names.
+        return self._cached_parse(
+            f"backfill/{file_key}",
+            file_key,
+            lambda: self._backfill_slice_vds(int(file_key)),
+        )
+
+    def write_backfill_datasets(
+        self,
+        vdss: list[xr.Dataset],
+        fork: ForkSession,
+        regions: list[int] | None = None,
+    ) -> None:
+        if regions is None:
+            # Sorted by time so a batch of adjacent files is one contiguous region
+            # and region="auto" resolves it with a single coordinate lookup.
+            vdss = sorted(vdss, key=lambda vds: vds["time"].values[0])
+            concat_along_time(vdss).vz.to_icechunk(
                 fork.store, region="auto", validate_containers=False
             )
+            return
+        order = sorted(range(len(vdss)), key=regions.__getitem__)
+        start = regions[order[0]]
+        if [regions[i] for i in order] != list(range(start, start + len(order))):
+            raise ValueError(f"regions {sorted(regions)} are not contiguous")
+        # The planned region replaces the coordinate lookup. The coordinate is
+        # dropped: writing part of the `time` array would rewrite its single
+        # chunk in every fork.
+        concat_along_time([vdss[i] for i in order]).drop_vars("time").vz.to_icechunk(
+            fork.store,
+            region={"time": slice(start, start + len(order))},
+            validate_containers=False,
+        )
+
+    def process_backfill_file(
+        self, file_key: str, fork: ForkSession, region: int | None = None
+    ) -> bool:
+        try:
+            self.write_backfill_datasets(
+                [self.parse_backfill_file(file_key)],
+                fork,
+                None if region is None else [region],
+            )
             return True
         except Exception:
             # Catch parse/region errors and I/O failures from to_icechunk, but log
@@ -0,0 +1,27 @@
+"""Object stores for pipeline state kept next to the Icechunk repository.
+
+The ingestion ledger and staged forward batches are small objects that live in
+the Icechunk bucket under their own top-level prefix (``<name>/<ICECHUNK_PREFIX>``),
+so they are covered by the same bucket grants and never collide with the
+repository's own keys. Without a bucket (tests, local runs) they live in a
+directory beside ICECHUNK_LOCAL_PATH.
+"""
+
+import os
+
+from obstore.store import LocalStore, ObjectStore, S3Store
+
+
+def sidecar_store(name: str) -> ObjectStore | None:
+    """The store for sidecar `name`, or None if no repository location is set."""
+    bucket = os.environ.get("ICECHUNK_BUCKET")
+    if bucket:
+        prefix = "/".join(p for p in (name, os.environ.get("ICECHUNK_PREFIX")) if p)
+        region = os.environ.get("ICECHUNK_REGION")
+        if region:
+            return S3Store(bucket, prefix=prefix, region=region)
+        return S3Store(bucket, prefix=prefix)
+    local_path = os.environ.get("ICECHUNK_LOCAL_PATH")
+    if local_path:
+        return LocalStore(f"{local_path.rstrip('/')}{name}", mkdir=True)
+    return None
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Protocol, runtime_checkable
+from typing import Any, Protocol, runtime_checkable
 
 import icechunk
+import numpy as np
+import xarray as xr
 from icechunk import ForkSession, Repository, Session
 
 
@@ -56,9 +58,58 @@ class VirtualizarrProcessor(Protocol):
         """
         ...
 
+    def parse_file(self, file_key: str) -> xr.Dataset:
+        """
+        Uses a Virtualizarr parser to parse the file and return its virtual
+        dataset without touching the Icechunk store.
+
+        This is the expensive, I/O bound half of process_file. The forward
+        consumer may call it for several files concurrently from worker threads,
+        so it must not write to a shared Session.
+
+        Parameters
+        ----------
+            file_key: The full key path to the source file.
+        Returns
+        -------
+        xr.Dataset
+            The virtual dataset for the file.
+        """
+        ...
+
+    def append_virtual_dataset(self, vds: xr.Dataset, session: Session) -> None:
+        """
+        Append a virtual dataset returned by parse_file to the Icechunk store.
+
+        Calls are always made serially, in batch order, against one Session.
+
+        Parameters
+        ----------
+            vds: A virtual dataset returned by parse_file.
+            session: The Icechunk writable Session to use for adding the file.
+        """
+        ...
+
+    def append_virtual_datasets(self, vdss: list[xr.Dataset], session: Session) -> None:
+        """
+        Append a whole batch of virtual datasets returned by parse_file with a
+        single write, concatenating them along the append dimension in memory
+        so array metadata is resized and coordinates are written once.
+
+        Should raise if the datasets cannot be concatenated; the caller then
+        falls back to append_virtual_dataset per dataset.
+
+        Parameters
+        ----------
+            vdss: Virtual datasets returned by parse_file, in append order.
+            session: The Icechunk writable Session to use for adding the files.
+        """
+        ...
+
     def commit_processed_files(self, session: Session) -> str:
         """
-        Commits the updates made by one or multiple calls to process_file
+        Commits the updates made by one or multiple calls to process_file or
+        append_virtual_dataset
 
         Parameters
         ----------
@@ -113,7 +164,87 @@ class VirtualizarrProcessor(Protocol):
         """
         ...
 
-    def process_backfill_file(self, file_key: str, fork: ForkSession) -> bool:
+    def backfill_coordinate_values(self) -> np.ndarray:
+        """
+        Return the full, ascending coordinate array along the backfill's append
+        dimension, as initialize_backfill_store writes it.
+
+        Used by the partition step to plan explicit regions: each file's
+        backfill_coordinate is looked up in these values once, so workers need
+        no per-file coordinate reads.
+
+        Returns
+        -------
+        np.ndarray
+            The coordinate values, sorted ascending.
+        """
+        ...
+
+    def backfill_coordinate(self, file_key: str) -> Any:
+        """
+        Return the position of a source file along the backfill's append
+        dimension (e.g. its time step), used to sort the inventory when
+        partitioning in coordinate order.
+
+        Called once per inventory key by the partition step, so it should be
+        cheap: derive the value from the key (e.g. a date in the file name)
+        rather than opening the file. Values only need to be mutually
+        comparable, unless regions are planned explicitly: they must then
+        equal the file's value in backfill_coordinate_values.
+
+        Parameters
+        ----------
+            file_key: The full key path to the source file.
+        Returns
+        -------
+        Any
+            A sortable coordinate value.
+        """
+        ...
+
+    def parse_backfill_file(self, file_key: str) -> xr.Dataset:
+        """
+        Parse a source file into the per-file virtual dataset that
+        process_backfill_file would write, without writing it.
+
+        Parameters
+        ----------
+            file_key: The full key path to the source file.
+        Returns
+        -------
+        xr.Dataset
+            The virtual dataset, carrying the coordinates that place it.
+        """
+        ...
+
+    def write_backfill_datasets(
+        self,
+        vdss: list[xr.Dataset],
+        fork: ForkSession,
+        regions: list[int] | None = None,
+    ) -> None:
+        """
+        Write a batch of virtual datasets returned by parse_backfill_file into
+        the fork with a single region write, concatenating them along the
+        append dimension in memory. Must NOT commit.
+
+        Should raise if the datasets cannot be concatenated or do not form one
+        contiguous region; the caller then falls back to writing them one at a
+        time (a list of one).
+
+        Parameters
+        ----------
+            vdss: Virtual datasets returned by parse_backfill_file.
+            fork: An Icechunk ForkSession to write references into.
+            regions: Each dataset's planned index along the append dimension.
+                When given, write to those explicit regions instead of
+                resolving them from the coordinates (`region="auto"`).
+        """
+        ...
+
+    def process_backfill_file(
+        self, file_key: str, fork: ForkSession, region: int | None = None
+    ) -> bool:
         """
         Write a per-file virtual dataset into the fork's store via
         `vz.to_icechunk(store, region="auto")`, which aligns the dataset to its
@@ -123,6 +254,8 @@ class VirtualizarrProcessor(Protocol):
         ----------
             file_key: The full key path to the source file.
             fork: An Icechunk ForkSession to write references into.
+            region: The file's planned index along the append dimension; when
+                given, written there without the coordinate lookup.
         Returns
         -------
         bool
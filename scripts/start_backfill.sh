@@ -7,7 +7,11 @@
 # inventory URI.
 #
 # Usage:
-#   scripts/start_backfill.sh <execution-name> <inventory-uri>
+#   scripts/start_backfill.sh <execution-name> <inventory-uri> [--resume]
+#
+# --resume continues a failed run: the existing `backfill` branch is kept and
+# partitions it already has a commit for are skipped. Use a new execution name
+# and the same inventory (and partition settings) as the failed run.
 #
 # Example:
 #   scripts/start_backfill.sh gpm-backfill-test-2yr \
@@ -22,14 +26,19 @@
 set -euo pipefail
 
 usage() {
-  echo "Usage: $0 <execution-name> <inventory-uri>" >&2
+  echo "Usage: $0 <execution-name> <inventory-uri> [--resume]" >&2
   echo "  e.g. $0 gpm-backfill-test-2yr s3://bucket/inventory/gpm_2yr.json" >&2
   exit 2
 }
 
-[ $# -eq 2 ] || usage
+[ $# -eq 2 ] || [ $# -eq 3 ] || usage
 EXECUTION_NAME="$1"
 INVENTORY_URI="$2"
+RESUME=false
+if [ $# -eq 3 ]; then
+  [ "$3" = "--resume" ] || usage
+  RESUME=true
+fi
 
 # Load STACK_NAME / ACCOUNT_REGION defaults from .env if present (without
 # clobbering values already exported in the environment).
@@ -70,4 +79,4 @@ aws stepfunctions start-execution \
   "${REGION_ARGS[@]}" \
   --state-machine-arn "$STATE_MACHINE_ARN" \
   --name "$EXECUTION_NAME" \
-  --input "{\"inventory_uri\": \"$INVENTORY_URI\"}"
+  --input "{\"inventory_uri\": \"$INVENTORY_URI\", \"resume\": $RESUME}"
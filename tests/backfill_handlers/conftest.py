@@ -25,3 +25,11 @@ def lambda_context() -> MagicMock:
     any attribute (matching the existing tests/test_handler.py convention).
     """
     return MagicMock()
+
+
+@pytest.fixture(autouse=True)
+def _reset_shared_fork_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Fork URIs repeat across tests; keep the worker's warm cache per test."""
+    from backfill_handlers import worker
+
+    monkeypatch.setattr(worker, "_shared_fork", None)
@@ -0,0 +1,50 @@
+import pathlib
+from unittest.mock import MagicMock
+
+import pytest
+from backfill_handlers import batch_worker, fork, fork_store, init, inventory
+
+
+def test_batch_items_picks_the_batch_of_the_array_index(s3_bucket: str) -> None:
+    manifest_uri = f"s3://{s3_bucket}/run/partitions/0.json"
+    inventory.write_manifest(manifest_uri, ["0", "1", "2", "3", "4"])
+    batches_uri = f"s3://{s3_bucket}/run/partitions/0.batches.json"
+    inventory.write_manifest(batches_uri, [{"file_keys": ["0", "1"]}])
+
+    assert batch_worker.batch_items(2, manifest_uri=manifest_uri, batch_size=2) == ["4"]
+    assert batch_worker.batch_items(3, manifest_uri=manifest_uri, batch_size=2) == []
+    assert batch_worker.batch_items(0, batches_uri=batches_uri) == ["0", "1"]
+    # Surplus children of a two-child array job.
+    assert batch_worker.batch_items(1, batches_uri=batches_uri) == []
+
+
+def test_batch_worker_writes_child_fork(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    init.handler({}, lambda_context)
+    manifest_uri = f"s3://{s3_bucket}/run/partitions/0.json"
+    inventory.write_manifest(manifest_uri, ["0", "1", "2"])
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": manifest_uri,
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+    monkeypatch.setenv("MANIFEST_URI", manifest_uri)
+    monkeypatch.setenv("BATCH_SIZE", "2")
+    monkeypatch.setenv("FORK_IN_URI", fork_result["fork_in_uri"])
+    monkeypatch.setenv("FORKS_OUT_PREFIX", fork_result["forks_out_prefix"])
+
+    for index in ["0", "1", "2"]:
+        monkeypatch.setenv("AWS_BATCH_JOB_ARRAY_INDEX", index)
+        batch_worker.main()
+
+    # Index 2 is past the last batch and writes nothing.
+    assert len(fork_store.list_forks(fork_result["forks_out_prefix"])) == 2
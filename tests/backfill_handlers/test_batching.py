@@ -0,0 +1,68 @@
+import json
+
+import boto3
+import pytest
+from backfill_handlers import batching
+
+
+def test_fit_recovers_a_linear_cost() -> None:
+    model = batching.fit([(100, 2.0), (200, 3.0), (400, 5.0)])
+    assert model.per_byte == pytest.approx(0.01)
+    assert model.intercept == pytest.approx(1.0)
+    assert model.estimate(1000) == pytest.approx(11.0)
+    # Unknown sizes fall back to the sample mean.
+    assert model.estimate(None) == pytest.approx(10 / 3)
+
+
+def test_fit_without_distinct_sizes_uses_the_mean() -> None:
+    model = batching.fit([(None, 1.0), (100, 3.0)])
+    assert model.per_byte == 0.0
+    assert model.estimate(10**9) == pytest.approx(2.0)
+    with pytest.raises(ValueError):
+        batching.fit([])
+
+
+def test_pack_balances_cost_and_keeps_order() -> None:
+    model = batching.CostModel(intercept=0.0, per_byte=1.0, mean_seconds=1.0, samples=2)
+    entries = [("a", 5), ("b", 5), ("c", 8), ("d", 1), ("e", 1), ("f", 20), ("g", 1)]
+
+    batches = batching.pack(entries, model, target_seconds=10, max_items=2)
+
+    assert [b["file_keys"] for b in batches] == [
+        ["a", "b"],
+        ["c", "d"],
+        ["e"],
+        # Over the target on its own, so it gets a batch of its own.
+        ["f"],
+        ["g"],
+    ]
+    assert batches[0]["sizes"] == [5, 5]
+    assert batches[0]["estimated_seconds"] == 10
+
+
+def test_sample_timings_spreads_across_sizes_and_skips_failures() -> None:
+    parsed: list[str] = []
+
+    def parse(key: str) -> None:
+        parsed.append(key)
+        if key == "big":
+            raise OSError("unreadable")
+
+    entries = [("big", 900), ("small", 1), ("mid", 50), ("other", 60), ("none", None)]
+    samples = batching.sample_timings(parse, entries, 3)
+
+    assert parsed == ["small", "other", "none"]
+    assert [size for size, _ in samples] == [1, 60, None]
+    assert batching.sample_timings(parse, entries, 2)[0][0] == 1
+
+
+def test_write_batches(s3_bucket: str) -> None:
+    batching.write_batches(
+        f"s3://{s3_bucket}/run/partitions/0.batches.json",
+        [{"file_keys": ["a"], "sizes": [1], "estimated_seconds": 1.0}],
+        boto3.client("s3", region_name="us-east-1"),
+    )
+    body = boto3.client("s3", region_name="us-east-1").get_object(
+        Bucket=s3_bucket, Key="run/partitions/0.batches.json"
+    )["Body"]
+    assert json.loads(body.read())[0]["file_keys"] == ["a"]
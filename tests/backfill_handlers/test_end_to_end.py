@@ -1,4 +1,5 @@
 import pathlib
+from typing import Any
 from unittest.mock import MagicMock
 
 import boto3
@@ -9,6 +10,28 @@ from backfill_handlers import fork, init, inventory, partition, promote, reduce,
 from virtualizarr_processor.processor import Processor
 
 
+def _run_partition(part: dict[str, str], lambda_context: MagicMock) -> None:
+    """fork -> workers (one per file) -> reduce, as the outer Map iteration does."""
+    fork_result = fork.handler(part, lambda_context)
+    for file_key in inventory.read_manifest(part["manifest_uri"]):
+        worker.handler(
+            {
+                "fork_in_uri": fork_result["fork_in_uri"],
+                "forks_out_prefix": fork_result["forks_out_prefix"],
+                "file_keys": [file_key],
+            },
+            lambda_context,
+        )
+    reduce.handler(
+        {
+            "partition_id": part["partition_id"],
+            "plan_id": part["plan_id"],
+            "forks_out_prefix": fork_result["forks_out_prefix"],
+        },
+        lambda_context,
+    )
+
+
 def test_full_backfill_chain(
     s3_bucket: str,
     tmp_path: pathlib.Path,
@@ -37,33 +60,65 @@ def test_full_backfill_chain(
 
     # serial over partitions: fork -> workers (one per file) -> reduce
     for part in parts:
-        fork_result = fork.handler(
+        _run_partition(part, lambda_context)
+
+    # promote and verify all 6 slices on main
+    promote.handler({}, lambda_context)
+    repo = Processor().open_backfill_repo()
+    arr = zarr.open_group(repo.readonly_session("main").store, mode="r")["foo"]
+    assert (np.asarray(arr[:]) == np.arange(6)[:, None, None]).all()
+
+
+def test_resumed_run_skips_committed_partitions(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    boto3.client("s3", region_name="us-east-1").put_object(
+        Bucket=s3_bucket, Key="inv.json", Body=b'["0", "1", "2", "3", "4", "5"]'
+    )
+
+    def run_partitions(
+        run: str, resume: bool, size: int = 2
+    ) -> tuple[str, list[dict[str, str]]]:
+        result = partition.handler(
             {
-                "partition_id": part["partition_id"],
-                "manifest_uri": part["manifest_uri"],
-                "run_prefix": run_prefix,
+                "inventory_uri": f"s3://{s3_bucket}/inv.json",
+                "run_prefix": f"s3://{s3_bucket}/{run}/",
+                "partition_size": size,
+                "run_options": {"resume": resume},
             },
             lambda_context,
         )
-        for file_key in inventory.read_manifest(part["manifest_uri"]):
-            worker.handler(
-                {
-                    "fork_in_uri": fork_result["fork_in_uri"],
-                    "forks_out_prefix": fork_result["forks_out_prefix"],
-                    "file_keys": [file_key],
-                },
-                lambda_context,
-            )
-        reduce.handler(
-            {
-                "partition_id": part["partition_id"],
-                "forks_out_prefix": fork_result["forks_out_prefix"],
-            },
-            lambda_context,
+        return result["plan_id"], list(result["partitions"])
+
+    def run_init(plan: str, resume: bool) -> dict[str, Any]:
+        return init.handler(
+            {"run_options": {"resume": resume}, "plan_id": plan}, lambda_context
         )
 
-    # promote and verify all 6 slices on main
+    # The first run commits partition 0 and then fails.
+    plan, parts = run_partitions("run-1", resume=False)
+    run_init(plan, resume=False)
+    _run_partition(parts[0], lambda_context)
+
+    # A resumed run with another partition size does not reuse the branch.
+    other, _ = run_partitions("run-other", resume=True, size=3)
+    with pytest.raises(ValueError, match="initialized for backfill plan"):
+        run_init(other, resume=True)
+
+    # The resumed run reuses the branch and only runs partitions 1 and 2.
+    plan, parts = run_partitions("run-2", resume=True)
+    assert [p["partition_id"] for p in parts] == ["1", "2"]
+    assert run_init(plan, resume=True)["resumed"]
+    for part in parts:
+        _run_partition(part, lambda_context)
+
     promote.handler({}, lambda_context)
     repo = Processor().open_backfill_repo()
     arr = zarr.open_group(repo.readonly_session("main").store, mode="r")["foo"]
-    assert (np.asarray(arr[:]) == np.arange(6)[:, None, None]).all()
+    assert (np.asarray(arr[:, 0, 0]) == np.arange(6)).all()
+    assert run_partitions("run-3", resume=True)[1] == []
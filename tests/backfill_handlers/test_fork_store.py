@@ -1,3 +1,4 @@
+import boto3
 from backfill_handlers import fork_store
 
 
@@ -17,3 +18,35 @@ def test_list_forks_returns_all_uris_under_prefix(s3_bucket: str) -> None:
 
 def test_list_forks_returns_empty_list_for_unknown_prefix(s3_bucket: str) -> None:
     assert fork_store.list_forks(f"s3://{s3_bucket}/forks/nonexistent/") == []
+
+
+def test_iter_forks_yields_every_blob_with_bounded_concurrency(s3_bucket: str) -> None:
+    prefix = f"s3://{s3_bucket}/forks/0/out/"
+    for i in range(7):
+        fork_store.save_fork(f"{prefix}{i}.pkl", str(i).encode())
+    uris = fork_store.list_forks(prefix)
+    assert sorted(fork_store.iter_forks(uris, concurrency=3)) == [
+        str(i).encode() for i in range(7)
+    ]
+
+
+def test_save_fork_compresses_and_records_raw_size(s3_bucket: str) -> None:
+    uri = f"s3://{s3_bucket}/forks/0/out/big.pkl"
+    data = b"fork-state " * 100_000
+
+    stored = fork_store.save_fork(uri, data)
+
+    head = boto3.client("s3").head_object(Bucket=s3_bucket, Key="forks/0/out/big.pkl")
+    assert stored == head["ContentLength"] < len(data) // 10
+    assert head["Metadata"]["raw-size"] == str(len(data))
+    assert fork_store.load_fork(uri) == data
+    assert fork_store.list_fork_sizes(f"s3://{s3_bucket}/forks/0/out/") == {uri: stored}
+
+
+def test_load_fork_reads_uncompressed_blobs(s3_bucket: str) -> None:
+    boto3.client("s3").put_object(
+        Bucket=s3_bucket, Key="forks/0/in/fork.pkl", Body=b"\x80\x05plain"
+    )
+    assert fork_store.load_fork(f"s3://{s3_bucket}/forks/0/in/fork.pkl") == (
+        b"\x80\x05plain"
+    )
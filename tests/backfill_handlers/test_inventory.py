@@ -1,4 +1,10 @@
+import gzip
+import io
+import json
+
 import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
 from backfill_handlers import inventory
 
 
@@ -13,3 +19,53 @@ def test_write_then_read_manifest_round_trips(s3_bucket: str) -> None:
     uri = f"s3://{s3_bucket}/partitions/0.json"
     inventory.write_manifest(uri, ["k1", "k2"])
     assert inventory.read_manifest(uri) == ["k1", "k2"]
+
+
+def _put(bucket: str, key: str, body: bytes) -> str:
+    boto3.client("s3", region_name="us-east-1").put_object(
+        Bucket=bucket, Key=key, Body=body
+    )
+    return f"s3://{bucket}/{key}"
+
+
+def test_streams_jsonl_and_gzipped_csv(s3_bucket: str) -> None:
+    jsonl = _put(s3_bucket, "inv.jsonl", b'"a"\n{"key": "b"}\n\n"c"\n')
+    assert list(inventory.iter_inventory(jsonl)) == ["a", "b", "c"]
+
+    csv_gz = _put(s3_bucket, "inv.csv.gz", gzip.compress(b"size,Key\n1,a\n2,b\n"))
+    assert inventory.read_inventory(csv_gz) == ["a", "b"]
+
+
+def test_streams_parquet(s3_bucket: str) -> None:
+    buf = io.BytesIO()
+    pq.write_table(pa.table({"bucket": ["x", "x"], "key": ["a", "b"]}), buf)
+    uri = _put(s3_bucket, "inv.parquet", buf.getvalue())
+    assert inventory.read_inventory(uri) == ["a", "b"]
+
+
+def test_reads_s3_inventory_manifest(s3_bucket: str) -> None:
+    # S3 Inventory CSV data files have no header and URL-encode the keys.
+    _put(s3_bucket, "inv/data/1.csv.gz", gzip.compress(b'"src","a%2F1.nc","10"\n'))
+    _put(s3_bucket, "inv/data/2.csv.gz", gzip.compress(b'"src","b+2.nc","20"\n'))
+    manifest = {
+        "sourceBucket": "src",
+        "destinationBucket": f"arn:aws:s3:::{s3_bucket}",
+        "fileFormat": "CSV",
+        "fileSchema": "Bucket, Key, Size",
+        "files": [{"key": "inv/data/1.csv.gz"}, {"key": "inv/data/2.csv.gz"}],
+    }
+    uri = _put(s3_bucket, "inv/manifest.json", json.dumps(manifest).encode())
+    assert inventory.read_inventory(uri) == ["a/1.nc", "b 2.nc"]
+
+
+def test_entries_carry_sizes_where_the_inventory_has_them(s3_bucket: str) -> None:
+    jsonl = _put(s3_bucket, "inv.jsonl", b'{"key": "a", "size": 10}\n"b"\n')
+    assert list(inventory.iter_inventory_entries(jsonl)) == [("a", 10), ("b", None)]
+
+    csv_gz = _put(s3_bucket, "inv.csv.gz", gzip.compress(b"size,Key\n1,a\n,b\n"))
+    assert list(inventory.iter_inventory_entries(csv_gz)) == [("a", 1), ("b", None)]
+
+    buf = io.BytesIO()
+    pq.write_table(pa.table({"key": ["a", "b"], "Size": [5, 7]}), buf)
+    parquet = _put(s3_bucket, "inv.parquet", buf.getvalue())
+    assert list(inventory.iter_inventory_entries(parquet)) == [("a", 5), ("b", 7)]
@@ -0,0 +1,75 @@
+import json
+import pathlib
+
+import icechunk
+import numpy as np
+import pytest
+import zarr
+from backfill_handlers import local
+from virtualizarr_processor import backfill
+from virtualizarr_processor.processor import Processor
+
+
+def test_local_runner_backfills_with_worker_processes(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    inv = tmp_path / "inv.jsonl"
+    inv.write_text("\n".join(json.dumps(str(k)) for k in [5, 1, 4, 0, 3, 2]))
+
+    summary = local.run_backfill(
+        str(inv),
+        partition_size=4,
+        batch_size=2,
+        workers=2,
+        order="coordinate",
+        explicit_regions=True,
+        work_dir=str(tmp_path / "work"),
+    )
+
+    assert summary["partitions"] == 2
+    assert summary["files"] == 6
+    repo = Processor().open_backfill_repo()
+    arr = zarr.open_group(repo.readonly_session("main").store, mode="r")["foo"]
+    assert (np.asarray(arr[:, 0, 0]) == np.arange(6)).all()
+    # Commits carry the pipeline's plan metadata, so runs can be resumed.
+    plan = backfill.plan_id(str(inv), 4, "coordinate", explicit_regions=True)
+    assert backfill.committed_partitions(repo, plan) == {"0", "1"}
+
+
+def test_local_runner_resumes_after_committed_partitions(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    inv = tmp_path / "inv.json"
+    inv.write_text(json.dumps([str(k) for k in range(6)]))
+    repo: icechunk.Repository = Processor().open_backfill_repo()
+    Processor().initialize_backfill_store(repo)
+    backfill.record_plan(repo, backfill.plan_id(str(inv), 3, "inventory"))
+
+    # The branch initialized above is reused rather than initialized again.
+    local.main(
+        [str(inv), "--partition-size", "3", "--workers", "1", "--resume"]
+        + ["--no-promote"]
+    )
+
+    # Explicit regions make another plan, so that resume is refused.
+    with pytest.raises(ValueError, match="initialized for backfill plan"):
+        local.run_backfill(
+            str(inv),
+            partition_size=3,
+            batch_size=10,
+            workers=1,
+            explicit_regions=True,
+            resume=True,
+        )
+    # The batch size is not part of the plan.
+    summary = local.run_backfill(
+        str(inv), partition_size=3, batch_size=2, workers=1, resume=True
+    )
+    assert summary["partitions"] == 0
+    assert summary["skipped_partitions"] == 2
+    arr = zarr.open_group(repo.readonly_session("main").store, mode="r")["foo"]
+    assert (np.asarray(arr[:, 0, 0]) == np.arange(6)).all()
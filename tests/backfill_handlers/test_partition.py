@@ -1,7 +1,15 @@
+import json
+import pathlib
+import time
+from typing import Any
 from unittest.mock import MagicMock
 
 import boto3
+import pytest
 from backfill_handlers import inventory, partition
+from backfill_handlers.batching import CostModel
+from virtualizarr_processor import cache
+from virtualizarr_processor.processor import Processor
 
 
 def test_partition_splits_inventory_into_manifests(
@@ -28,3 +36,164 @@ def test_partition_splits_inventory_into_manifests(
     assert parts[2]["manifest_key"] == "run/partitions/2.json"
     # run_prefix is carried on each item so the fork handler can use it downstream.
     assert parts[0]["run_prefix"] == event["run_prefix"]
+    # The same list is written to S3 for a Distributed outer Map to read.
+    assert result["partition_count"] == 3
+    assert result["partitions_key"] == "run/partitions.json"
+    assert inventory.read_manifest(result["partitions_uri"]) == parts
+
+
+def test_partition_streams_without_inline_list(
+    s3_bucket: str, lambda_context: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("MANIFEST_WRITE_CONCURRENCY", "2")
+    keys = "".join(f"{i}\n" for i in range(25)).encode()
+    boto3.client("s3", region_name="us-east-1").put_object(
+        Bucket=s3_bucket, Key="inv.jsonl", Body=keys
+    )
+    event = {
+        "inventory_uri": f"s3://{s3_bucket}/inv.jsonl",
+        "run_prefix": f"s3://{s3_bucket}/run/",
+        "partition_size": 2,
+        "inline_partitions": False,
+    }
+
+    result = partition.handler(event, lambda_context)
+
+    assert "partitions" not in result
+    assert result["partition_count"] == 13
+    parts = inventory.read_manifest(result["partitions_uri"])
+    manifests = [inventory.read_manifest(p["manifest_uri"]) for p in parts]
+    assert [k for m in manifests for k in m] == [str(i) for i in range(25)]
+
+
+def test_partition_coordinate_order_makes_contiguous_partitions(
+    s3_bucket: str, lambda_context: MagicMock
+) -> None:
+    boto3.client("s3", region_name="us-east-1").put_object(
+        Bucket=s3_bucket, Key="inv.json", Body=b'["10", "3", "0", "2", "1"]'
+    )
+    event = {
+        "inventory_uri": f"s3://{s3_bucket}/inv.json",
+        "run_prefix": f"s3://{s3_bucket}/run/",
+        "partition_size": 2,
+        "order": "coordinate",
+    }
+
+    parts = partition.handler(event, lambda_context)["partitions"]
+
+    manifests = [inventory.read_manifest(p["manifest_uri"]) for p in parts]
+    # Numeric (coordinate) order, not the inventory's or lexical order.
+    assert manifests == [["0", "1"], ["2", "3"], ["10"]]
+
+
+def test_partition_writes_cost_balanced_batches(
+    s3_bucket: str, lambda_context: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    inv = "\n".join(
+        json.dumps({"key": str(i), "size": size})
+        for i, size in enumerate([1, 1, 1, 6, 1, 1])
+    )
+    boto3.client("s3", region_name="us-east-1").put_object(
+        Bucket=s3_bucket, Key="inv.jsonl", Body=inv.encode()
+    )
+    fits: list[list[inventory.Entry]] = []
+
+    def fit_cost_model(entries: list[inventory.Entry], sample: int) -> CostModel:
+        fits.append(entries)
+        return CostModel(intercept=0.0, per_byte=1.0, mean_seconds=1.0, samples=sample)
+
+    monkeypatch.setattr(partition, "fit_cost_model", fit_cost_model)
+    event = {
+        "inventory_uri": f"s3://{s3_bucket}/inv.jsonl",
+        "run_prefix": f"s3://{s3_bucket}/run/",
+        "partition_size": 4,
+        "batching": {"target_seconds": 3, "max_items": 10, "sample": 2},
+    }
+
+    result = partition.handler(event, lambda_context)
+
+    parts = result["partitions"]
+    assert parts[0]["batches_key"] == "run/partitions/0.batches.json"
+    batches = inventory.read_manifest(f"s3://{s3_bucket}/run/partitions/0.batches.json")
+    assert [b["file_keys"] for b in batches] == [["0", "1", "2"], ["3"]]
+    # The model is fitted once, on the first partition.
+    assert len(fits) == 1
+    assert result["cost_model"]["per_byte"] == 1.0
+    assert (
+        "batches_key"
+        not in partition.handler({**event, "batching": None}, lambda_context)[
+            "partitions"
+        ][0]
+    )
+
+
+def test_partition_plans_explicit_regions(
+    s3_bucket: str, lambda_context: MagicMock
+) -> None:
+    client = boto3.client("s3", region_name="us-east-1")
+    client.put_object(Bucket=s3_bucket, Key="inv.json", Body=b'["3", "1", "5"]')
+    event = {
+        "inventory_uri": f"s3://{s3_bucket}/inv.json",
+        "run_prefix": f"s3://{s3_bucket}/run/",
+        "partition_size": 2,
+        "explicit_regions": True,
+    }
+
+    parts = partition.handler(event, lambda_context)["partitions"]
+
+    assert inventory.read_manifest(parts[0]["manifest_uri"]) == [
+        {"key": "3", "region": 3},
+        {"key": "1", "region": 1},
+    ]
+    # A key outside the store's coordinates fails the plan.
+    client.put_object(Bucket=s3_bucket, Key="inv.json", Body=b'["3", "9"]')
+    with pytest.raises(ValueError, match="match no coordinate"):
+        partition.handler(event, lambda_context)
+
+
+def test_partition_sizes_worker_array_jobs(
+    s3_bucket: str, lambda_context: MagicMock
+) -> None:
+    keys = json.dumps([str(i) for i in range(25)]).encode()
+    boto3.client("s3", region_name="us-east-1").put_object(
+        Bucket=s3_bucket, Key="inv.json", Body=keys
+    )
+    event = {
+        "inventory_uri": f"s3://{s3_bucket}/inv.json",
+        "run_prefix": f"s3://{s3_bucket}/run/",
+        "partition_size": 21,
+        "array_batch_size": 5,
+    }
+
+    parts = partition.handler(event, lambda_context)["partitions"]
+
+    # ceil(21 / 5) children, then the two-child minimum for the last 4 files.
+    assert [p["array_size"] for p in parts] == [5, 2]
+    with pytest.raises(ValueError, match="array job limit"):
+        partition.array_size(partition.MAX_ARRAY_SIZE + 1)
+
+
+def test_cost_model_times_real_parses_on_a_warm_cache(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("MANIFEST_CACHE", "true")
+    slice_vds = Processor._backfill_slice_vds
+
+    def slow_parse(self: Processor, index: int) -> Any:
+        time.sleep(0.05)
+        return slice_vds(self, index)
+
+    monkeypatch.setattr(Processor, "_backfill_slice_vds", slow_parse)
+    entries: list[inventory.Entry] = [(str(i), None) for i in range(4)]
+    # An earlier run left every sampled file in the manifest cache.
+    processor = cache.get_processor(Processor)
+    for key, _ in entries:
+        processor.parse_backfill_file(key)
+
+    model = partition.fit_cost_model(entries, 4)
+
+    assert model.samples == 4
+    assert model.mean_seconds >= 0.05
+    assert processor.manifest_cache is not None
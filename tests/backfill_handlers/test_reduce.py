@@ -2,7 +2,17 @@ import pathlib
 from unittest.mock import MagicMock
 
 import pytest
-from backfill_handlers import fork, init, reduce, worker
+from backfill_handlers import (
+    combine,
+    fork,
+    fork_store,
+    init,
+    inventory,
+    quarantine,
+    reduce,
+    worker,
+)
+from virtualizarr_processor.processor import Processor
 
 
 def test_reduce_commits_all_worker_forks(
@@ -30,9 +40,121 @@ def test_reduce_commits_all_worker_forks(
     worker.handler({**base, "file_keys": ["3", "4", "5"]}, lambda_context)
 
     result = reduce.handler(
-        {"partition_id": "0", "forks_out_prefix": fork_result["forks_out_prefix"]},
+        {
+            "partition_id": "0",
+            "plan_id": "plan",
+            "forks_out_prefix": fork_result["forks_out_prefix"],
+        },
         lambda_context,
     )
 
     assert isinstance(result["tip"], str) and result["tip"]
     assert result["partition_id"] == "0"
+
+
+def test_tree_reduce_commits_combined_forks(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    init.handler({}, lambda_context)
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": f"s3://{s3_bucket}/run/partitions/0.json",
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+    base = {
+        "fork_in_uri": fork_result["fork_in_uri"],
+        "forks_out_prefix": fork_result["forks_out_prefix"],
+    }
+    for key in range(6):
+        worker.handler({**base, "file_keys": [str(key)]}, lambda_context)
+
+    # What the combine Map hands each combiner: S3 listing entries in batches.
+    children = fork_store.list_forks(fork_result["forks_out_prefix"])
+    objects = [{"Key": uri.split("/", 3)[3]} for uri in children]
+    assert objects[0]["Key"].startswith(fork_result["forks_out_key_prefix"])
+    for group in (objects[:4], objects[4:]):
+        combine.handler(
+            {
+                "fork_objects": group,
+                "forks_out_prefix": fork_result["forks_out_prefix"],
+                "combined_prefix": fork_result["combined_prefix"],
+            },
+            lambda_context,
+        )
+    assert len(fork_store.list_forks(fork_result["combined_prefix"])) == 2
+
+    result = reduce.handler(
+        {
+            "partition_id": "0",
+            "plan_id": "plan",
+            "forks_out_prefix": fork_result["combined_prefix"],
+        },
+        lambda_context,
+    )
+
+    assert isinstance(result["tip"], str) and result["tip"]
+
+
+@pytest.mark.parametrize("budget, commits", [(0.5, True), (0.2, False)])
+def test_reduce_applies_failure_budget(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+    budget: float,
+    commits: bool,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("BACKFILL_FILE_MAX_ATTEMPTS", "1")
+    manifest_uri = f"s3://{s3_bucket}/run/partitions/0.json"
+    inventory.write_manifest(manifest_uri, ["0", "1", "bad"])
+    init.handler({}, lambda_context)
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": manifest_uri,
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+    # Retried: the second run overwrites the first one's quarantine manifest.
+    for _ in range(2):
+        worker.handler(
+            {
+                "fork_in_uri": fork_result["fork_in_uri"],
+                "forks_out_prefix": fork_result["forks_out_prefix"],
+                "quarantine_prefix": fork_result["quarantine_prefix"],
+                "file_keys": ["0", "1", "bad"],
+            },
+            lambda_context,
+        )
+    assert len(fork_store.list_forks(fork_result["quarantine_prefix"])) == 1
+    # A requeued batch listing the same key again is not counted twice.
+    quarantine.write_quarantine(fork_result["quarantine_prefix"], {"bad": "error"})
+    event = {
+        "partition_id": "0",
+        "plan_id": "plan",
+        "forks_out_prefix": fork_result["forks_out_prefix"],
+        "quarantine_prefix": fork_result["quarantine_prefix"],
+        "manifest_uri": manifest_uri,
+        "failure_budget": budget,
+    }
+
+    if not commits:
+        with pytest.raises(RuntimeError, match="failure budget"):
+            reduce.handler(event, lambda_context)
+        return
+    reduce.handler(event, lambda_context)
+    repo = Processor().open_backfill_repo()
+    tip = next(iter(repo.ancestry(branch="backfill")))
+    assert tip.metadata["backfill_skipped_files"] == 1
+    assert tip.metadata["backfill_quarantine"] == fork_result["quarantine_prefix"]
@@ -0,0 +1,116 @@
+import pathlib
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from backfill_handlers import (
+    fork,
+    init,
+    inventory,
+    partition,
+    promote,
+    reduce,
+    report,
+    worker,
+)
+
+
+def test_run_report_collects_a_record_per_step(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    run_prefix = f"s3://{s3_bucket}/run/"
+    boto3.client("s3", region_name="us-east-1").put_object(
+        Bucket=s3_bucket, Key="inv.json", Body=b'["0", "1", "2", "3"]'
+    )
+
+    result = partition.handler(
+        {
+            "inventory_uri": f"s3://{s3_bucket}/inv.json",
+            "run_prefix": run_prefix,
+            "partition_size": 2,
+            "stats": True,
+        },
+        lambda_context,
+    )
+    stats_prefix = result["stats_prefix"]
+    assert stats_prefix == f"{run_prefix}stats/"
+    init.handler({"stats_prefix": stats_prefix}, lambda_context)
+    for part in result["partitions"]:
+        assert part["stats_prefix"] == stats_prefix
+        fork_result = fork.handler(part, lambda_context)
+        for file_key in inventory.read_manifest(part["manifest_uri"]):
+            worker.handler(
+                {
+                    "fork_in_uri": fork_result["fork_in_uri"],
+                    "forks_out_prefix": fork_result["forks_out_prefix"],
+                    "file_keys": [file_key],
+                    "stats_prefix": stats_prefix,
+                    "partition_id": part["partition_id"],
+                },
+                lambda_context,
+            )
+        reduce.handler(
+            {
+                "partition_id": part["partition_id"],
+                "plan_id": part["plan_id"],
+                "forks_out_prefix": fork_result["forks_out_prefix"],
+                "stats_prefix": stats_prefix,
+            },
+            lambda_context,
+        )
+    promote.handler({"stats_prefix": stats_prefix}, lambda_context)
+
+    report_uri = f"{run_prefix}report.parquet"
+    out = report.handler(
+        {"stats_prefix": stats_prefix, "report_uri": report_uri}, lambda_context
+    )
+
+    # partition, init, promote, and per partition a fork, two workers, a reduce.
+    assert out["records"] == 3 + 2 * 4
+    assert out["files"] == 4
+    records = report.read_report(report_uri)
+    workers = [r for r in records if r["stage"] == "worker"]
+    assert sorted(k for r in workers for k in r["keys"]) == ["0", "1", "2", "3"]
+    assert all(r["fork_bytes"] > 0 and r["write_seconds"] >= 0 for r in workers)
+    # A failed run is summarized from its records directly.
+    summary = report.summarize(report.read_report(run_prefix))
+    assert summary["files"] == 4
+    assert summary["partitions"]["count"] == 2
+    assert summary["stages"]["worker"]["count"] == 4
+
+
+def test_summarize_lists_straggler_batches() -> None:
+    records = [
+        {
+            "stage": "worker",
+            "partition_id": "0",
+            "started": 0.0,
+            "seconds": 1.0,
+            "files": 2,
+            "keys": [f"{i}a", f"{i}b"],
+        }
+        for i in range(9)
+    ] + [
+        {
+            "stage": "worker",
+            "partition_id": "1",
+            "started": 0.0,
+            "seconds": 10.0,
+            "files": 2,
+            "keys": ["slow", "slower"],
+        }
+    ]
+
+    summary = report.summarize(records, straggler_factor=3.0)
+
+    assert summary["wall_seconds"] == 10.0
+    assert summary["files_per_second"] == 2.0
+    assert summary["stages"]["worker"]["p50"] == 1.0
+    assert summary["stages"]["worker"]["max"] == 10.0
+    assert summary["partitions"]["slowest"] == "1"
+    assert [s["keys"] for s in summary["stragglers"]] == [["slow", "slower"]]
@@ -1,8 +1,19 @@
 import pathlib
+import pickle
+from typing import Any
 from unittest.mock import MagicMock
 
 import pytest
-from backfill_handlers import fork, fork_store, init, worker
+from backfill_handlers import (
+    fork,
+    fork_store,
+    init,
+    inventory,
+    quarantine,
+    reduce,
+    worker,
+)
+from virtualizarr_processor.processor import Processor
 
 
 def test_worker_writes_child_fork(
@@ -33,3 +44,404 @@ def test_worker_writes_child_fork(
     assert result["child_fork_uri"].startswith(fork_result["forks_out_prefix"])
     assert len(fork_store.load_fork(result["child_fork_uri"])) > 0
     assert len(fork_store.list_forks(fork_result["forks_out_prefix"])) == 1
+
+
+def test_worker_batch_writes_child_fork(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("BATCH_WRITES", "true")
+    init.handler({}, lambda_context)
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": f"s3://{s3_bucket}/run/partitions/0.json",
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+
+    result = worker.handler(
+        {
+            "fork_in_uri": fork_result["fork_in_uri"],
+            "forks_out_prefix": fork_result["forks_out_prefix"],
+            "file_keys": ["1", "0", "2"],
+        },
+        lambda_context,
+    )
+
+    child = pickle.loads(fork_store.load_fork(result["child_fork_uri"]))
+    assert sorted(child.status().updated_chunks["/foo"]) == [
+        [0, 0, 0],
+        [1, 0, 0],
+        [2, 0, 0],
+    ]
+
+
+def test_with_retries_retries_until_success() -> None:
+    outcomes = iter([False, ValueError("throttled"), True])
+
+    def attempt() -> bool:
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    delays: list[float] = []
+    assert worker.with_retries("k", attempt, max_attempts=3, sleep=delays.append)
+    assert len(delays) == 2
+
+
+def test_worker_quarantines_failed_files_and_keeps_the_rest(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("BACKFILL_FILE_MAX_ATTEMPTS", "1")
+    init.handler({}, lambda_context)
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": f"s3://{s3_bucket}/run/partitions/0.json",
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+    event = {
+        "fork_in_uri": fork_result["fork_in_uri"],
+        "forks_out_prefix": fork_result["forks_out_prefix"],
+        "file_keys": ["0", "not-a-granule", "2"],
+    }
+
+    with pytest.raises(RuntimeError, match="not-a-granule"):
+        worker.handler(event, lambda_context)
+
+    quarantine_prefix = fork_result["quarantine_prefix"]
+    result = worker.handler(
+        {**event, "quarantine_prefix": quarantine_prefix}, lambda_context
+    )
+
+    assert result["quarantine_uri"].startswith(quarantine_prefix)
+    assert [e["key"] for e in quarantine.read_quarantine(quarantine_prefix)] == [
+        "not-a-granule"
+    ]
+    child = pickle.loads(fork_store.load_fork(result["child_fork_uri"]))
+    assert sorted(child.status().updated_chunks["/foo"]) == [[0, 0, 0], [2, 0, 0]]
+
+
+def test_split_lanes_makes_contiguous_slices() -> None:
+    keys = [str(k) for k in range(7)]
+    assert worker.split_lanes(keys, 3) == [["0", "1", "2"], ["3", "4"], ["5", "6"]]
+    assert worker.split_lanes(keys[:2], 4) == [["0"], ["1"]]
+    assert worker.split_lanes([], 4) == [[]]
+
+
+@pytest.mark.parametrize("batch_writes", ["false", "true"])
+def test_worker_lanes_merge_into_one_child_fork(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+    batch_writes: str,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("WORKER_LANES", "3")
+    monkeypatch.setenv("BATCH_WRITES", batch_writes)
+    init.handler({}, lambda_context)
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": f"s3://{s3_bucket}/run/partitions/0.json",
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+
+    result = worker.handler(
+        {
+            "fork_in_uri": fork_result["fork_in_uri"],
+            "forks_out_prefix": fork_result["forks_out_prefix"],
+            "file_keys": ["0", "1", "2", "3", "4", "5"],
+        },
+        lambda_context,
+    )
+
+    assert len(fork_store.list_forks(fork_result["forks_out_prefix"])) == 1
+    child = pickle.loads(fork_store.load_fork(result["child_fork_uri"]))
+    assert sorted(child.status().updated_chunks["/foo"]) == [
+        [t, 0, 0] for t in range(6)
+    ]
+
+
+def test_warm_worker_reuses_shared_fork_until_it_changes(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    init.handler({}, lambda_context)
+    part = {
+        "partition_id": "0",
+        "manifest_uri": f"s3://{s3_bucket}/run/partitions/0.json",
+        "run_prefix": f"s3://{s3_bucket}/run/",
+    }
+    fork_result = fork.handler(part, lambda_context)
+    event = {
+        "fork_in_uri": fork_result["fork_in_uri"],
+        "forks_out_prefix": fork_result["forks_out_prefix"],
+    }
+    loads = MagicMock(side_effect=fork_store.load_fork)
+    monkeypatch.setattr(fork_store, "load_fork", loads)
+
+    worker.handler({**event, "file_keys": ["0"]}, lambda_context)
+    worker.handler({**event, "file_keys": ["1"]}, lambda_context)
+    assert loads.call_count == 1
+
+    # After a commit a re-run fork step writes a fork with a new base; the new
+    # ETag invalidates the cache.
+    reduce.handler({"partition_id": "0", "plan_id": "plan", **event}, lambda_context)
+    fork.handler(part, lambda_context)
+    loads.reset_mock()
+    worker.handler({**event, "file_keys": ["2"]}, lambda_context)
+    assert loads.call_count == 1
+
+
+def test_worker_uses_inline_fork_without_reading_s3(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("FORK_INLINE_MAX_BYTES", "131072")
+    init.handler({}, lambda_context)
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": f"s3://{s3_bucket}/run/partitions/0.json",
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+    assert fork_result["fork_inline"]
+    monkeypatch.setattr(fork_store, "load_fork", MagicMock(side_effect=AssertionError))
+    monkeypatch.setattr(fork_store, "fork_etag", MagicMock(side_effect=AssertionError))
+
+    result = worker.handler(
+        {
+            "fork_in_uri": fork_result["fork_in_uri"],
+            "fork_inline": fork_result["fork_inline"],
+            "forks_out_prefix": fork_result["forks_out_prefix"],
+            "file_keys": ["0"],
+        },
+        lambda_context,
+    )
+
+    assert result["child_fork_uri"].startswith(fork_result["forks_out_prefix"])
+
+
+@pytest.mark.parametrize("batch_writes", ["false", "true"])
+def test_worker_hands_back_keys_near_the_deadline(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+    batch_writes: str,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("WORKER_TIME_RESERVE_SECONDS", "60")
+    monkeypatch.setenv("BATCH_WRITES", batch_writes)
+    init.handler({}, lambda_context)
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": f"s3://{s3_bucket}/run/partitions/0.json",
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+    event = {
+        "fork_in_uri": fork_result["fork_in_uri"],
+        "forks_out_prefix": fork_result["forks_out_prefix"],
+        "file_keys": ["0", "1", "2"],
+    }
+
+    # 30 s left: under the reserve, so only the first file is written.
+    lambda_context.get_remaining_time_in_millis.return_value = 30_000
+    result = worker.handler(event, lambda_context)
+
+    assert result["unprocessed_keys"] == ["1", "2"]
+    child = pickle.loads(fork_store.load_fork(result["child_fork_uri"]))
+    assert sorted(child.status().updated_chunks["/foo"]) == [[0, 0, 0]]
+
+    lambda_context.get_remaining_time_in_millis.return_value = 600_000
+    rest = worker.handler({**event, "file_keys": ["1", "2"]}, lambda_context)
+
+    assert rest["unprocessed_keys"] == []
+    child = pickle.loads(fork_store.load_fork(rest["child_fork_uri"]))
+    assert sorted(child.status().updated_chunks["/foo"]) == [[1, 0, 0], [2, 0, 0]]
+
+
+@pytest.mark.parametrize("batch_writes", ["false", "true"])
+def test_worker_writes_planned_regions(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+    batch_writes: str,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("BATCH_WRITES", batch_writes)
+    init.handler({}, lambda_context)
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": f"s3://{s3_bucket}/run/partitions/0.json",
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+
+    result = worker.handler(
+        {
+            "fork_in_uri": fork_result["fork_in_uri"],
+            "forks_out_prefix": fork_result["forks_out_prefix"],
+            "file_keys": [{"key": "2", "region": 2}, {"key": "1", "region": 1}],
+        },
+        lambda_context,
+    )
+
+    child = pickle.loads(fork_store.load_fork(result["child_fork_uri"]))
+    assert child.status().updated_chunks == {"/foo": [[1, 0, 0], [2, 0, 0]]}
+
+
+def test_batch_write_fallback_quarantines_files_that_fail_to_write(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("BATCH_WRITES", "true")
+    monkeypatch.setenv("BACKFILL_FILE_MAX_ATTEMPTS", "2")
+    init.handler({}, lambda_context)
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": f"s3://{s3_bucket}/run/partitions/0.json",
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+    # File "1" parses but its write always fails, failing the batched write too.
+    parsed: dict[str, Any] = {}
+    parse = Processor.parse_backfill_file
+    write = Processor.write_backfill_datasets
+    attempts: list[int] = []
+
+    def parse_and_remember(self: Processor, file_key: str) -> Any:
+        parsed[file_key] = parse(self, file_key)
+        return parsed[file_key]
+
+    def failing_write(
+        self: Processor, vdss: list[Any], fork: Any, regions: Any = None
+    ) -> None:
+        if any(vds is parsed["1"] for vds in vdss):
+            attempts.append(len(vdss))
+            if len(vdss) == 1:
+                # A partial write: the file's chunk lands before the error.
+                write(self, vdss, fork, regions)
+            raise ValueError("unwritable")
+        write(self, vdss, fork, regions)
+
+    monkeypatch.setattr(Processor, "parse_backfill_file", parse_and_remember)
+    monkeypatch.setattr(Processor, "write_backfill_datasets", failing_write)
+    quarantine_prefix = fork_result["quarantine_prefix"]
+
+    result = worker.handler(
+        {
+            "fork_in_uri": fork_result["fork_in_uri"],
+            "forks_out_prefix": fork_result["forks_out_prefix"],
+            "file_keys": ["0", "1", "2"],
+            "quarantine_prefix": quarantine_prefix,
+        },
+        lambda_context,
+    )
+
+    # One batched attempt, then two attempts of the file's own write.
+    assert attempts == [3, 1, 1]
+    assert [e["key"] for e in quarantine.read_quarantine(quarantine_prefix)] == ["1"]
+    child = pickle.loads(fork_store.load_fork(result["child_fork_uri"]))
+    assert sorted(child.status().updated_chunks["/foo"]) == [[0, 0, 0], [2, 0, 0]]
+
+
+def test_partially_written_failed_file_reaches_no_commit(
+    s3_bucket: str,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    lambda_context: MagicMock,
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("BACKFILL_FILE_MAX_ATTEMPTS", "2")
+    manifest_uri = f"s3://{s3_bucket}/run/partitions/0.json"
+    inventory.write_manifest(manifest_uri, ["0", "1", "2"])
+    base = init.handler({}, lambda_context)["base_snapshot"]
+    fork_result = fork.handler(
+        {
+            "partition_id": "0",
+            "manifest_uri": manifest_uri,
+            "run_prefix": f"s3://{s3_bucket}/run/",
+        },
+        lambda_context,
+    )
+    process = Processor.process_backfill_file
+
+    def partial_process(
+        self: Processor, file_key: str, fork: Any, region: Any = None
+    ) -> bool:
+        # File "1" writes its chunk and then fails, on every attempt.
+        if file_key == "1":
+            process(self, file_key, fork, region)
+            raise OSError("connection reset")
+        return process(self, file_key, fork, region)
+
+    monkeypatch.setattr(Processor, "process_backfill_file", partial_process)
+    worker.handler(
+        {
+            "fork_in_uri": fork_result["fork_in_uri"],
+            "forks_out_prefix": fork_result["forks_out_prefix"],
+            "quarantine_prefix": fork_result["quarantine_prefix"],
+            "file_keys": ["0", "1", "2"],
+        },
+        lambda_context,
+    )
+    reduce.handler(
+        {
+            "partition_id": "0",
+            "plan_id": "plan",
+            "forks_out_prefix": fork_result["forks_out_prefix"],
+            "quarantine_prefix": fork_result["quarantine_prefix"],
+            "manifest_uri": manifest_uri,
+            "failure_budget": 0.5,
+        },
+        lambda_context,
+    )
+
+    repo = Processor().open_backfill_repo()
+    diff = repo.diff(from_snapshot_id=base, to_branch="backfill")
+    assert sorted(diff.updated_chunks["/foo"]) == [[0, 0, 0], [2, 0, 0]]
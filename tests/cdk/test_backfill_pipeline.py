@@ -1,4 +1,8 @@
+import json
+from typing import Any
+
 import aws_cdk as cdk
+import aws_cdk.aws_batch as batch
 import aws_cdk.aws_s3 as s3
 from aws_cdk.assertions import Match, Template
 from stack_constructs.backfill_pipeline import BackfillPipeline
@@ -16,6 +20,7 @@ def _template() -> Template:
         stack,
         "Backfill",
         icechunk_bucket=bucket,
+        icechunk_prefix=None,
         data_bucket_name="my-data-bucket",
         partition_size=500,
         max_items_per_batch=10,
@@ -62,7 +67,7 @@ def test_worker_has_data_bucket_read_and_list() -> None:
     )
 
 
-def _state_machine_asl() -> str:
+def _state_machine_asl(**options: Any) -> str:
     app = cdk.App()
     stack = cdk.Stack(
         app,
@@ -74,10 +79,12 @@ def _state_machine_asl() -> str:
         stack,
         "Backfill",
         icechunk_bucket=bucket,
+        icechunk_prefix=None,
         data_bucket_name="my-data-bucket",
         partition_size=500,
         max_items_per_batch=10,
         max_concurrency=50,
+        **options,
     )
     tmpl = app.synth().get_stack_by_name("TestStack").template
     for res in tmpl["Resources"].values():
@@ -109,3 +116,153 @@ def test_state_machine_shape() -> None:
     assert '"forks_out_prefix.$":"$.forkResult.forks_out_prefix"' in asl
     # run_prefix derives from the execution name
     assert "Execution.Name" in asl
+
+
+def test_distributed_outer_map_reads_partitions_object() -> None:
+    asl = _state_machine_asl(distributed_outer_map=True)
+    assert '"Key.$":"$.partitionResult.partitions_key"' in asl
+    assert '"inline_partitions":false' in asl
+    assert '$.partitionResult.partitions"' not in asl
+
+
+def test_partition_order_passed_to_partition_task() -> None:
+    assert '"order":"inventory"' in _state_machine_asl()
+    assert '"order":"coordinate"' in _state_machine_asl(partition_order="coordinate")
+
+
+def test_tree_reduce_combines_forks_before_the_final_reduce() -> None:
+    asl = _state_machine_asl(reduce_fan_in=25)
+    assert '"CombineMap"' in asl
+    assert '"Prefix.$":"$.forkResult.forks_out_key_prefix"' in asl
+    assert '"MaxItemsPerBatch":25' in asl
+    assert '"forks_out_prefix.$":"$.forkResult.combined_prefix"' in asl
+    assert '"CombineMap"' not in _state_machine_asl()
+
+
+def test_partition_concurrency_sets_outer_map_concurrency() -> None:
+    assert '"MaxConcurrency":1}' in _state_machine_asl()
+    assert '"MaxConcurrency":4}' in _state_machine_asl(partition_concurrency=4)
+
+
+def test_execution_input_and_plan_id_reach_resume_handlers() -> None:
+    asl = _state_machine_asl()
+    assert asl.count('"run_options.$":"$$.Execution.Input"') == 2
+    assert '"plan_id.$":"$.plan_id"' in asl
+    assert '"plan_id.$":"$.partitionResult.plan_id"' in asl
+
+
+def test_failure_budget_wires_quarantine_prefix() -> None:
+    asl = _state_machine_asl(failure_budget=0.01)
+    assert '"quarantine_prefix.$":"$.BatchInput.quarantine_prefix"' in asl
+    assert '"failure_budget":0.01' in asl
+    assert "quarantine_prefix" not in _state_machine_asl()
+
+
+def test_worker_lanes_and_memory_apply_to_worker_only() -> None:
+    app = cdk.App()
+    stack = cdk.Stack(
+        app,
+        "TestStack",
+        env=cdk.Environment(account="111111111111", region="us-east-1"),
+    )
+    BackfillPipeline(
+        stack,
+        "Backfill",
+        icechunk_bucket=s3.Bucket(stack, "IceBucket"),
+        icechunk_prefix=None,
+        data_bucket_name="my-data-bucket",
+        partition_size=500,
+        max_items_per_batch=10,
+        max_concurrency=50,
+        worker_lanes=4,
+        worker_memory_mb=7076,
+    )
+    functions = Template.from_stack(stack).find_resources("AWS::Lambda::Function")
+    by_command = {
+        f["Properties"]["ImageConfig"]["Command"][0]: f["Properties"]
+        for f in functions.values()
+    }
+    worker_fn = by_command["backfill_handlers.worker.handler"]
+    assert worker_fn["MemorySize"] == 7076
+    assert worker_fn["Environment"]["Variables"]["WORKER_LANES"] == "4"
+    assert by_command["backfill_handlers.reduce.handler"]["MemorySize"] == 2048
+
+
+def test_inline_fork_passed_through_batch_input() -> None:
+    asl = _state_machine_asl(inline_fork_max_bytes=131072)
+    assert '"fork_inline.$":"$.forkResult.fork_inline"' in asl
+    assert '"fork_inline.$":"$.BatchInput.fork_inline"' in asl
+    assert "fork_inline" not in _state_machine_asl()
+
+
+def test_target_batch_seconds_reads_precomputed_batches() -> None:
+    asl = _state_machine_asl(target_batch_seconds=300, cost_sample_files=8)
+    assert '"batching":{"target_seconds":300,"max_items":10,"sample":8}' in asl
+    assert '"Key.$":"$.batches_key"' in asl
+    assert '"file_keys.$":"$$.Map.Item.Value.file_keys"' in asl
+    assert '"fork_in_uri.$":"$.fork_in_uri"' in asl
+    assert "ItemBatcher" not in asl
+    assert "batches_key" not in _state_machine_asl()
+
+
+def test_worker_time_reserve_requeues_unprocessed_keys() -> None:
+    asl = _state_machine_asl(worker_time_reserve_seconds=60)
+    assert '"Variable":"$.workerResult.unprocessed_keys[0]","IsPresent":true' in asl
+    assert '"InputPath":"$.workerResult.unprocessed_keys"' in asl
+    assert '"ResultPath":"$.Items"' in asl
+    batched = _state_machine_asl(
+        worker_time_reserve_seconds=60, target_batch_seconds=300
+    )
+    assert '"ResultPath":"$.file_keys"' in batched
+    assert "unprocessed_keys" not in _state_machine_asl()
+
+
+def test_explicit_regions_passed_to_partition_task() -> None:
+    assert '"explicit_regions":false' in _state_machine_asl()
+    assert '"explicit_regions":true' in _state_machine_asl(explicit_regions=True)
+
+
+def test_batch_worker_backend_submits_an_array_job_per_partition() -> None:
+    app = cdk.App()
+    stack = cdk.Stack(
+        app,
+        "TestStack",
+        env=cdk.Environment(account="111111111111", region="us-east-1"),
+    )
+    queue = batch.JobQueue.from_job_queue_arn(
+        stack, "Queue", "arn:aws:batch:us-east-1:111111111111:job-queue/q"
+    )
+    BackfillPipeline(
+        stack,
+        "Backfill",
+        icechunk_bucket=s3.Bucket(stack, "IceBucket"),
+        icechunk_prefix=None,
+        data_bucket_name="my-data-bucket",
+        partition_size=500,
+        max_items_per_batch=10,
+        max_concurrency=50,
+        worker_backend="batch",
+        batch_job_queue=queue,
+    )
+    template = Template.from_stack(stack)
+    template.resource_count_is("AWS::Lambda::Function", 5)
+    template.resource_count_is("AWS::Batch::JobDefinition", 1)
+
+    asl = json.dumps(template.to_json(), separators=(",", ":"))
+    assert "batch:submitJob.sync" in asl
+    assert '\\"Size.$\\":\\"$.array_size\\"' in asl
+    assert '\\"array_batch_size\\":10' in asl
+    assert '\\"Name\\":\\"MANIFEST_URI\\",\\"Value.$\\":\\"$.manifest_uri\\"' in asl
+    assert "InnerMap" not in asl
+
+
+def test_run_report_passes_stats_prefix_and_adds_report_step() -> None:
+    asl = _state_machine_asl(run_report=True, reduce_fan_in=25)
+    assert '"stats":true' in asl
+    assert '"stats_prefix.$":"$.partitionResult.stats_prefix"' in asl
+    assert '"stats_prefix.$":"$.BatchInput.stats_prefix"' in asl
+    assert '"partition_id.$":"$.BatchInput.partition_id"' in asl
+    assert '"stats_prefix.$":"$.stats_prefix"' in asl
+    assert '"ReportTask"' in asl
+    assert "report.parquet" in asl
+    assert "stats_prefix" not in _state_machine_asl()
@@ -38,3 +38,13 @@ def test_forward_queue_disabled_explicit_with_backfill_off() -> None:
         FORWARD_QUEUE_ENABLED=False,
     )
     assert settings.FORWARD_QUEUE_ENABLED is False
+
+
+def test_forward_parse_concurrency_defaults_to_serial() -> None:
+    settings = StackSettings(STAGE="dev", ACCOUNT_ID="111111111111")
+    assert settings.FORWARD_PARSE_CONCURRENCY == 1
+
+
+def test_forward_commit_max_attempts_default() -> None:
+    settings = StackSettings(STAGE="dev", ACCOUNT_ID="111111111111")
+    assert settings.FORWARD_COMMIT_MAX_ATTEMPTS == 5
@@ -1,16 +1,19 @@
+from typing import Any
+
 import aws_cdk as cdk
 from aws_cdk.assertions import Template
 from settings import StackSettings
 from stack import VirtualizarrSqsStack
 
 
-def _template(*, backfill: bool, forward: bool | None = None) -> Template:
+def _template(*, backfill: bool, forward: bool | None = None, **extra: Any) -> Template:
     kwargs = dict(
         STAGE="dev",
         ACCOUNT_ID="111111111111",
         ICECHUNK_BUCKET_NAME="ice-test",
         DATA_BUCKET_NAME="data-test",
         BACKFILL_ENABLED=backfill,
+        **extra,
     )
     if forward is not None:
         kwargs["FORWARD_QUEUE_ENABLED"] = forward
@@ -65,3 +68,17 @@ def test_backfill_disabled_creates_initialize_lambda() -> None:
 
 def test_backfill_enabled_skips_initialize_lambda() -> None:
     assert "initializeicechunk" not in _resource_ids(_template(backfill=True))
+
+
+def test_deferred_commit_mode_adds_single_committer() -> None:
+    t = _template(backfill=False, FORWARD_COMMIT_MODE="deferred")
+    t.has_resource_properties(
+        "AWS::Lambda::Function", {"ReservedConcurrentExecutions": 1}
+    )
+    t.has_resource_properties(
+        "AWS::Events::Rule", {"ScheduleExpression": "rate(1 minute)"}
+    )
+
+
+def test_direct_commit_mode_has_no_committer() -> None:
+    assert "commitforward" not in _resource_ids(_template(backfill=False))
@@ -1,4 +1,5 @@
 import pathlib
+from collections.abc import Iterator
 
 import icechunk
 import numpy as np
@@ -69,6 +70,155 @@ def test_full_backfill_round_trip(backfill_repo: icechunk.Repository) -> None:
     assert (np.asarray(arr_main[:]) == expected).all()
 
 
+def test_merge_and_commit_merges_a_stream_in_groups(
+    backfill_repo: icechunk.Repository,
+) -> None:
+    processor = Processor()
+    processor.initialize_backfill_store(backfill_repo)
+
+    shared = backfill.create_fork(backfill_repo)
+    children = (_worker(shared, [str(k)]) for k in range(6))
+    backfill.merge_and_commit(
+        backfill_repo, children, message="grouped merge", group_size=4
+    )
+
+    arr = zarr.open_group(backfill_repo.readonly_session("backfill").store, mode="r")[
+        "foo"
+    ]
+    assert (np.asarray(arr[:, 0, 0]) == np.arange(6)).all()
+
+
+def test_combined_forks_commit_like_children(
+    backfill_repo: icechunk.Repository,
+) -> None:
+    processor = Processor()
+    processor.initialize_backfill_store(backfill_repo)
+
+    shared = backfill.create_fork(backfill_repo)
+    children = [_worker(shared, [str(k)]) for k in range(6)]
+    combined = [
+        backfill.merge_forks(children[:4], group_size=2),
+        backfill.merge_forks(children[4:]),
+    ]
+    backfill.merge_and_commit(backfill_repo, combined, message="tree reduce")
+
+    arr = zarr.open_group(backfill_repo.readonly_session("backfill").store, mode="r")[
+        "foo"
+    ]
+    assert (np.asarray(arr[:, 0, 0]) == np.arange(6)).all()
+
+
+def test_overlapping_forks_fail_before_commit(
+    backfill_repo: icechunk.Repository,
+) -> None:
+    processor = Processor()
+    processor.initialize_backfill_store(backfill_repo)
+    tip = backfill_repo.lookup_branch("backfill")
+
+    shared = backfill.create_fork(backfill_repo)
+    children = [
+        _worker(shared, ["0", "1"]),
+        _worker(shared, ["2"]),
+        _worker(shared, ["1"]),
+    ]
+    with pytest.raises(
+        ValueError, match=r"fork 2 writes 1 chunks of /foo.*\[1, 0, 0\]"
+    ):
+        backfill.merge_and_commit(backfill_repo, children, message="overlap")
+    assert backfill_repo.lookup_branch("backfill") == tip
+    with pytest.raises(ValueError, match="already written"):
+        backfill.merge_forks(children, group_size=1)
+
+    # Last-writer-wins, as before, when the check is off.
+    backfill.merge_and_commit(
+        backfill_repo, children, message="unchecked", check_overlap=False
+    )
+    assert backfill_repo.lookup_branch("backfill") != tip
+
+
+def test_concurrent_partitions_rebase_onto_each_other(
+    backfill_repo: icechunk.Repository,
+) -> None:
+    processor = Processor()
+    processor.initialize_backfill_store(backfill_repo)
+
+    # Both partitions fork from the same base, as with partition concurrency.
+    shared = backfill.create_fork(backfill_repo)
+    first = [_worker(shared, ["0", "1", "2"])]
+    second = [_worker(shared, ["3", "4", "5"])]
+
+    def second_while_first_commits() -> Iterator[bytes]:
+        # The other reducer commits after this one opened its session.
+        backfill.merge_and_commit(backfill_repo, first, message="partition 0")
+        yield from second
+
+    backfill.merge_and_commit(
+        backfill_repo, second_while_first_commits(), message="partition 1"
+    )
+
+    arr = zarr.open_group(backfill_repo.readonly_session("backfill").store, mode="r")[
+        "foo"
+    ]
+    assert (np.asarray(arr[:, 0, 0]) == np.arange(6)).all()
+    messages = [s.message for s in backfill_repo.ancestry(branch="backfill")]
+    assert messages[:2] == ["partition 1", "partition 0"]
+
+
+def test_resume_finds_committed_partitions_of_the_same_plan(
+    backfill_repo: icechunk.Repository,
+) -> None:
+    plan = backfill.plan_id("s3://b/inv.json", 3, "inventory")
+    assert backfill.resumable_base(backfill_repo, plan) is None
+    # A branch left at the main tip by a failed init is dropped for re-init.
+    backfill_repo.create_branch("backfill", backfill_repo.lookup_branch("main"))
+    assert backfill.resumable_base(backfill_repo, plan) is None
+    assert "backfill" not in backfill_repo.list_branches()
+
+    Processor().initialize_backfill_store(backfill_repo)
+    base = backfill.record_plan(backfill_repo, plan)
+    shared = backfill.create_fork(backfill_repo)
+    backfill.merge_and_commit(
+        backfill_repo,
+        [_worker(shared, ["0", "1", "2"])],
+        message="partition 0",
+        metadata=backfill.partition_metadata(plan, "0"),
+    )
+
+    assert backfill_repo.lookup_snapshot(base).metadata == {
+        backfill.PLAN_METADATA_KEY: plan
+    }
+    assert backfill.resumable_base(backfill_repo, plan) == (
+        backfill_repo.lookup_branch("backfill")
+    )
+    assert backfill.committed_partitions(backfill_repo, plan) == {"0"}
+    other = backfill.plan_id("s3://b/inv.json", 4, "inventory")
+    assert backfill.committed_partitions(backfill_repo, other) == set()
+    regions = backfill.plan_id("s3://b/inv.json", 3, "inventory", explicit_regions=True)
+    assert regions != plan
+    with pytest.raises(ValueError, match="initialized for backfill plan"):
+        backfill.resumable_base(backfill_repo, regions)
+    # A branch initialized for another plan is never resumed.
+    with pytest.raises(ValueError, match="initialized for backfill plan"):
+        backfill.resumable_base(backfill_repo, other)
+
+
+def test_resume_rejects_partitions_on_a_base_without_a_plan(
+    backfill_repo: icechunk.Repository,
+) -> None:
+    plan = backfill.plan_id("s3://b/inv.json", 3, "inventory")
+    Processor().initialize_backfill_store(backfill_repo)
+    shared = backfill.create_fork(backfill_repo)
+    backfill.merge_and_commit(
+        backfill_repo,
+        [_worker(shared, ["0", "1", "2"])],
+        message="partition 0",
+        metadata=backfill.partition_metadata(plan, "0"),
+    )
+
+    with pytest.raises(ValueError, match="records no backfill plan"):
+        backfill.resumable_base(backfill_repo, plan)
+
+
 def test_open_backfill_repo_local_filesystem(
     tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
 ) -> None:
@@ -82,3 +232,51 @@ def test_open_backfill_repo_local_filesystem(
     assert "main" in repo.list_branches()
     # main must have a resolvable tip so initialize_backfill_store can branch off it
     assert repo.lookup_branch("main")
+
+
+def test_write_batch_region_writes_contiguous_batch_once(
+    backfill_repo: icechunk.Repository,
+) -> None:
+    processor = Processor()
+    processor.initialize_backfill_store(backfill_repo)
+    import pickle
+
+    child = pickle.loads(backfill.create_fork(backfill_repo)).fork()
+    vdss = [processor.parse_backfill_file(k) for k in ["2", "0", "1", "5"]]
+    # 0..2 are contiguous but 5 is not, so the batched write falls back.
+    backfill.write_batch(processor, vdss, child)
+    backfill.merge_and_commit(
+        backfill_repo, [pickle.dumps(child)], message="batched write"
+    )
+
+    arr = zarr.open_group(backfill_repo.readonly_session("backfill").store, mode="r")[
+        "foo"
+    ]
+    assert (np.asarray(arr[:, 0, 0]) == [0, 1, 2, 0, 0, 5]).all()
+
+
+def test_resolve_regions_finds_indices_and_rejects_misaligned_files() -> None:
+    values = np.array([10, 20, 30, 40])
+    assert backfill.resolve_regions(values, [30, 10, 40]) == [2, 0, 3]
+    assert backfill.resolve_regions(values, []) == []
+    with pytest.raises(ValueError, match="2 files match no coordinate"):
+        backfill.resolve_regions(values, [20, 25, 50])
+
+
+def test_write_batch_to_explicit_regions(backfill_repo: icechunk.Repository) -> None:
+    import pickle
+
+    processor = Processor()
+    processor.initialize_backfill_store(backfill_repo)
+    child = pickle.loads(backfill.create_fork(backfill_repo)).fork()
+    vdss = [processor.parse_backfill_file(k) for k in ["4", "3", "0"]]
+    backfill.write_batch(processor, vdss, child, regions=[4, 3, 0])
+    # The coordinate array is left alone; only the data chunks are written.
+    assert sorted(child.status().updated_chunks) == ["/foo"]
+    backfill.merge_and_commit(
+        backfill_repo, [pickle.dumps(child)], message="explicit regions"
+    )
+
+    group = zarr.open_group(backfill_repo.readonly_session("backfill").store, mode="r")
+    assert (np.asarray(group["foo"][:, 0, 0]) == [0, 0, 0, 3, 4, 0]).all()
+    assert (np.asarray(group["time"][:]) == np.arange(6)).all()
@@ -0,0 +1,61 @@
+import pathlib
+
+import pytest
+from virtualizarr_processor import cache
+from virtualizarr_processor.processor import Processor
+
+
+class CountingProcessor:
+    opened = 0
+
+    def open_backfill_repo(self) -> str:
+        CountingProcessor.opened += 1
+        return f"repo-{CountingProcessor.opened}"
+
+
+@pytest.fixture(autouse=True)
+def reset_counter(monkeypatch: pytest.MonkeyPatch) -> None:
+    CountingProcessor.opened = 0
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", "/tmp/a")
+
+
+def test_repository_is_reused_until_invalidated() -> None:
+    repo_cache = cache.RepositoryCache(ttl_seconds=60)
+    first = repo_cache.repository(CountingProcessor, "open_backfill_repo")
+    second = repo_cache.repository(CountingProcessor, "open_backfill_repo")
+    assert first == second
+    assert CountingProcessor.opened == 1
+
+    repo_cache.invalidate()
+    assert repo_cache.repository(CountingProcessor, "open_backfill_repo")[1] == (
+        "repo-2"
+    )
+
+
+def test_config_change_reopens_repository(monkeypatch: pytest.MonkeyPatch) -> None:
+    repo_cache = cache.RepositoryCache(ttl_seconds=60)
+    repo_cache.repository(CountingProcessor, "open_backfill_repo")
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", "/tmp/b")
+    _, repo = repo_cache.repository(CountingProcessor, "open_backfill_repo")
+    assert repo == "repo-2"
+
+
+def test_zero_ttl_disables_caching() -> None:
+    repo_cache = cache.RepositoryCache(ttl_seconds=0)
+    repo_cache.repository(CountingProcessor, "open_backfill_repo")
+    repo_cache.repository(CountingProcessor, "open_backfill_repo")
+    assert CountingProcessor.opened == 2
+
+
+def test_cached_backfill_repo_sees_new_branches(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    repo_cache = cache.RepositoryCache(ttl_seconds=60)
+    processor, repo = repo_cache.repository(Processor, "open_backfill_repo")
+    processor.initialize_backfill_store(Processor().open_backfill_repo())
+
+    _, cached = repo_cache.repository(Processor, "open_backfill_repo")
+    assert cached is repo
+    assert "backfill" in cached.list_branches()
@@ -0,0 +1,73 @@
+import pathlib
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import obstore
+import pytest
+import xarray as xr
+from virtualizarr_processor import cache, forward
+from virtualizarr_processor.processor import Processor, synthetic_vds
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lambda"))
+
+from commit_forward.handler import handler
+
+
+@pytest.fixture(autouse=True)
+def staging_env(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    cache.invalidate()
+
+
+def _times() -> list[str]:
+    _, repo = cache.get_repository(Processor, "initialize_repo")
+    ds = xr.open_zarr(repo.readonly_session("main").store, consolidated=False)
+    return [str(t)[:10] for t in ds["time"].values]
+
+
+def test_commits_all_staged_batches_at_once() -> None:
+    store = forward.staging_store()
+    assert store is not None
+    for i, dates in enumerate([["2024-01-02", "2024-01-03"], ["2024-01-04"]]):
+        forward.stage_batch(
+            store,
+            [
+                forward.StagedRecord(f"msg-{i}-{d}", synthetic_vds(d), d, "etag")
+                for d in dates
+            ],
+        )
+
+    result = handler({}, MagicMock())
+
+    assert result["staged_batches"] == 2
+    assert result["appended"] == 3
+    assert result["snapshot_id"] is not None
+    assert forward.list_staged(store) == []
+    assert _times() == ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"]
+
+
+def test_nothing_staged_is_a_no_op() -> None:
+    result = handler({}, MagicMock())
+    assert result["staged_batches"] == 0
+    assert result["snapshot_id"] is None
+
+
+def test_unreadable_staged_batch_is_set_aside() -> None:
+    store = forward.staging_store()
+    assert store is not None
+    obstore.put(store, f"{forward.STAGED_PREFIX}0000000000000-corrupt.pkl", b"\x80")
+    forward.stage_batch(
+        store,
+        [forward.StagedRecord("msg-1", synthetic_vds("2024-01-02"), "k", "etag")],
+    )
+
+    result = handler({}, MagicMock())
+
+    assert result["unreadable_batches"] == 1
+    assert result["appended"] == 1
+    assert forward.list_staged(store) == []
+    failed = [m["path"] for c in obstore.list(store, forward.FAILED_PREFIX) for m in c]
+    assert failed == [f"{forward.FAILED_PREFIX}0000000000000-corrupt.pkl"]
+    assert _times() == ["2024-01-01", "2024-01-02"]
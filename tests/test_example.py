@@ -38,3 +38,10 @@ def test_garbage_collect() -> None:
     expiry_time = datetime.now(timezone.utc) - timedelta(days=2)
     gcs = processor.garbage_collect(expiry_time=expiry_time)
     assert isinstance(gcs, icechunk.GCSummary)
+
+
+def test_parse_then_append_virtual_dataset(icechunk_session: Session) -> None:
+    processor = Processor()
+    vds = processor.parse_file(file_key="2024-01-02")
+    processor.append_virtual_dataset(vds=vds, session=icechunk_session)
+    assert icechunk_session.has_uncommitted_changes
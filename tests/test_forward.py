@@ -0,0 +1,134 @@
+from unittest.mock import MagicMock
+
+import icechunk
+import pytest
+import xarray as xr
+import zarr
+from obstore.store import MemoryStore
+from virtualizarr_processor import forward
+from virtualizarr_processor.processor import Processor, synthetic_vds
+
+
+def _no_sleep(_: float) -> None:
+    pass
+
+
+def test_commit_with_rebase_rebases_past_unrelated_commit() -> None:
+    processor = Processor()
+    repo = processor.initialize_repo()
+    ours = repo.writable_session("main")
+    processor.process_file(file_key="2024-01-02", session=ours)
+
+    theirs = repo.writable_session("main")
+    zarr.open_group(theirs.store, mode="a").create_group("other")
+    theirs.commit("unrelated")
+
+    def reapply() -> icechunk.Session:
+        raise AssertionError("a clean rebase must not re-apply the batch")
+
+    forward.commit_with_rebase(
+        ours, processor.commit_processed_files, reapply=reapply, sleep=_no_sleep
+    )
+    ds = xr.open_zarr(repo.readonly_session("main").store, consolidated=False)
+    assert ds.sizes["time"] == 2
+    assert "other" in zarr.open_group(repo.readonly_session("main").store, mode="r")
+
+
+def test_commit_with_rebase_reapplies_conflicting_append() -> None:
+    processor = Processor()
+    repo = processor.initialize_repo()
+    ours = repo.writable_session("main")
+    vds = processor.parse_file("2024-01-03")
+    processor.append_virtual_dataset(vds, ours)
+
+    theirs = repo.writable_session("main")
+    processor.process_file(file_key="2024-01-02", session=theirs)
+    theirs.commit("racing append")
+
+    def reapply() -> icechunk.Session:
+        fresh = processor.initialize_session(repo)
+        processor.append_virtual_dataset(vds, fresh)
+        return fresh
+
+    forward.commit_with_rebase(
+        ours, processor.commit_processed_files, reapply=reapply, sleep=_no_sleep
+    )
+    ds = xr.open_zarr(repo.readonly_session("main").store, consolidated=False)
+    assert ds.sizes["time"] == 3
+
+
+def test_commit_with_rebase_reraises_without_reapply() -> None:
+    processor = Processor()
+    repo = processor.initialize_repo()
+    ours = repo.writable_session("main")
+    processor.process_file(file_key="2024-01-03", session=ours)
+    theirs = repo.writable_session("main")
+    processor.process_file(file_key="2024-01-02", session=theirs)
+    theirs.commit("racing append")
+
+    with pytest.raises(icechunk.RebaseFailedError):
+        forward.commit_with_rebase(
+            ours, processor.commit_processed_files, sleep=_no_sleep
+        )
+
+
+def test_commit_with_rebase_gives_up_after_max_attempts() -> None:
+    calls = []
+
+    def commit(session: icechunk.Session) -> str:
+        calls.append(session)
+        raise icechunk.ConflictError("a", "b")
+
+    with pytest.raises(icechunk.ConflictError):
+        forward.commit_with_rebase(
+            object(),  # type: ignore[arg-type]
+            commit,
+            reapply=lambda: object(),  # type: ignore[arg-type,return-value]
+            max_attempts=1,
+            sleep=_no_sleep,
+        )
+    assert len(calls) == 1
+
+
+def test_append_batch_writes_concatenated_batch() -> None:
+    processor = Processor()
+    repo = processor.initialize_repo()
+    session = repo.writable_session("main")
+    vdss = [processor.parse_file(d) for d in ["2024-01-02", "2024-01-03"]]
+
+    assert forward.append_batch(processor, vdss, session) == [None, None]
+    session.commit("batched append")
+    ds = xr.open_zarr(repo.readonly_session("main").store, consolidated=False)
+    assert ds.sizes["time"] == 3
+
+
+def test_append_batch_falls_back_to_per_file_appends() -> None:
+    processor = MagicMock()
+    processor.append_virtual_datasets.side_effect = ValueError("not concatenable")
+    processor.append_virtual_dataset.side_effect = [None, ValueError("bad file")]
+    session = MagicMock()
+
+    errors = forward.append_batch(processor, ["a", "b"], session)
+
+    session.discard_changes.assert_called_once()
+    assert errors[0] is None
+    assert isinstance(errors[1], ValueError)
+
+
+def test_staged_batches_round_trip_in_order() -> None:
+    store = MemoryStore()
+    first = forward.stage_batch(
+        store, [forward.StagedRecord("msg-0", synthetic_vds("2024-01-02"), "a", "1")]
+    )
+    second = forward.stage_batch(
+        store, [forward.StagedRecord("msg-1", synthetic_vds("2024-01-03"))]
+    )
+
+    assert forward.list_staged(store) == sorted([first, second])
+    assert forward.list_staged(store, limit=1) == sorted([first, second])[:1]
+    (record,) = forward.load_staged(store, first)
+    assert (record.message_id, record.key, record.etag) == ("msg-0", "a", "1")
+    assert str(record.vds["time"].values[0]).startswith("2024-01-02")
+
+    forward.delete_staged(store, [first, second])
+    assert forward.list_staged(store) == []
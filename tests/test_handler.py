@@ -3,24 +3,33 @@ import sys
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
+import icechunk
 import pytest
 from aws_lambda_powertools.utilities.batch.exceptions import BatchProcessingError
+from obstore.store import MemoryStore
+from virtualizarr_processor import forward, instrumentation
+from virtualizarr_processor.ledger import IngestionLedger
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lambda"))
 
 from process_messages.handler import handler
 
 
-def make_sqs_event(keys: list[str], bucket: str = "test-bucket") -> dict:
+def make_sqs_event(
+    keys: list[str], bucket: str = "test-bucket", etag: str | None = None
+) -> dict:
     """Build a minimal SQS event with S3 notification bodies."""
     records = []
     for i, key in enumerate(keys):
+        s3_object = {"key": key}
+        if etag is not None:
+            s3_object["eTag"] = etag
         body = {
             "Records": [
                 {
                     "s3": {
                         "bucket": {"name": bucket},
-                        "object": {"key": key},
+                        "object": s3_object,
                     }
                 }
             ]
@@ -124,3 +133,234 @@ def test_handler_fails_all_on_commit_error(MockProcessor: MagicMock) -> None:
     failed_ids = [item["itemIdentifier"] for item in response["batchItemFailures"]]
     assert "msg-000" in failed_ids
     assert "msg-001" in failed_ids
+
+
+@patch("process_messages.handler.Processor")
+def test_handler_parses_concurrently_and_appends_in_order(
+    MockProcessor: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PARSE_CONCURRENCY", "4")
+    mock_processor = MockProcessor.return_value
+    mock_session = MagicMock()
+    mock_processor.initialize_repo.return_value = MagicMock()
+    mock_processor.initialize_session.return_value = mock_session
+    mock_processor.parse_file.side_effect = lambda key: f"vds-{key}"
+    mock_processor.commit_processed_files.return_value = "snapshot-123"
+
+    keys = ["2024-01-02", "2024-01-03", "2024-01-04"]
+    response = handler(make_sqs_event(keys), MagicMock())
+
+    assert response["batchItemFailures"] == []
+    mock_processor.process_file.assert_not_called()
+    assert sorted(c.args[0] for c in mock_processor.parse_file.call_args_list) == keys
+    appended = [
+        c.kwargs["vds"] for c in mock_processor.append_virtual_dataset.call_args_list
+    ]
+    assert appended == [f"vds-{key}" for key in keys]
+    mock_processor.commit_processed_files.assert_called_once_with(session=mock_session)
+
+
+@patch("process_messages.handler.Processor")
+def test_handler_concurrent_parse_failure_is_per_record(
+    MockProcessor: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PARSE_CONCURRENCY", "4")
+    mock_processor = MockProcessor.return_value
+    mock_processor.initialize_repo.return_value = MagicMock()
+    mock_processor.initialize_session.return_value = MagicMock()
+
+    def parse(key: str) -> str:
+        if key == "bad-key":
+            raise Exception("Parsing failed")
+        return f"vds-{key}"
+
+    mock_processor.parse_file.side_effect = parse
+    mock_processor.commit_processed_files.return_value = "snapshot-123"
+
+    response = handler(make_sqs_event(["2024-01-02", "bad-key"]), MagicMock())
+
+    failed_ids = [item["itemIdentifier"] for item in response["batchItemFailures"]]
+    assert failed_ids == ["msg-001"]
+    assert mock_processor.append_virtual_dataset.call_count == 1
+
+
+@patch("process_messages.handler.Processor")
+def test_handler_reapplies_batch_after_lost_commit_race(
+    MockProcessor: MagicMock,
+) -> None:
+    """A conflicting commit is re-applied on a fresh session, not redelivered."""
+    mock_processor = MockProcessor.return_value
+    first_session, fresh_session = MagicMock(), MagicMock()
+    first_session.rebase.side_effect = icechunk.RebaseFailedError("snap", [])
+    mock_processor.initialize_repo.return_value = MagicMock()
+    mock_processor.initialize_session.side_effect = [first_session, fresh_session]
+    mock_processor.process_file.return_value = True
+    mock_processor.commit_processed_files.side_effect = [
+        icechunk.ConflictError("expected", "actual"),
+        "snapshot-123",
+    ]
+
+    response = handler(make_sqs_event(["2024-01-02", "2024-01-03"]), MagicMock())
+
+    assert response["batchItemFailures"] == []
+    reapplied = [
+        c.kwargs["file_key"]
+        for c in mock_processor.process_file.call_args_list
+        if c.kwargs["session"] is fresh_session
+    ]
+    assert reapplied == ["2024-01-02", "2024-01-03"]
+    mock_processor.commit_processed_files.assert_called_with(session=fresh_session)
+
+
+@patch("process_messages.handler.Processor")
+def test_handler_batch_append_reports_fallback_write_failure(
+    MockProcessor: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A file that breaks the batched append (and its own append) fails alone."""
+    monkeypatch.setenv("BATCH_APPEND", "true")
+    mock_processor = MockProcessor.return_value
+    mock_processor.initialize_repo.return_value = MagicMock()
+    mock_processor.initialize_session.return_value = MagicMock()
+    mock_processor.parse_file.side_effect = lambda key: f"vds-{key}"
+    mock_processor.append_virtual_datasets.side_effect = ValueError("mismatch")
+    mock_processor.append_virtual_dataset.side_effect = [None, ValueError("bad")]
+    mock_processor.commit_processed_files.return_value = "snapshot-123"
+
+    response = handler(make_sqs_event(["2024-01-02", "odd-key"]), MagicMock())
+
+    mock_processor.append_virtual_datasets.assert_called_once()
+    failed_ids = [item["itemIdentifier"] for item in response["batchItemFailures"]]
+    assert failed_ids == ["msg-001"]
+
+
+@patch("process_messages.handler.Processor")
+def test_handler_skips_files_in_ingestion_ledger(
+    MockProcessor: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Redelivered and repeated files are skipped; new ones are recorded."""
+    ingestion_ledger = IngestionLedger(MemoryStore())
+    ingestion_ledger.record("snapshot-000", {"2024-01-02": "etag-1"})
+    monkeypatch.setattr(
+        "process_messages.handler.ledger.get_ledger", lambda: ingestion_ledger
+    )
+    mock_processor = MockProcessor.return_value
+    mock_processor.initialize_repo.return_value = MagicMock()
+    mock_processor.initialize_session.return_value = MagicMock()
+    mock_processor.commit_processed_files.return_value = "snapshot-123"
+
+    event = make_sqs_event(["2024-01-02", "2024-01-03", "2024-01-03"], etag="etag-1")
+    response = handler(event, MagicMock())
+
+    assert response["batchItemFailures"] == []
+    processed = [
+        c.kwargs["file_key"] for c in mock_processor.process_file.call_args_list
+    ]
+    assert processed == ["2024-01-03"]
+    assert ingestion_ledger.contains("2024-01-03", "etag-1")
+
+
+@patch("process_messages.handler.Processor")
+def test_handler_does_not_record_failed_files(
+    MockProcessor: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    ingestion_ledger = IngestionLedger(MemoryStore())
+    monkeypatch.setattr(
+        "process_messages.handler.ledger.get_ledger", lambda: ingestion_ledger
+    )
+    monkeypatch.setenv("PARSE_CONCURRENCY", "2")
+    mock_processor = MockProcessor.return_value
+    mock_processor.initialize_repo.return_value = MagicMock()
+    mock_processor.initialize_session.return_value = MagicMock()
+
+    def parse(key: str) -> str:
+        if key == "bad-key":
+            raise Exception("Parsing failed")
+        return f"vds-{key}"
+
+    mock_processor.parse_file.side_effect = parse
+    mock_processor.commit_processed_files.return_value = "snapshot-123"
+
+    handler(make_sqs_event(["2024-01-02", "bad-key"], etag="etag-1"), MagicMock())
+
+    assert ingestion_ledger.contains("2024-01-02", "etag-1")
+    assert not ingestion_ledger.contains("bad-key", "etag-1")
+
+
+@patch("process_messages.handler.Processor")
+def test_handler_deferred_mode_stages_instead_of_committing(
+    MockProcessor: MagicMock, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setenv("COMMIT_MODE", "deferred")
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    mock_processor = MockProcessor.return_value
+    mock_processor.initialize_repo.return_value = MagicMock()
+    mock_processor.initialize_session.return_value = MagicMock()
+    mock_processor.parse_file.side_effect = lambda key: key
+
+    response = handler(make_sqs_event(["2024-01-02", "2024-01-03"]), MagicMock())
+
+    assert response["batchItemFailures"] == []
+    mock_processor.append_virtual_dataset.assert_not_called()
+    mock_processor.commit_processed_files.assert_not_called()
+    # The consumer stays off the repository; only the committer opens it.
+    mock_processor.initialize_repo.assert_not_called()
+    mock_processor.initialize_session.assert_not_called()
+    store = forward.staging_store()
+    assert store is not None
+    (path,) = forward.list_staged(store)
+    staged = forward.load_staged(store, path)
+    assert [r.vds for r in staged] == ["2024-01-02", "2024-01-03"]
+
+
+@patch("process_messages.handler.Processor")
+def test_handler_emits_stage_metrics(
+    MockProcessor: MagicMock,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    instrumentation.set_enabled(True)
+    mock_processor = MockProcessor.return_value
+    mock_processor.initialize_repo.return_value = MagicMock()
+    mock_processor.initialize_session.return_value = MagicMock()
+    mock_processor.commit_processed_files.return_value = "snapshot-123"
+
+    try:
+        handler(make_sqs_event(["2024-01-02", "2024-01-03"]), MagicMock())
+    finally:
+        instrumentation.set_enabled(False)
+
+    names = [
+        m["Name"]
+        for line in capsys.readouterr().out.splitlines()
+        if '"_aws"' in line
+        for r in [json.loads(line)]
+        for m in r["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    ]
+    assert names.count("forward.process_file") == 2
+    assert "forward.commit" in names
+    assert "forward.records" in names
+
+
+@patch("process_messages.handler.Processor")
+def test_handler_fails_and_does_not_record_unappended_files(
+    MockProcessor: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """process_file returning False fails the record and keeps it out of the
+    ledger, so a redelivery retries it."""
+    ingestion_ledger = IngestionLedger(MemoryStore())
+    monkeypatch.setattr(
+        "process_messages.handler.ledger.get_ledger", lambda: ingestion_ledger
+    )
+    mock_processor = MockProcessor.return_value
+    mock_processor.initialize_repo.return_value = MagicMock()
+    mock_processor.initialize_session.return_value = MagicMock()
+    mock_processor.process_file.side_effect = [True, False]
+    mock_processor.commit_processed_files.return_value = "snapshot-123"
+
+    response = handler(
+        make_sqs_event(["2024-01-02", "bad-key"], etag="etag-1"), MagicMock()
+    )
+
+    assert response["batchItemFailures"] == [{"itemIdentifier": "msg-001"}]
+    assert ingestion_ledger.contains("2024-01-02", "etag-1")
+    assert not ingestion_ledger.contains("bad-key", "etag-1")
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+from virtualizarr_processor import instrumentation
+
+
+@pytest.fixture
+def metrics_on() -> object:
+    instrumentation.set_enabled(True)
+    yield
+    instrumentation.set_enabled(False)
+
+
+def _records(out: str) -> list[dict]:
+    return [json.loads(line) for line in out.splitlines() if '"_aws"' in line]
+
+
+def test_disabled_span_is_shared_no_op(capsys: pytest.CaptureFixture[str]) -> None:
+    assert not instrumentation.enabled()
+    assert instrumentation.span("a") is instrumentation.span("b", key="k")
+    with instrumentation.span("a"):
+        pass
+    instrumentation.count("c")
+    assert _records(capsys.readouterr().out) == []
+
+
+def test_span_emits_emf_timing(
+    metrics_on: None, capsys: pytest.CaptureFixture[str]
+) -> None:
+    with instrumentation.span("forward.parse", key="a.nc"):
+        pass
+    (record,) = _records(capsys.readouterr().out)
+    (directive,) = record["_aws"]["CloudWatchMetrics"]
+    assert directive["Metrics"] == [{"Name": "forward.parse", "Unit": "Milliseconds"}]
+    assert directive["Dimensions"] == [["service"]]
+    assert record["forward.parse"] >= 0
+    assert record["key"] == "a.nc"
+
+
+def test_span_records_error_and_reraises(
+    metrics_on: None, capsys: pytest.CaptureFixture[str]
+) -> None:
+    with pytest.raises(ValueError):
+        with instrumentation.span("forward.append"):
+            raise ValueError("bad")
+    (record,) = _records(capsys.readouterr().out)
+    assert record["error"] == "ValueError"
@@ -0,0 +1,93 @@
+import time
+
+import obstore
+import pytest
+from obstore.store import MemoryStore
+from virtualizarr_processor import ledger
+from virtualizarr_processor.ledger import BloomFilter, IngestionLedger
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    bloom = BloomFilter(capacity=1000)
+    items = [f"key-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{i}" in bloom for i in range(1000))
+    assert false_positives < 20
+
+
+def test_record_is_visible_to_other_containers() -> None:
+    store = MemoryStore()
+    writer = IngestionLedger(store)
+    reader = IngestionLedger(store)
+    reader.refresh()
+
+    writer.record("snap-1", {"a.nc": "etag-a"})
+    assert writer.contains("a.nc", "etag-a")
+    assert not reader.contains("a.nc", "etag-a")
+
+    assert reader.refresh() == 1
+    assert reader.contains("a.nc", "etag-a")
+    # A new version of the same key has not been ingested.
+    assert not reader.contains("a.nc", "etag-b")
+    # Already loaded objects are not read again.
+    assert reader.refresh() == 0
+
+
+def test_compact_folds_old_commits_into_checkpoint(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    store = MemoryStore()
+    writer = IngestionLedger(store)
+    writer.record("snap-1", {"a.nc": "etag-a"})
+    writer.record("snap-2", {"b.nc": "etag-b"})
+
+    monkeypatch.setattr(ledger, "LOOKBACK_MS", -60_000)
+    assert writer.compact() == 2
+    assert [m["path"] for c in obstore.list(store) for m in c] == [ledger.CHECKPOINT]
+
+    cold = IngestionLedger(store)
+    cold.refresh()
+    assert cold.contains("a.nc", "etag-a")
+    assert cold.contains("b.nc", "etag-b")
+    assert len(cold) == 2
+
+
+def test_get_ledger_disabled_by_default(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(ledger, "_ledger", None)
+    monkeypatch.setenv("ICECHUNK_BUCKET", "bucket")
+    monkeypatch.delenv("INGESTION_LEDGER", raising=False)
+    assert ledger.get_ledger() is None
+
+
+def test_commit_names_sort_by_time() -> None:
+    store = MemoryStore()
+    writer = IngestionLedger(store)
+    writer.record("snap-b", {"a.nc": "1"})
+    time.sleep(0.002)
+    writer.record("snap-a", {"b.nc": "1"})
+    paths = [m["path"] for c in obstore.list(store, ledger.COMMITS_PREFIX) for m in c]
+    assert sorted(paths)[-1].endswith("snap-a.json")
+
+
+def test_warm_ledger_sees_entries_compacted_while_idle(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    store = MemoryStore()
+    warm = IngestionLedger(store)
+    warm.refresh()
+    writer = IngestionLedger(store)
+    writer.record("snap-1", {"a.nc": "etag-a"})
+    writer.compact()  # nothing old enough yet: no checkpoint
+    warm.refresh()
+
+    # Idle past the lookback window while GC folds and deletes commit objects.
+    writer.record("snap-2", {"b.nc": "etag-b"})
+    monkeypatch.setattr(ledger, "LOOKBACK_MS", -60_000)
+    assert writer.compact() == 2
+
+    warm.refresh()
+    assert warm.contains("a.nc", "etag-a")
+    assert warm.contains("b.nc", "etag-b")
+    assert len(warm) == 2
@@ -0,0 +1,75 @@
+import os
+import pathlib
+from unittest.mock import MagicMock
+
+import pytest
+from obstore.store import MemoryStore
+from virtualizarr_processor import manifest_cache
+from virtualizarr_processor.manifest_cache import ManifestCache
+from virtualizarr_processor.processor import Processor, synthetic_vds
+
+
+def test_parse_once_per_key_and_etag() -> None:
+    cache = ManifestCache(MemoryStore())
+    parse = MagicMock(side_effect=lambda: synthetic_vds("2024-01-02"))
+
+    first = cache.get_or_parse("a.nc", "etag-1", parse)
+    second = cache.get_or_parse("a.nc", "etag-1", parse)
+    assert parse.call_count == 1
+    assert second.identical(first)
+
+    # A replaced file (new ETag) is parsed again.
+    cache.get_or_parse("a.nc", "etag-2", parse)
+    assert parse.call_count == 2
+
+
+def test_no_etag_is_never_cached() -> None:
+    cache = ManifestCache(MemoryStore())
+    parse = MagicMock(side_effect=lambda: synthetic_vds("2024-01-02"))
+    cache.get_or_parse("a.nc", None, parse)
+    cache.get_or_parse("a.nc", None, parse)
+    assert parse.call_count == 2
+
+
+def test_local_tier_fronts_shared_store(tmp_path: pathlib.Path) -> None:
+    store = MemoryStore()
+    ManifestCache(store).put("a.nc", "etag-1", synthetic_vds("2024-01-02"))
+
+    local = ManifestCache(store, local_dir=str(tmp_path))
+    assert local.get("a.nc", "etag-1") is not None
+    assert len(list(tmp_path.glob("*/*.pkl.z"))) == 1
+
+    # Served from the local tier alone once it has been read.
+    assert ManifestCache(None, local_dir=str(tmp_path)).get("a.nc", "etag-1")
+
+
+def test_local_tier_evicts_least_recently_used(tmp_path: pathlib.Path) -> None:
+    size = len(manifest_cache.dumps(synthetic_vds("2024-01-02")))
+    cache = ManifestCache(None, local_dir=str(tmp_path), local_max_bytes=2 * size)
+    for mtime, key in [(100, "a"), (200, "b")]:
+        cache.put(key, "etag", synthetic_vds("2024-01-02"))
+        path = tmp_path / manifest_cache._entry_name(key, "etag")
+        os.utime(path, (mtime, mtime))
+
+    # Reading "a" makes "b" the least recently used entry.
+    assert cache.get("a", "etag") is not None
+    cache.put("c", "etag", synthetic_vds("2024-01-02"))
+
+    assert cache.get("b", "etag") is None
+    assert cache.get("a", "etag") is not None
+    assert cache.get("c", "etag") is not None
+
+
+def test_processor_uses_cache_when_enabled(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.delenv("ICECHUNK_BUCKET", raising=False)
+    monkeypatch.setenv("ICECHUNK_LOCAL_PATH", str(tmp_path / "repo"))
+    monkeypatch.setenv("MANIFEST_CACHE", "true")
+    processor = Processor()
+    assert processor.manifest_cache is not None
+
+    processor.parse_backfill_file("3")
+    cached = processor.manifest_cache.get("backfill/3", processor.source_etag("3"))
+    assert cached is not None
+    assert list(cached["time"].values) == [3]